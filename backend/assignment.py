@@ -0,0 +1,85 @@
+from typing import Tuple
+
+import numpy as np
+
+# Rectangular min-cost assignment. scipy's linear_sum_assignment is used when
+# scipy is installed (an optional accelerator, not a requirement); otherwise
+# a numpy shortest augmenting path solver computes the same optimum.
+try:
+    from scipy.optimize import linear_sum_assignment as _scipy_solve
+except ImportError:
+    _scipy_solve = None
+
+SOLVER = "scipy" if _scipy_solve is not None else "numpy"
+
+
+def _shortest_augmenting_path(cost: np.ndarray) -> np.ndarray:
+    """Optimal column for every row of a cost matrix with rows <= columns.
+
+    Jonker-Volgenant style: each row is added with one Dijkstra-like search
+    for the cheapest augmenting path on reduced costs, vectorized over the
+    columns, so the work is O(rows^2 * columns) numpy element operations.
+    """
+    rows, cols = cost.shape
+    u = np.zeros(rows)
+    v = np.zeros(cols)
+    col_owner = np.full(cols, -1, dtype=np.int64)
+    row_col = np.full(rows, -1, dtype=np.int64)
+
+    for start in range(rows):
+        shortest = np.full(cols, np.inf)
+        path = np.full(cols, -1, dtype=np.int64)
+        done_cols = np.zeros(cols, dtype=bool)
+        visited_rows = [start]
+        row = start
+        min_value = 0.0
+        while True:
+            reduced = min_value + cost[row] - u[row] - v
+            better = (reduced < shortest) & ~done_cols
+            shortest[better] = reduced[better]
+            path[better] = row
+            open_shortest = np.where(done_cols, np.inf, shortest)
+            col = int(np.argmin(open_shortest))
+            min_value = open_shortest[col]
+            if not np.isfinite(min_value):
+                raise ValueError("cost matrix is infeasible")
+            done_cols[col] = True
+            if col_owner[col] == -1:
+                break
+            row = int(col_owner[col])
+            visited_rows.append(row)
+
+        # Update the duals of everything the search settled
+        u[start] += min_value
+        for other in visited_rows[1:]:
+            u[other] += min_value - shortest[row_col[other]]
+        v[done_cols] -= min_value - shortest[done_cols]
+
+        # Flip the augmenting path back to the new row
+        while True:
+            row = int(path[col])
+            col_owner[col] = row
+            row_col[row], col = col, row_col[row]
+            if row == start:
+                break
+    return row_col
+
+
+def linear_sum_assignment(cost) -> Tuple[np.ndarray, np.ndarray]:
+    """Rows and columns of a minimum total cost matching, like scipy's.
+
+    Every row is matched if there are at least as many columns, and every
+    column otherwise. Rows are returned in ascending order.
+    """
+    cost = np.asarray(cost, dtype=np.float64)
+    if cost.size == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty
+    if _scipy_solve is not None:
+        return _scipy_solve(cost)
+    if cost.shape[0] <= cost.shape[1]:
+        cols = _shortest_augmenting_path(cost)
+        return np.arange(cost.shape[0]), cols
+    rows = _shortest_augmenting_path(cost.T)
+    order = np.argsort(rows)
+    return rows[order], order
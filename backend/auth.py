@@ -1,13 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import NamedTuple, Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import hashlib
 import os
+import time
 
-from database import get_db
+from cache import CacheInvalidationFeed, TTLCache
+from database import get_async_db
+from metrics import Histogram
 from models import User
 from schemas import TokenData
 
@@ -22,6 +29,35 @@ pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
 # JWT token security
 security = HTTPBearer()
 
+class Principal(NamedTuple):
+    """The authorization-relevant fields of a user, cheap to cache."""
+    id: int
+    role: str
+    is_active: bool
+    is_verified: bool
+
+    @classmethod
+    def from_user(cls, user) -> "Principal":
+        return cls(
+            id=user.id,
+            role=getattr(user.role, "value", user.role),
+            is_active=bool(user.is_active),
+            is_verified=bool(user.is_verified),
+        )
+
+# Authenticated principals keyed by user id. Entries are dropped in every
+# worker by invalidate_principal() when an account changes; the TTL bounds
+# staleness should an invalidation be lost on the way.
+principal_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_PRINCIPAL_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("AUTH_PRINCIPAL_CACHE_TTL", "60")),
+)
+principal_cache_feed = CacheInvalidationFeed(principal_cache)
+
+def invalidate_principal(user_id: int):
+    """Forget the cached principal of a user whose account was changed, in every worker."""
+    principal_cache_feed.invalidate(user_id)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
     return pwd_context.verify(plain_password, hashed_password)
@@ -30,6 +66,68 @@ def get_password_hash(password: str) -> str:
     """Hash a password using Argon2."""
     return pwd_context.hash(password)
 
+class PasswordHashPool:
+    """Runs Argon2 hashing off the event loop in a small dedicated thread pool.
+    
+    Argon2 releases the GIL while hashing, so worker threads run in parallel
+    with request handling. At most `max_pending` operations may be queued or
+    running; beyond that callers get a 503 instead of piling up behind a
+    login burst.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.in_flight = 0
+        self.rejected = 0
+        self.latency = Histogram()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+
+    def _timed(self, func, *args):
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.latency.observe(time.perf_counter() - start)
+
+    async def run(self, func, *args):
+        # in_flight is only touched from the event loop thread
+        if self.in_flight >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._timed, func, *args)
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "in_flight": self.in_flight,
+            "rejected": self.rejected,
+            "latency": self.latency.snapshot(),
+        }
+
+password_hash_pool = PasswordHashPool(
+    workers=int(os.getenv("PASSWORD_HASH_WORKERS", "2")),
+    max_pending=int(os.getenv("PASSWORD_HASH_MAX_PENDING", "32")),
+)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verify a password in the hashing pool without blocking the event loop."""
+    return await password_hash_pool.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Hash a password in the hashing pool without blocking the event loop."""
+    return await password_hash_pool.run(get_password_hash, password)
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     """Create a JWT access token."""
     to_encode = data.copy()
@@ -42,8 +140,20 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
+# Decoded tokens keyed by SHA-256 of the raw token. A hit means this exact
+# token already passed signature verification; entries never outlive `exp`.
+token_cache = TTLCache(
+    maxsize=int(os.getenv("AUTH_TOKEN_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("AUTH_TOKEN_CACHE_TTL", "900")),
+)
+
 def verify_token(token: str, credentials_exception):
-    """Verify and decode a JWT token."""
+    """Verify and decode a JWT token, reusing earlier verifications of the same token."""
+    token_key = hashlib.sha256(token.encode()).digest()
+    token_data = token_cache.get(token_key)
+    if token_data is not None:
+        return token_data
+    
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id: int = payload.get("sub")
@@ -52,36 +162,84 @@ def verify_token(token: str, credentials_exception):
         token_data = TokenData(user_id=user_id)
     except JWTError:
         raise credentials_exception
+    
+    expires_in = payload["exp"] - time.time() if "exp" in payload else None
+    token_cache.set(token_key, token_data, expires_in)
     return token_data
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get the current authenticated user."""
-    credentials_exception = HTTPException(
+def auth_cache_stats() -> dict:
+    """Hit/miss counters of the authentication caches."""
+    return {
+        "token_cache": token_cache.stats(),
+        "principal_cache": principal_cache_feed.stats(),
+    }
+
+def _credentials_exception():
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
+
+def _ensure_active(principal: Principal):
+    if not principal.is_active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Account is deactivated"
+        )
+
+async def get_current_principal(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
+    """Get the current authenticated principal, from cache when possible.
+    
+    Use this instead of get_current_user when only the id and role are needed;
+    cache hits authorize the request without touching the database.
+    """
+    return await principal_for_token(credentials.credentials, db)
+
+async def principal_for_token(token: str, db: AsyncSession) -> Principal:
+    """Resolve a raw bearer token to an active principal, e.g. for WebSockets."""
+    credentials_exception = _credentials_exception()
+    token_data = verify_token(token, credentials_exception)
+    
+    principal = principal_cache.get(token_data.user_id)
+    if principal is None:
+        result = await db.execute(
+            select(User.id, User.role, User.is_active, User.is_verified).where(User.id == token_data.user_id)
+        )
+        row = result.first()
+        if row is None:
+            raise credentials_exception
+        principal = Principal.from_user(row)
+        principal_cache.set(principal.id, principal)
+    
+    _ensure_active(principal)
+    return principal
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncSession = Depends(get_async_db)
+) -> User:
+    """Get the current authenticated user as a full ORM object."""
+    credentials_exception = _credentials_exception()
     
     token = credentials.credentials
     token_data = verify_token(token, credentials_exception)
     
-    user = db.query(User).filter(User.id == token_data.user_id).first()
+    user = await db.scalar(select(User).where(User.id == token_data.user_id))
     if user is None:
         raise credentials_exception
     
-    if not user.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Account is deactivated"
-        )
+    principal = Principal.from_user(user)
+    principal_cache.set(principal.id, principal)
+    _ensure_active(principal)
     
     return user
 
-def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
-    """Get the current active user."""
+async def get_current_active_user(current_user: Principal = Depends(get_current_principal)) -> Principal:
+    """Get the current active principal."""
     if not current_user.is_active:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -91,7 +249,7 @@ def get_current_active_user(current_user: User = Depends(get_current_user)) -> U
 
 def require_role(required_roles: list):
     """Decorator to require specific user roles."""
-    def role_checker(current_user: User = Depends(get_current_active_user)) -> User:
+    async def role_checker(current_user: Principal = Depends(get_current_active_user)) -> Principal:
         if current_user.role not in required_roles:
             raise HTTPException(
                 status_code=status.HTTP_403_FORBIDDEN,
@@ -104,7 +262,7 @@ def require_role(required_roles: list):
 # Role-based dependencies
 require_driver = require_role(["driver"])
 
-def require_verified_service_provider_dep(current_user: User = Depends(get_current_active_user)) -> User:
+async def require_verified_service_provider_dep(current_user: Principal = Depends(get_current_active_user)) -> Principal:
     if current_user.role != "service_provider":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
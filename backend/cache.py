@@ -0,0 +1,101 @@
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+import threading
+import time
+
+from ws_protocol import dumps, loads
+
+
+class TTLCache:
+    """Thread-safe, size-bounded LRU cache whose entries expire after a TTL.
+
+    Entries can carry their own expiry (e.g. a JWT `exp`), which is capped by
+    the cache-wide TTL. Hit/miss/eviction counters are kept for monitoring.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, expires_in: Optional[float] = None):
+        """Store a value for at most `ttl` seconds, or `expires_in` if that is sooner."""
+        ttl = self.ttl if expires_in is None else min(self.ttl, expires_in)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class CacheInvalidationFeed:
+    """Drops a cache entry in every worker, not only the one that changed it.
+
+    Invalidations go through `publish` when it is set (main.py sends them
+    through the WebSocket broker, which also delivers them here), otherwise
+    straight to the local cache. Keys must be JSON values.
+    """
+
+    def __init__(self, cache: TTLCache):
+        self.cache = cache
+        # Called with an invalidation to get it to the cache of every worker
+        self.publish: Optional[Callable[[str], None]] = None
+        self.applied = 0
+
+    def invalidate(self, key: Hashable):
+        message = dumps({"key": key})
+        if self.publish is None:
+            self.apply(message)
+        else:
+            self.publish(message)
+
+    def apply(self, message: str):
+        self.applied += 1
+        self.cache.pop(loads(message)["key"])
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "invalidations_applied": self.applied}
@@ -0,0 +1,106 @@
+from typing import List, NamedTuple, Optional
+
+from sqlalchemy import delete, or_, select, update
+
+from geo import provider_index_feed
+from job_feed import job_feed, job_summary
+from models import (
+    AssistanceRequest,
+    AssistanceRequestStatus,
+    Breakdown,
+    ServiceProvider,
+    User,
+    Vehicle,
+    VehicleTelemetry,
+    VehicleTelemetryRollup,
+)
+from telemetry import device_cache_feed
+
+# Hard deletes apply the ON DELETE rules of database_schema.sql themselves:
+# tables made by create_all do not carry them, and SQLite only enforces
+# foreign keys with SQLITE_FOREIGN_KEYS on. Rows owned by what is deleted
+# go with it (CASCADE); references from elsewhere are cleared (SET NULL).
+
+_requests = AssistanceRequest.__table__
+_breakdowns = Breakdown.__table__
+_vehicles = Vehicle.__table__
+
+
+class Deleted(NamedTuple):
+    """What a delete changed outside the database, to be announced after commit."""
+    removed_jobs: List[dict]  # pending requests deleted
+    reopened_jobs: List[dict]  # pending requests whose offer was cleared
+    provider_id: Optional[int] = None  # ServiceProvider.id of a deleted user
+    device_ids: List[str] = []  # IoT devices of deleted vehicles
+
+    def announce(self):
+        for job in self.removed_jobs:
+            job_feed.closed(job)
+        for job in self.reopened_jobs:
+            job_feed.opened(job)
+        if self.provider_id is not None:
+            provider_index_feed.removed(self.provider_id)
+        for device_id in self.device_ids:
+            device_cache_feed.invalidate(device_id)
+
+
+async def _delete_requests(db, condition) -> List[dict]:
+    """Delete assistance requests; returns the summaries of the pending ones."""
+    pending = (await db.execute(select(_requests).where(
+        condition,
+        _requests.c.status == AssistanceRequestStatus.PENDING
+    ))).all()
+    await db.execute(delete(_requests).where(condition))
+    return [job_summary(row) for row in pending]
+
+
+async def delete_breakdown_rows(db, breakdown_id: int) -> Deleted:
+    """Delete a breakdown and its assistance requests."""
+    removed = await _delete_requests(db, _requests.c.breakdown_id == breakdown_id)
+    await db.execute(delete(_breakdowns).where(_breakdowns.c.id == breakdown_id))
+    return Deleted(removed, [])
+
+
+async def delete_user_rows(db, user_id: int) -> Deleted:
+    """Delete a user with their vehicles, breakdowns, requests and provider profile.
+
+    Requests and breakdowns the user was assigned to as a provider are kept
+    and unassigned; pending ones offered to the user are open to all again.
+    """
+    offered = (await db.execute(select(_requests).where(
+        _requests.c.assigned_provider_id == user_id,
+        _requests.c.status == AssistanceRequestStatus.PENDING
+    ))).all()
+    await db.execute(update(_requests).where(_requests.c.assigned_provider_id == user_id).values(
+        assigned_provider_id=None,
+        offer_expires_at=None
+    ))
+    await db.execute(update(_breakdowns).where(_breakdowns.c.service_provider_id == user_id).values(
+        service_provider_id=None
+    ))
+
+    vehicle_ids = select(_vehicles.c.id).where(_vehicles.c.owner_id == user_id).scalar_subquery()
+    device_ids = (await db.scalars(select(_vehicles.c.iot_device_id).where(
+        _vehicles.c.owner_id == user_id,
+        _vehicles.c.iot_device_id != None
+    ))).all()
+    owned_breakdowns = or_(_breakdowns.c.driver_id == user_id, _breakdowns.c.vehicle_id.in_(vehicle_ids))
+    breakdown_ids = select(_breakdowns.c.id).where(owned_breakdowns).scalar_subquery()
+    removed = await _delete_requests(db, or_(
+        _requests.c.requester_id == user_id,
+        _requests.c.breakdown_id.in_(breakdown_ids)
+    ))
+    await db.execute(delete(_breakdowns).where(owned_breakdowns))
+    await db.execute(delete(VehicleTelemetry.__table__).where(VehicleTelemetry.vehicle_id.in_(vehicle_ids)))
+    await db.execute(delete(VehicleTelemetryRollup.__table__).where(VehicleTelemetryRollup.vehicle_id.in_(vehicle_ids)))
+    await db.execute(delete(_vehicles).where(_vehicles.c.owner_id == user_id))
+
+    provider_id = await db.scalar(select(ServiceProvider.id).where(ServiceProvider.user_id == user_id))
+    await db.execute(delete(ServiceProvider.__table__).where(ServiceProvider.user_id == user_id))
+    await db.execute(delete(User.__table__).where(User.id == user_id))
+    return Deleted(
+        removed,
+        [job_summary(row) for row in offered if row.requester_id != user_id],
+        provider_id,
+        list(device_ids),
+    )
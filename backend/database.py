@@ -1,8 +1,12 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 from dotenv import load_dotenv
 
+from db_pool import TimedAsyncAdaptedQueuePool, TimedQueuePool, pool_stats
+
 load_dotenv()
 
 # Database configuration
@@ -10,6 +14,63 @@ load_dotenv()
 # In production, can switch to DATABASE_URL env var for PostgreSQL/MySQL
 USE_SQLITE = os.getenv("USE_SQLITE", "true").lower() == "true"
 
+# SQLite tuning, applied to every new connection by apply_sqlite_pragmas.
+# WAL lets readers run alongside the single writer; synchronous=NORMAL is
+# durable in WAL mode except for the last commits before a power loss.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_FOREIGN_KEYS = os.getenv("SQLITE_FOREIGN_KEYS", "true").lower() == "true"
+SQLITE_READ_POOL_SIZE = int(os.getenv("SQLITE_READ_POOL_SIZE", "8"))
+
+# Server database pool. Each uvicorn worker holds its own pool, so the
+# database sees up to workers * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+# With DB_POOL_PRE_PING=false stale connections are avoided by recycling them
+# before the server's idle timeout instead of pinging on every checkout.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+
+SERVER_POOL_OPTIONS = {
+    "pool_size": DB_POOL_SIZE,
+    "max_overflow": DB_MAX_OVERFLOW,
+    "pool_timeout": DB_POOL_TIMEOUT,
+    "pool_recycle": DB_POOL_RECYCLE,
+    "pool_pre_ping": DB_POOL_PRE_PING,
+}
+
+
+def apply_sqlite_pragmas(dbapi_connection, read_only=False):
+    """Configure a new SQLite connection; read-only connections refuse writes."""
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+    if not read_only:
+        # journal_mode is stored in the database file, so only writers set it
+        cursor.execute(f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA cache_size = {-SQLITE_CACHE_SIZE_KB}")
+    cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+    cursor.execute(f"PRAGMA foreign_keys = {'ON' if SQLITE_FOREIGN_KEYS else 'OFF'}")
+    if read_only:
+        cursor.execute("PRAGMA query_only = ON")
+    cursor.close()
+
+
+def tune_sqlite_engine(engine, read_only=False):
+    """Run apply_sqlite_pragmas on every connection the engine opens."""
+    sync_engine = getattr(engine, "sync_engine", engine)
+
+    @event.listens_for(sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection, read_only=read_only)
+
+    return engine
+
+
 if USE_SQLITE:
     # SQLite database file will be created in the backend folder
     SQLITE_DB_PATH = os.path.join(os.path.dirname(__file__), "vbams.db")
@@ -18,6 +79,7 @@ if USE_SQLITE:
     engine = create_engine(
         DATABASE_URL,
         connect_args={"check_same_thread": False},  # Needed for SQLite
+        poolclass=TimedQueuePool,
         echo=False  # Set to True for SQL query logging
     )
 else:
@@ -35,11 +97,69 @@ else:
         DATABASE_URL = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     
     # Standard DB Engine
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
+    engine = create_engine(DATABASE_URL, poolclass=TimedQueuePool, future=True, **SERVER_POOL_OPTIONS)
+
+IS_SQLITE = make_url(DATABASE_URL).get_backend_name() == "sqlite"
+if IS_SQLITE:
+    tune_sqlite_engine(engine)
 
 # Create session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
 
+# Async drivers used by the request handlers, keyed by backend name
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql",
+}
+
+
+def to_async_url(url: str) -> str:
+    """Swap the sync DBAPI driver in a database URL for its asyncio counterpart."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    driver = ASYNC_DRIVERS.get(backend)
+    if driver is None:
+        raise ValueError(f"No async driver configured for '{backend}' databases")
+    query = dict(parsed.query)
+    if driver == "asyncpg":
+        # asyncpg spells libpq's sslmode as ssl and rejects other libpq options
+        if "sslmode" in query:
+            query["ssl"] = query.pop("sslmode")
+        query.pop("channel_binding", None)
+    return parsed.set(drivername=f"{backend}+{driver}", query=query).render_as_string(hide_password=False)
+
+
+# Async engine for the API routers; scripts and create_all keep the sync engine.
+# ASYNC_DATABASE_URL overrides the driver chosen from DATABASE_URL.
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or to_async_url(DATABASE_URL)
+# aiosqlite defaults to NullPool, which would reopen (and re-tune) a
+# connection for every request, so SQLite gets a real pool too
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    poolclass=TimedAsyncAdaptedQueuePool,
+    echo=False,
+    **({} if IS_SQLITE else SERVER_POOL_OPTIONS)
+)
+
+# expire_on_commit=False so committed objects can still be read without
+# triggering implicit (blocking) lazy loads
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+if IS_SQLITE:
+    tune_sqlite_engine(async_engine)
+    # GET endpoints read through their own query_only pool so they never
+    # queue behind writers for a connection
+    async_read_engine = tune_sqlite_engine(create_async_engine(
+        ASYNC_DATABASE_URL,
+        poolclass=TimedAsyncAdaptedQueuePool,
+        pool_size=SQLITE_READ_POOL_SIZE,
+        echo=False
+    ), read_only=True)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+else:
+    AsyncReadSessionLocal = AsyncSessionLocal
+
 # Base class for models
 Base = declarative_base()
 
@@ -58,6 +178,42 @@ def get_db():
         db.close()
 
 
+async def get_async_db():
+    """Yield an async database session for dependency injection.
+    
+    Example usage in FastAPI routes:
+        async def my_route(db: AsyncSession = Depends(get_async_db)):
+            result = await db.scalars(select(User))
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+async def get_async_read_db():
+    """Yield an async session for endpoints that only read.
+    
+    On SQLite this comes from the read-only connection pool; on server
+    databases it is an ordinary session.
+    """
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+
+def database_pool_stats() -> dict:
+    """Pool counters for every engine this process uses."""
+    stats = {"async": pool_stats(async_engine), "sync": pool_stats(engine)}
+    if AsyncReadSessionLocal is not AsyncSessionLocal:
+        stats["async_read"] = pool_stats(async_read_engine)
+    return stats
+
+
+async def dispose_async_engines():
+    """Close pooled async connections (aiosqlite keeps a thread per connection)."""
+    await async_engine.dispose()
+    if AsyncReadSessionLocal is not AsyncSessionLocal:
+        await async_read_engine.dispose()
+
+
 def init_db():
     """Initialize the database by creating all tables."""
     from models import Base  # Import here to avoid circular imports
@@ -0,0 +1,583 @@
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, NamedTuple, Optional, Set
+import asyncio
+import os
+import time
+
+import numpy as np
+from sqlalchemy import func, or_, select, update
+
+from assignment import SOLVER, linear_sum_assignment
+from database import AsyncSessionLocal
+from geo import DEFAULT_SERVICE_RADIUS_KM, ensure_provider_index, haversine_km, haversine_matrix_km, provider_position
+from job_feed import job_feed, job_summary
+from metrics import Histogram
+from models import AssistanceRequest, AssistanceRequestStatus, ServiceProvider, services_to_mask
+from ws_protocol import dumps
+
+# New assistance requests are offered to one provider at a time. Candidates
+# are verified, online providers offering the service within
+# DISPATCH_SEARCH_RADIUS_KM (and within their own service_radius) that have
+# fewer than DISPATCH_MAX_LOAD accepted or in-progress jobs, ranked by
+#   distance_km + DISPATCH_RATING_KM * (5 - rating) + DISPATCH_LOAD_KM * load
+# An offer not accepted within DISPATCH_OFFER_TIMEOUT seconds, or declined,
+# moves to the next of the best DISPATCH_CANDIDATES; when they run out the
+# request is left unassigned for any provider to pick up.
+DISPATCH_ENABLED = os.getenv("DISPATCH_ENABLED", "true").lower() == "true"
+DISPATCH_OFFER_TIMEOUT = float(os.getenv("DISPATCH_OFFER_TIMEOUT", "20"))
+DISPATCH_SEARCH_RADIUS_KM = float(os.getenv("DISPATCH_SEARCH_RADIUS_KM", "100"))
+DISPATCH_CANDIDATES = int(os.getenv("DISPATCH_CANDIDATES", "5"))
+DISPATCH_MAX_LOAD = int(os.getenv("DISPATCH_MAX_LOAD", "3"))
+DISPATCH_RATING_KM = float(os.getenv("DISPATCH_RATING_KM", "2"))
+DISPATCH_LOAD_KM = float(os.getenv("DISPATCH_LOAD_KM", "5"))
+
+# Batch mode: with DISPATCH_BATCH_WINDOW > 0, requests are not offered as they
+# are created. Every DISPATCH_BATCH_WINDOW seconds up to DISPATCH_BATCH_SIZE
+# unoffered pending requests, oldest first, are matched to free providers
+# (one job each) by a single min-cost assignment over the same scores, so a
+# burst of requests is not served first-come by whoever is nearest to each.
+# Offers declined or timed out go back into the next batch, never to the
+# same provider. Requests where the driver chose a provider are still
+# offered immediately. The matcher runs from startup, so requests left
+# waiting by a restart are batched without a new one being created.
+DISPATCH_BATCH_WINDOW = float(os.getenv("DISPATCH_BATCH_WINDOW", "0"))
+DISPATCH_BATCH_SIZE = int(os.getenv("DISPATCH_BATCH_SIZE", "500"))
+
+# Offers store their deadline in AssistanceRequest.offer_expires_at. Every
+# DISPATCH_SWEEP_INTERVAL seconds (and at startup) offers more than
+# OFFER_SWEEP_GRACE seconds past it are released to all providers: their
+# timer went with a worker that stopped or crashed, or lives on another one
+# that has not moved them on.
+DISPATCH_SWEEP_INTERVAL = float(os.getenv("DISPATCH_SWEEP_INTERVAL", "30"))
+OFFER_SWEEP_GRACE = 5.0
+
+# Nearest providers hydrated per request before filtering and scoring
+CANDIDATE_POOL_SIZE = 50
+# Rating assumed for providers nobody has rated yet
+UNRATED_RATING = 3.0
+# Cost of a request/provider pair that must not be matched; large enough that
+# the solver prefers matching more requests over any saving in distance
+UNMATCHABLE_COST = 1e9
+
+ACTIVE_STATUSES = (AssistanceRequestStatus.ACCEPTED, AssistanceRequestStatus.IN_PROGRESS)
+
+_requests = AssistanceRequest.__table__
+
+
+class Candidate(NamedTuple):
+    provider_id: int  # ServiceProvider.id
+    user_id: int  # what AssistanceRequest.assigned_provider_id refers to
+    distance_km: float
+    rating: float
+    load: int
+    score: float
+
+
+def score(distance_km: float, rating: float, load: int,
+          rating_km: float = DISPATCH_RATING_KM, load_km: float = DISPATCH_LOAD_KM) -> float:
+    """Cost of sending a provider, in km-equivalents; lower is better."""
+    return distance_km + rating_km * (5.0 - rating) + load_km * load
+
+
+class Offer:
+    """A request currently offered to `user_id`, with the candidates left after it."""
+
+    __slots__ = ("request_id", "user_id", "remaining", "started", "timer", "message")
+
+    def __init__(self, request_id: int, remaining: List[Candidate], message: dict):
+        self.request_id = request_id
+        self.user_id: Optional[int] = None
+        self.remaining = remaining
+        self.started = time.perf_counter()
+        self.timer: Optional[asyncio.Task] = None
+        self.message = message
+
+
+class Dispatcher:
+    """Offers new assistance requests to the best-scoring provider, then the next.
+
+    The provider a request is offered to is stored in
+    AssistanceRequest.assigned_provider_id while the request stays `pending`;
+    accepting turns that into the assignment. Moving an offer on is a
+    conditional UPDATE on the previous holder, so an accept that got there
+    first always wins. Offer timers live in the process that made the
+    offer; the deadline is also stored on the row, so a sweep releases
+    offers whose timer was lost, and closing releases this worker's offers.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, enabled: bool = DISPATCH_ENABLED,
+                 offer_timeout: float = DISPATCH_OFFER_TIMEOUT, search_radius_km: float = DISPATCH_SEARCH_RADIUS_KM,
+                 max_candidates: int = DISPATCH_CANDIDATES, max_load: int = DISPATCH_MAX_LOAD,
+                 batch_window: float = DISPATCH_BATCH_WINDOW, batch_size: int = DISPATCH_BATCH_SIZE,
+                 sweep_interval: float = DISPATCH_SWEEP_INTERVAL):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.offer_timeout = offer_timeout
+        self.search_radius_km = search_radius_km
+        self.max_candidates = max_candidates
+        self.max_load = max_load
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self.sweep_interval = sweep_interval
+        # Called with (provider user id, message) to push offers to providers
+        self.notify: Optional[Callable[[int, str], None]] = None
+        self.dispatched = 0
+        self.unmatched = 0
+        self.offers_sent = 0
+        self.offers_declined = 0
+        self.offers_expired = 0
+        self.accepted = 0
+        self.exhausted = 0
+        self.rank_latency = Histogram()
+        self.accept_latency = Histogram(buckets_ms=(100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000))
+        self.batches = 0
+        self.batch_offers = 0
+        self.batch_errors = 0
+        self.batch_solve_latency = Histogram()
+        self.offers_swept = 0
+        self.offers_released = 0
+        self._offers: Dict[int, Offer] = {}
+        # Providers that declined or let an offer expire, per request (batch mode)
+        self._declined: Dict[int, Set[int]] = {}
+        self._batcher: Optional[asyncio.Task] = None
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def offer_deadline(self) -> Optional[datetime]:
+        """offer_expires_at for an offer made now; None when offers never time out."""
+        if self.offer_timeout <= 0:
+            return None
+        return datetime.utcnow() + timedelta(seconds=self.offer_timeout)
+
+    async def _providers(self, db, condition):
+        """Active, verified provider rows matching `condition` and their current loads by user id."""
+        rows = (await db.execute(select(
+            ServiceProvider.id,
+            ServiceProvider.user_id,
+            ServiceProvider.latitude,
+            ServiceProvider.longitude,
+            ServiceProvider.current_latitude,
+            ServiceProvider.current_longitude,
+            ServiceProvider.service_radius,
+            ServiceProvider.services_mask,
+            ServiceProvider.average_rating,
+            ServiceProvider.rating_count,
+            ServiceProvider.is_online,
+        ).where(
+            condition,
+            ServiceProvider.is_active == True,
+            ServiceProvider.is_verified == True
+        ))).all()
+        if not rows:
+            return rows, {}
+        loads = dict((await db.execute(
+            select(AssistanceRequest.assigned_provider_id, func.count())
+            .where(
+                AssistanceRequest.assigned_provider_id.in_([row.user_id for row in rows]),
+                AssistanceRequest.status.in_(ACTIVE_STATUSES)
+            )
+            .group_by(AssistanceRequest.assigned_provider_id)
+        )).all())
+        return rows, loads
+
+    async def rank(self, db, latitude: float, longitude: float, service_type,
+                   preferred_user_id: Optional[int] = None) -> List[Candidate]:
+        """The best providers for a job at a location, best first.
+
+        A provider chosen by the driver (`preferred_user_id`) is put first if
+        it is an active provider offering the service, wherever it is.
+        """
+        start = time.perf_counter()
+        required_mask = services_to_mask([service_type])
+        points = (await ensure_provider_index(db)).query_points(
+            latitude, longitude, self.search_radius_km, required_mask
+        )
+        nearest = dict(points.nearest(latitude, longitude, self.search_radius_km, CANDIDATE_POOL_SIZE))
+
+        wanted = ServiceProvider.id.in_(list(nearest))
+        if preferred_user_id is not None:
+            wanted = or_(wanted, ServiceProvider.user_id == preferred_user_id)
+        rows, loads = await self._providers(
+            db, wanted & (ServiceProvider.services_mask.op("&")(required_mask) == required_mask)
+        )
+
+        preferred = None
+        candidates = []
+        for row in rows:
+            distance_km = nearest.get(row.id)
+            if distance_km is None:
+                position = provider_position(row)
+                distance_km = float(haversine_km(latitude, longitude, *position))
+            rating = row.average_rating if row.rating_count else UNRATED_RATING
+            load = loads.get(row.user_id, 0)
+            candidate = Candidate(row.id, row.user_id, distance_km, rating, load, score(distance_km, rating, load))
+            if row.user_id == preferred_user_id:
+                preferred = candidate
+            elif row.is_online and load < self.max_load \
+                    and distance_km <= (row.service_radius or DEFAULT_SERVICE_RADIUS_KM):
+                candidates.append(candidate)
+
+        candidates.sort(key=lambda candidate: (candidate.score, candidate.provider_id))
+        candidates = candidates[:self.max_candidates]
+        if preferred is not None:
+            candidates.insert(0, preferred)
+        self.rank_latency.observe(time.perf_counter() - start)
+        return candidates
+
+    def start(self, request: AssistanceRequest, candidates: List[Candidate]):
+        """Track a committed request whose first offer went to candidates[0]."""
+        self.dispatched += 1
+        if not candidates:
+            self.unmatched += 1
+            return
+        offer = Offer(request.id, candidates[1:], job_summary(request))
+        self._offers[request.id] = offer
+        self._send(offer, candidates[0])
+
+    def schedule(self):
+        """Make sure the batch matcher is running (batch mode only)."""
+        if self.enabled and self.batch_window > 0 and (self._batcher is None or self._batcher.done()):
+            self._batcher = asyncio.create_task(self._batch_loop())
+
+    async def _batch_loop(self):
+        while True:
+            await asyncio.sleep(self.batch_window)
+            if not self.enabled:
+                continue
+            try:
+                await self.run_batch()
+            except Exception as e:
+                self.batch_errors += 1
+                print(f"Dispatch batch failed: {e}")
+
+    async def run_batch(self) -> int:
+        """Offer waiting requests to providers by one min-cost assignment.
+
+        Returns the number of offers made. Pairs are feasible under the same
+        rules as rank(); the solver maximizes the number of matched requests
+        first and then minimizes their total score.
+        """
+        async with self.session_factory() as db:
+            requests = (await db.execute(
+                select(
+                    _requests.c.id,
+                    _requests.c.service_type,
+                    _requests.c.priority,
+                    _requests.c.latitude,
+                    _requests.c.longitude,
+                    _requests.c.address,
+                )
+                .where(
+                    _requests.c.status == AssistanceRequestStatus.PENDING,
+                    _requests.c.assigned_provider_id == None
+                )
+                .order_by(_requests.c.created_at, _requests.c.id)
+                .limit(self.batch_size)
+            )).all()
+            if len(requests) < self.batch_size:
+                # Every waiting request was seen; forget the ones that are gone
+                waiting = {request.id for request in requests}
+                for request_id in [request_id for request_id in self._declined if request_id not in waiting]:
+                    del self._declined[request_id]
+            if not requests:
+                return 0
+
+            index = await ensure_provider_index(db)
+            nearby = set()
+            for request in requests:
+                nearby.update(index.query_points(request.latitude, request.longitude, self.search_radius_km).ids.tolist())
+            rows, loads = await self._providers(db, ServiceProvider.id.in_(list(nearby)))
+            # Providers already holding an offer wait for it to be settled
+            holding = {offer.user_id for offer in self._offers.values()}
+            rows = [
+                row for row in rows
+                if row.is_online and loads.get(row.user_id, 0) < self.max_load and row.user_id not in holding
+            ]
+            if not rows:
+                return 0
+
+            # Large batches take a noticeable fraction of a second to solve,
+            # so the solver runs off the event loop, on a copy of the
+            # declines the loop keeps changing
+            declined = {request.id: frozenset(self._declined.get(request.id, ())) for request in requests}
+            start = time.perf_counter()
+            pairs = await asyncio.get_running_loop().run_in_executor(
+                None, self.match, requests, rows, loads, declined
+            )
+            self.batch_solve_latency.observe(time.perf_counter() - start)
+            self.batches += 1
+
+            offered = []
+            for request, row, distance_km in pairs:
+                result = await db.execute(
+                    update(_requests)
+                    .where(
+                        _requests.c.id == request.id,
+                        _requests.c.status == AssistanceRequestStatus.PENDING,
+                        _requests.c.assigned_provider_id == None
+                    )
+                    .values(assigned_provider_id=row.user_id, offer_expires_at=self.offer_deadline())
+                )
+                if result.rowcount:
+                    offered.append((request, row, distance_km))
+            await db.commit()
+
+        for request, row, distance_km in offered:
+            offer = Offer(request.id, [], job_summary(request))
+            self._offers[request.id] = offer
+            job_feed.closed(offer.message)
+            load = loads.get(row.user_id, 0)
+            rating = row.average_rating if row.rating_count else UNRATED_RATING
+            self._send(offer, Candidate(row.id, row.user_id, distance_km, rating, load, score(distance_km, rating, load)))
+        self.batch_offers += len(offered)
+        return len(offered)
+
+    def match(self, requests, rows, loads, declined=None):
+        """Min-cost (request, provider row, distance_km) pairs for a batch.
+
+        `declined` maps request ids to the provider user ids it must not go to.
+        """
+        declined = self._declined if declined is None else declined
+        distances = haversine_matrix_km(
+            [request.latitude for request in requests],
+            [request.longitude for request in requests],
+            [provider_position(row)[0] for row in rows],
+            [provider_position(row)[1] for row in rows],
+        )
+        ratings = np.array([row.average_rating if row.rating_count else UNRATED_RATING for row in rows])
+        provider_loads = np.array([loads.get(row.user_id, 0) for row in rows])
+        cost = score(distances, ratings[None, :], provider_loads[None, :])
+
+        radius = np.array([min(row.service_radius or DEFAULT_SERVICE_RADIUS_KM, self.search_radius_km) for row in rows])
+        masks = np.array([row.services_mask or 0 for row in rows], dtype=np.int64)
+        bits = np.array([services_to_mask([request.service_type]) for request in requests], dtype=np.int64)
+        feasible = (distances <= radius[None, :]) & ((masks[None, :] & bits[:, None]) == bits[:, None]) \
+            & (bits[:, None] != 0)
+        column = {row.user_id: j for j, row in enumerate(rows)}
+        for i, request in enumerate(requests):
+            for user_id in declined.get(request.id, ()):
+                if user_id in column:
+                    feasible[i, column[user_id]] = False
+
+        request_idx, provider_idx = linear_sum_assignment(np.where(feasible, cost, UNMATCHABLE_COST))
+        return [
+            (requests[i], rows[j], float(distances[i, j]))
+            for i, j in zip(request_idx.tolist(), provider_idx.tolist())
+            if feasible[i, j]
+        ]
+
+    def _send(self, offer: Offer, candidate: Candidate):
+        offer.user_id = candidate.user_id
+        self.offers_sent += 1
+        if self.notify is not None:
+            self.notify(candidate.user_id, dumps({
+                "type": "job_offer",
+                **offer.message,
+                "distance_km": round(candidate.distance_km, 1),
+                "expires_in": self.offer_timeout,
+            }))
+        if self.offer_timeout > 0:
+            offer.timer = asyncio.create_task(self._expire(offer, candidate.user_id))
+
+    def _withdraw(self, offer: Offer, user_id: int):
+        offer.user_id = None
+        if offer.timer is not None and offer.timer is not asyncio.current_task():
+            offer.timer.cancel()
+        offer.timer = None
+        if self.notify is not None:
+            self.notify(user_id, dumps({"type": "job_offer_withdrawn", "request_id": offer.request_id}))
+
+    async def _expire(self, offer: Offer, user_id: int):
+        await asyncio.sleep(self.offer_timeout)
+        if offer.user_id != user_id or self._offers.get(offer.request_id) is not offer:
+            return
+        self.offers_expired += 1
+        self._withdraw(offer, user_id)
+        try:
+            await self._advance(offer.request_id, user_id)
+        except Exception as e:
+            print(f"Dispatch of request {offer.request_id} failed: {e}")
+
+    async def decline(self, request_id: int, user_id: int, db=None) -> bool:
+        """Pass an offer on from the provider holding it; False if it did not hold it.
+
+        Offers made by another worker, or before a restart, are released to
+        all providers instead.
+        """
+        offer = self._offers.get(request_id)
+        if offer is not None:
+            if offer.user_id != user_id:
+                return False
+            self._withdraw(offer, user_id)
+        declined = await self._advance(request_id, user_id, db)
+        if declined:
+            self.offers_declined += 1
+        return declined
+
+    async def _advance(self, request_id: int, previous_user_id: int, db=None) -> bool:
+        """Move an offer from `previous_user_id` to the next candidate, or release it."""
+        if db is None:
+            async with self.session_factory() as session:
+                return await self._advance(request_id, previous_user_id, session)
+        offer = self._offers.get(request_id)
+        remaining = offer.remaining if offer is not None else []
+        candidate = remaining.pop(0) if remaining else None
+        result = await db.execute(
+            update(_requests)
+            .where(
+                _requests.c.id == request_id,
+                _requests.c.status == AssistanceRequestStatus.PENDING,
+                _requests.c.assigned_provider_id == previous_user_id
+            )
+            .values(
+                assigned_provider_id=candidate.user_id if candidate else None,
+                offer_expires_at=self.offer_deadline() if candidate else None
+            )
+        )
+        await db.commit()
+        if result.rowcount == 0:
+            # Accepted, cancelled or already moved on elsewhere
+            self._offers.pop(request_id, None)
+            return False
+        if offer is not None:
+            job = offer.message
+        else:
+            # Offered by another worker or before a restart
+            job = job_summary((await db.execute(select(_requests).where(_requests.c.id == request_id))).first())
+        if self.batch_window > 0:
+            self._declined.setdefault(request_id, set()).add(previous_user_id)
+        if candidate is None:
+            self.exhausted += 1
+            self._offers.pop(request_id, None)
+            job_feed.opened(job)
+            self.schedule()
+        else:
+            job_feed.changed(job)
+            self._send(offer, candidate)
+        return True
+
+    def resolve(self, request_id: int):
+        """Forget a request once it has been accepted."""
+        self._declined.pop(request_id, None)
+        offer = self._offers.pop(request_id, None)
+        if offer is None:
+            return
+        if offer.timer is not None:
+            offer.timer.cancel()
+        self.accepted += 1
+        self.accept_latency.observe(time.perf_counter() - offer.started)
+
+    def start_sweeper(self):
+        """Start releasing lapsed offers, right away and then periodically."""
+        if self.enabled and self.sweep_interval > 0 and (self._sweeper is None or self._sweeper.done()):
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"Dispatch offer sweep failed: {e}")
+            await asyncio.sleep(self.sweep_interval)
+
+    async def sweep(self, now: Optional[datetime] = None) -> int:
+        """Release offers past their deadline to all providers; returns how many."""
+        cutoff = (now or datetime.utcnow()) - timedelta(seconds=OFFER_SWEEP_GRACE)
+        released = []
+        async with self.session_factory() as db:
+            rows = (await db.execute(select(_requests).where(
+                _requests.c.status == AssistanceRequestStatus.PENDING,
+                _requests.c.assigned_provider_id != None,
+                _requests.c.offer_expires_at < cutoff
+            ))).all()
+            for row in rows:
+                # Only if the same offer is still standing
+                result = await db.execute(
+                    update(_requests)
+                    .where(
+                        _requests.c.id == row.id,
+                        _requests.c.status == AssistanceRequestStatus.PENDING,
+                        _requests.c.assigned_provider_id == row.assigned_provider_id,
+                        _requests.c.offer_expires_at == row.offer_expires_at
+                    )
+                    .values(assigned_provider_id=None, offer_expires_at=None)
+                )
+                if result.rowcount:
+                    released.append(row)
+            await db.commit()
+
+        for row in released:
+            offer = self._offers.pop(row.id, None)
+            if offer is not None and offer.timer is not None:
+                offer.timer.cancel()
+            if self.batch_window > 0:
+                self._declined.setdefault(row.id, set()).add(row.assigned_provider_id)
+            if self.notify is not None:
+                self.notify(row.assigned_provider_id, dumps({"type": "job_offer_withdrawn", "request_id": row.id}))
+            job_feed.opened(job_summary(row))
+        self.offers_swept += len(released)
+        if released:
+            self.schedule()
+        return len(released)
+
+    async def close(self):
+        """Stop the background tasks and release the offers made by this worker.
+
+        Their timers stop with the process, so the requests go back to all
+        providers rather than waiting for the sweep of another worker.
+        """
+        for task in (self._batcher, self._sweeper):
+            if task is not None:
+                task.cancel()
+        self._batcher = self._sweeper = None
+        offers = [offer for offer in self._offers.values() if offer.user_id is not None]
+        for offer in self._offers.values():
+            if offer.timer is not None:
+                offer.timer.cancel()
+        self._offers.clear()
+        if not offers:
+            return
+        try:
+            async with self.session_factory() as db:
+                for offer in offers:
+                    result = await db.execute(
+                        update(_requests)
+                        .where(
+                            _requests.c.id == offer.request_id,
+                            _requests.c.status == AssistanceRequestStatus.PENDING,
+                            _requests.c.assigned_provider_id == offer.user_id
+                        )
+                        .values(assigned_provider_id=None, offer_expires_at=None)
+                    )
+                    if result.rowcount:
+                        self.offers_released += 1
+                        job_feed.opened(offer.message)
+                await db.commit()
+        except Exception as e:
+            print(f"Releasing dispatch offers failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "open_offers": len(self._offers),
+            "dispatched": self.dispatched,
+            "unmatched": self.unmatched,
+            "offers_sent": self.offers_sent,
+            "offers_declined": self.offers_declined,
+            "offers_expired": self.offers_expired,
+            "accepted": self.accepted,
+            "exhausted": self.exhausted,
+            "offers_swept": self.offers_swept,
+            "offers_released": self.offers_released,
+            "rank_latency": self.rank_latency.snapshot(),
+            "accept_latency": self.accept_latency.snapshot(),
+            "batch_window": self.batch_window,
+            "batches": self.batches,
+            "batch_offers": self.batch_offers,
+            "batch_errors": self.batch_errors,
+            "batch_solver": SOLVER,
+            "batch_solve_latency": self.batch_solve_latency.snapshot(),
+        }
+
+
+# Global dispatcher used by the assistance router
+dispatcher = Dispatcher()
@@ -0,0 +1,362 @@
+from itertools import chain
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+import math
+import os
+import threading
+import time
+
+import numpy as np
+
+from ws_protocol import dumps, loads
+
+# 1 degree of latitude is roughly 111 km everywhere on the globe
+KM_PER_DEGREE = 111.0
+EARTH_RADIUS_KM = 6371.0088
+
+# Size of one grid cell in degrees. 0.25 deg is ~28 km, so a default 50 km
+# radius query touches a handful of cells instead of the whole table.
+GRID_CELL_DEGREES = float(os.getenv("PROVIDER_GRID_CELL_DEGREES", "0.25"))
+
+# Service radius assumed for providers that have not set one
+DEFAULT_SERVICE_RADIUS_KM = 50
+
+# Every worker keeps its own provider index. Changes made through the API are
+# published to all of them (see ProviderIndexFeed); the index is also reloaded
+# from the database when it is older than PROVIDER_INDEX_REFRESH seconds, for
+# changes made outside the API or lost in transit (0 disables reloading).
+PROVIDER_INDEX_REFRESH = float(os.getenv("PROVIDER_INDEX_REFRESH", "300"))
+
+
+def _wrap_longitude(longitude: float) -> float:
+    return (longitude + 180.0) % 360.0 - 180.0
+
+
+def bounding_box(latitude: float, longitude: float, radius_km: float) -> Tuple[float, float, float, float]:
+    """Return (min_lat, max_lat, min_lon, max_lon) enclosing a radius around a point.
+
+    Longitudes are within [-180, 180]; a box crossing the antimeridian has
+    min_lon > max_lon (see longitude_ranges).
+    """
+    lat_delta = radius_km / KM_PER_DEGREE
+    # Longitude degrees shrink towards the poles; clamp to avoid dividing by ~0
+    cos_lat = max(math.cos(math.radians(latitude)), 0.01)
+    lon_delta = radius_km / (KM_PER_DEGREE * cos_lat)
+    min_lat = max(latitude - lat_delta, -90.0)
+    max_lat = min(latitude + lat_delta, 90.0)
+    if lon_delta >= 180.0:
+        return min_lat, max_lat, -180.0, 180.0
+    return min_lat, max_lat, _wrap_longitude(longitude - lon_delta), _wrap_longitude(longitude + lon_delta)
+
+
+def longitude_ranges(min_lon: float, max_lon: float) -> List[Tuple[float, float]]:
+    """The longitude span of a bounding_box as one range, or two across the antimeridian."""
+    if min_lon <= max_lon:
+        return [(min_lon, max_lon)]
+    return [(min_lon, 180.0), (-180.0, max_lon)]
+
+
+def longitude_between(column, min_lon: float, max_lon: float):
+    """SQL condition for a longitude column inside a bounding_box span."""
+    if min_lon <= max_lon:
+        return column.between(min_lon, max_lon)
+    from sqlalchemy import or_
+    return or_(column >= min_lon, column <= max_lon)
+
+
+def haversine_km(latitude: float, longitude: float, latitudes: np.ndarray, longitudes: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km from one point to every point in the arrays."""
+    lat1 = math.radians(latitude)
+    lat2 = np.radians(latitudes)
+    dlat = lat2 - lat1
+    dlon = np.radians(longitudes) - math.radians(longitude)
+    a = np.sin(dlat * 0.5) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon * 0.5) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def haversine_matrix_km(latitudes_a, longitudes_a, latitudes_b, longitudes_b) -> np.ndarray:
+    """Great-circle distances in km between every point of `a` (rows) and of `b` (columns)."""
+    lat1 = np.radians(np.asarray(latitudes_a, dtype=np.float64))[:, None]
+    lat2 = np.radians(np.asarray(latitudes_b, dtype=np.float64))[None, :]
+    dlon = np.radians(np.asarray(longitudes_b, dtype=np.float64))[None, :] \
+        - np.radians(np.asarray(longitudes_a, dtype=np.float64))[:, None]
+    a = np.sin((lat2 - lat1) * 0.5) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon * 0.5) ** 2
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class PointArrays:
+    """Ids and coordinates packed into contiguous arrays for vectorized distance math."""
+
+    __slots__ = ("ids", "latitudes", "longitudes")
+
+    def __init__(self, ids, latitudes, longitudes):
+        self.ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self.latitudes = np.ascontiguousarray(latitudes, dtype=np.float64)
+        self.longitudes = np.ascontiguousarray(longitudes, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, float, float]]) -> "PointArrays":
+        """Build from (id, latitude, longitude) tuples, e.g. a column-only query."""
+        data = np.fromiter(chain.from_iterable(rows), dtype=np.float64).reshape(-1, 3)
+        return cls(data[:, 0], data[:, 1], data[:, 2])
+
+    def distances(self, latitude: float, longitude: float) -> np.ndarray:
+        return haversine_km(latitude, longitude, self.latitudes, self.longitudes)
+
+    def within(self, latitude: float, longitude: float, radius_km: float) -> List[Tuple[int, float]]:
+        """Return (id, distance_km) pairs within the radius, nearest first."""
+        if not len(self.ids):
+            return []
+        distances = self.distances(latitude, longitude)
+        inside = np.flatnonzero(distances <= radius_km)
+        order = inside[np.argsort(distances[inside], kind="stable")]
+        return list(zip(self.ids[order].tolist(), distances[order].tolist()))
+
+    def nearest(
+        self,
+        latitude: float,
+        longitude: float,
+        radius_km: float,
+        k: int,
+        after: Optional[Tuple[float, int]] = None,
+    ) -> List[Tuple[int, float]]:
+        """Return the k nearest (id, distance_km) pairs within the radius.
+
+        Results are ordered by (distance, id). When `after` is given only points
+        ordered strictly after that key are considered, which lets callers page
+        outwards ring by ring. Selection uses a partial sort, so only the k
+        winners are fully sorted.
+        """
+        if not len(self.ids) or k <= 0:
+            return []
+        distances = self.distances(latitude, longitude)
+        mask = distances <= radius_km
+        if after is not None:
+            after_distance, after_id = after
+            mask &= (distances > after_distance) | ((distances == after_distance) & (self.ids > after_id))
+        inside = np.flatnonzero(mask)
+        if len(inside) > k:
+            # Keep everything up to the k-th smallest distance (ties included)
+            kth = np.partition(distances[inside], k - 1)[k - 1]
+            inside = inside[distances[inside] <= kth]
+        order = inside[np.lexsort((self.ids[inside], distances[inside]))][:k]
+        return list(zip(self.ids[order].tolist(), distances[order].tolist()))
+
+
+def provider_position(profile) -> Tuple[float, float]:
+    """Live position of a provider if reported, otherwise its registered location."""
+    if profile.current_latitude is not None and profile.current_longitude is not None:
+        return profile.current_latitude, profile.current_longitude
+    return profile.latitude or 0.0, profile.longitude or 0.0
+
+
+class SpatialGridIndex:
+    """In-process uniform lat/lon grid answering radius queries by cell lookup.
+
+    Only ids and coordinates are kept here; callers hydrate rows from the
+    database for the candidate ids. The index is per-process and is filled
+    lazily from the database on first use; ProviderIndexFeed keeps the
+    indexes of several workers in step.
+    """
+
+    def __init__(self, cell_degrees: float = GRID_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.loaded = False
+        self.loaded_at = 0.0
+        self._cells: Dict[Tuple[int, int], Set[int]] = {}
+        self._points: Dict[int, Tuple[float, float]] = {}
+        self._masks: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._points)
+
+    def _cell(self, latitude: float, longitude: float) -> Tuple[int, int]:
+        return (
+            math.floor(latitude / self.cell_degrees),
+            math.floor(longitude / self.cell_degrees),
+        )
+
+    def _discard(self, item_id: int):
+        self._masks.pop(item_id, None)
+        point = self._points.pop(item_id, None)
+        if point is None:
+            return
+        cell = self._cell(*point)
+        members = self._cells.get(cell)
+        if members is not None:
+            members.discard(item_id)
+            if not members:
+                del self._cells[cell]
+
+    def upsert(self, item_id: int, latitude: float, longitude: float, mask: int = 0):
+        """Insert or move a point; `mask` is an optional bitmask used to filter queries."""
+        with self._lock:
+            self._discard(item_id)
+            self._points[item_id] = (latitude, longitude)
+            self._masks[item_id] = mask
+            self._cells.setdefault(self._cell(latitude, longitude), set()).add(item_id)
+
+    def remove(self, item_id: int):
+        with self._lock:
+            self._discard(item_id)
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._points.clear()
+            self._masks.clear()
+            self.loaded = False
+
+    def position(self, item_id: int) -> Optional[Tuple[float, float]]:
+        return self._points.get(item_id)
+
+    def _collect(self, latitude: float, longitude: float, radius_km: float) -> List[int]:
+        min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius_km)
+        row_start, row_end = self._cell(min_lat, 0.0)[0], self._cell(max_lat, 0.0)[0]
+        # Column spans of the box, two when it crosses the antimeridian
+        spans = [
+            (self._cell(0.0, start)[1], self._cell(0.0, end)[1])
+            for start, end in longitude_ranges(min_lon, max_lon)
+        ]
+
+        candidates: List[int] = []
+        # Iterate whichever is smaller: the cells in the box or the occupied cells
+        box_cells = (row_end - row_start + 1) * sum(col_end - col_start + 1 for col_start, col_end in spans)
+        if box_cells > len(self._cells):
+            for (row, col), members in self._cells.items():
+                if row_start <= row <= row_end and any(start <= col <= end for start, end in spans):
+                    candidates.extend(members)
+        else:
+            for row in range(row_start, row_end + 1):
+                for col_start, col_end in spans:
+                    for col in range(col_start, col_end + 1):
+                        members = self._cells.get((row, col))
+                        if members:
+                            candidates.extend(members)
+        return candidates
+
+    def query_radius(self, latitude: float, longitude: float, radius_km: float) -> List[int]:
+        """Return ids in the cells overlapping the radius' bounding box.
+
+        The result is a superset of the points within the radius; exact
+        distance filtering is left to the caller.
+        """
+        with self._lock:
+            return self._collect(latitude, longitude, radius_km)
+
+    def query_points(
+        self, latitude: float, longitude: float, radius_km: float, required_mask: int = 0
+    ) -> PointArrays:
+        """Candidate ids for a radius query together with their coordinates.
+
+        Points whose mask lacks any bit of `required_mask` are left out.
+        """
+        with self._lock:
+            ids = self._collect(latitude, longitude, radius_km)
+            if required_mask:
+                masks = self._masks
+                ids = [item_id for item_id in ids if masks[item_id] & required_mask == required_mask]
+            coords = [self._points[item_id] for item_id in ids]
+        return PointArrays(
+            ids,
+            [coord[0] for coord in coords],
+            [coord[1] for coord in coords],
+        )
+
+
+# Index of verified, active and online service providers keyed by ServiceProvider.id
+provider_index = SpatialGridIndex()
+
+
+class ProviderIndexFeed:
+    """Carries provider index changes to the index of every worker.
+
+    Changes are applied through `publish` when it is set (main.py sends them
+    through the WebSocket broker, which also delivers them here), otherwise
+    straight to the local index.
+    """
+
+    def __init__(self, index: SpatialGridIndex):
+        self.index = index
+        # Called with an event to get it to the index of every worker
+        self.publish: Optional[Callable[[str], None]] = None
+        self.applied = 0
+
+    def moved(self, provider_id: int, latitude: float, longitude: float, mask: int):
+        self._emit({"type": "provider_moved", "id": provider_id, "lat": latitude, "lon": longitude, "mask": mask})
+
+    def removed(self, provider_id: int):
+        self._emit({"type": "provider_removed", "id": provider_id})
+
+    def _emit(self, event: dict):
+        message = dumps(event)
+        if self.publish is None:
+            self.apply(message)
+        else:
+            self.publish(message)
+
+    def apply(self, message: str):
+        event = loads(message)
+        self.applied += 1
+        if event["type"] == "provider_moved":
+            self.index.upsert(event["id"], event["lat"], event["lon"], event["mask"])
+        else:
+            self.index.remove(event["id"])
+
+    def stats(self) -> dict:
+        return {
+            "providers": len(self.index),
+            "loaded_seconds_ago": round(time.monotonic() - self.index.loaded_at, 1) if self.index.loaded else None,
+            "changes_applied": self.applied,
+        }
+
+
+provider_index_feed = ProviderIndexFeed(provider_index)
+
+
+def is_discoverable(profile) -> bool:
+    """Whether a provider profile should be returned by proximity searches."""
+    return bool(profile.is_active and profile.is_online and profile.is_verified)
+
+
+def sync_provider(profile):
+    """Add, move or drop a provider in the index of every worker after its row changed."""
+    if profile is None or profile.id is None:
+        return
+    if is_discoverable(profile):
+        provider_index_feed.moved(profile.id, *provider_position(profile), profile.services_mask or 0)
+    else:
+        provider_index_feed.removed(profile.id)
+
+
+async def ensure_provider_index(db, refresh: float = PROVIDER_INDEX_REFRESH):
+    """Load the provider index from the database on first use and when it is stale."""
+    if provider_index.loaded and (refresh <= 0 or time.monotonic() - provider_index.loaded_at < refresh):
+        return provider_index
+
+    from sqlalchemy import select
+    from models import ServiceProvider  # Import here to avoid circular imports
+
+    result = await db.execute(select(
+        ServiceProvider.id,
+        ServiceProvider.latitude,
+        ServiceProvider.longitude,
+        ServiceProvider.current_latitude,
+        ServiceProvider.current_longitude,
+        ServiceProvider.services_mask,
+    ).where(
+        ServiceProvider.is_active == True,
+        ServiceProvider.is_online == True,
+        ServiceProvider.is_verified == True
+    ))
+    rows = result.all()
+
+    provider_index.clear()
+    for row in rows:
+        provider_index.upsert(row.id, *provider_position(row), row.services_mask or 0)
+    provider_index.loaded = True
+    provider_index.loaded_at = time.monotonic()
+    return provider_index
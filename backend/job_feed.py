@@ -0,0 +1,159 @@
+from typing import Callable, Dict, NamedTuple, Optional
+import uuid
+
+import numpy as np
+from sqlalchemy import select
+
+from database import AsyncReadSessionLocal
+from geo import DEFAULT_SERVICE_RADIUS_KM, haversine_km, provider_index, provider_position
+from models import ServiceProvider, services_to_mask
+from ws_protocol import EnvelopeError, dumps, loads
+
+# Available-jobs feed. Every change to what GET /api/assistance/available
+# can return (a request created, offered, released, accepted, rejected or
+# cancelled) is published to all workers and advances the feed version.
+# Providers subscribed over /ws get job_available / job_removed deltas for
+# requests open to any provider, limited to their service radius and the
+# services they offer. The REST endpoint does not rely on the feed: its
+# ETag and `since` token are read from the database.
+
+# Response headers of GET /api/assistance/available: the `since` token the
+# response is current to, and whether it holds only the changes since one
+JOBS_VERSION_HEADER = "X-Jobs-Version"
+JOBS_DELTA_HEADER = "X-Jobs-Delta"
+
+JOB_AVAILABLE = "job_available"
+JOB_REMOVED = "job_removed"
+# Visible only to the provider a request is offered to, who gets a job_offer
+JOB_CHANGED = "job_changed"
+
+
+def job_summary(request) -> dict:
+    """What providers are told about a job, from a request model or row."""
+    return {
+        "request_id": request.id,
+        "service_type": getattr(request.service_type, "value", request.service_type),
+        "priority": request.priority,
+        "latitude": request.latitude,
+        "longitude": request.longitude,
+        "address": request.address,
+    }
+
+
+class Subscriber(NamedTuple):
+    user_id: int
+    provider_id: int  # ServiceProvider.id, for the live position in the provider index
+    latitude: float  # position when subscribing, if the index has none
+    longitude: float
+    radius_km: float
+    services_mask: int
+
+
+class JobFeed:
+    """Versioned stream of changes to the pool of pending requests.
+
+    Events are applied by every worker in the order its broker delivers them,
+    so versions are per worker: `token` embeds a random epoch and only orders
+    the messages one socket receives.
+    """
+
+    def __init__(self, session_factory=AsyncReadSessionLocal):
+        self.session_factory = session_factory
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self._subscribers: Dict[str, Subscriber] = {}
+        # Called with an event to get it to the feed of every worker
+        self.publish: Optional[Callable[[str], None]] = None
+        # Called with (client id, message) to push a delta to a subscriber
+        self.send: Optional[Callable[[str, str], None]] = None
+        self.events = 0
+        self.deltas_sent = 0
+
+    @property
+    def token(self) -> str:
+        return f"{self.epoch}.{self.version}"
+
+    def opened(self, job: dict):
+        """A request became available to any provider."""
+        self._publish(JOB_AVAILABLE, job)
+
+    def closed(self, job: dict):
+        """A request is no longer available to any provider."""
+        self._publish(JOB_REMOVED, job)
+
+    def changed(self, job: dict):
+        """A request was offered to a provider, or passed on to another."""
+        self._publish(JOB_CHANGED, job)
+
+    def _publish(self, kind: str, job: dict):
+        message = dumps({"type": kind, **job})
+        if self.publish is not None:
+            self.publish(message)
+        else:
+            self.apply(message)
+
+    def apply(self, message: str):
+        """Count an event and push it to the matching subscribers connected here."""
+        event = loads(message)
+        self.version += 1
+        self.events += 1
+        if event["type"] == JOB_CHANGED or not self._subscribers or self.send is None:
+            return
+
+        bit = services_to_mask([event.get("service_type")])
+        subscribers = [
+            (client_id, subscriber) for client_id, subscriber in self._subscribers.items()
+            if bit and subscriber.services_mask & bit
+        ]
+        if not subscribers:
+            return
+        positions = [
+            provider_index.position(subscriber.provider_id) or (subscriber.latitude, subscriber.longitude)
+            for _, subscriber in subscribers
+        ]
+        distances = haversine_km(
+            event["latitude"], event["longitude"],
+            np.array([position[0] for position in positions]),
+            np.array([position[1] for position in positions]),
+        )
+        outbound = dumps({**event, "version": self.token})
+        for (client_id, subscriber), distance_km in zip(subscribers, distances.tolist()):
+            if distance_km <= subscriber.radius_km:
+                self.deltas_sent += 1
+                self.send(client_id, outbound)
+
+    async def subscribe(self, client_id: str, user_id: int):
+        """Start pushing deltas to a provider's socket."""
+        async with self.session_factory() as db:
+            profile = await db.scalar(select(ServiceProvider).where(
+                ServiceProvider.user_id == user_id,
+                ServiceProvider.is_active == True
+            ))
+        if profile is None:
+            raise EnvelopeError("No active service provider profile")
+        latitude, longitude = provider_position(profile)
+        self._subscribers[client_id] = Subscriber(
+            user_id,
+            profile.id,
+            latitude,
+            longitude,
+            profile.service_radius or DEFAULT_SERVICE_RADIUS_KM,
+            profile.services_mask or 0,
+        )
+        if self.send is not None:
+            self.send(client_id, dumps({"type": "jobs_subscribed", "version": self.token}))
+
+    def unsubscribe(self, client_id: str) -> bool:
+        return self._subscribers.pop(client_id, None) is not None
+
+    def stats(self) -> dict:
+        return {
+            "version": self.token,
+            "subscribers": len(self._subscribers),
+            "events": self.events,
+            "deltas_sent": self.deltas_sent,
+        }
+
+
+# Global feed used by the assistance router and the dispatcher
+job_feed = JobFeed()
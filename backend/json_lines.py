@@ -0,0 +1,57 @@
+import json
+
+from fastapi import HTTPException, Request, status
+
+# Content types read as NDJSON (one JSON value per line) by read_json_items
+NDJSON_CONTENT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+def _too_many_items(max_items: int):
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"At most {max_items} items per request"
+    )
+
+
+async def read_json_items(request: Request, max_items: int) -> list:
+    """Parse a request body of many items: a JSON array, or NDJSON as it streams in.
+
+    Unparseable NDJSON lines come back as None, so callers can report a
+    status for them instead of failing the whole batch.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip()
+    if content_type not in NDJSON_CONTENT_TYPES:
+        try:
+            items = await request.json()
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array")
+        if not isinstance(items, list):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Body must be a JSON array")
+        if len(items) > max_items:
+            raise _too_many_items(max_items)
+        return items
+
+    items = []
+    buffer = bytearray()
+
+    def take_line(line: bytes):
+        if not line.strip():
+            return
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            items.append(None)
+        if len(items) > max_items:
+            raise _too_many_items(max_items)
+
+    async for chunk in request.stream():
+        buffer.extend(chunk)
+        start = 0
+        end = buffer.find(b"\n")
+        while end != -1:
+            take_line(bytes(buffer[start:end]))
+            start = end + 1
+            end = buffer.find(b"\n", start)
+        del buffer[:start]
+    take_line(bytes(buffer))
+    return items
@@ -0,0 +1,125 @@
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import asyncio
+import os
+import time
+
+from sqlalchemy import bindparam, select, update
+
+from database import AsyncSessionLocal
+from geo import sync_provider
+from models import ServiceProvider
+
+# Live provider positions streamed over WebSockets are buffered, keeping only
+# the latest fix per provider, and written every
+# PROVIDER_LOCATION_FLUSH_INTERVAL seconds as executemany UPDATEs of up to
+# PROVIDER_LOCATION_BATCH_SIZE rows. 0 disables persisting the stream.
+PROVIDER_LOCATION_FLUSH_INTERVAL = float(os.getenv("PROVIDER_LOCATION_FLUSH_INTERVAL", "5"))
+PROVIDER_LOCATION_BATCH_SIZE = int(os.getenv("PROVIDER_LOCATION_BATCH_SIZE", "500"))
+
+_providers = ServiceProvider.__table__
+UPDATE_PROVIDER_LOCATION = (
+    update(_providers)
+    .where(_providers.c.user_id == bindparam("b_user_id"))
+    .values(
+        current_latitude=bindparam("b_latitude"),
+        current_longitude=bindparam("b_longitude"),
+        last_location_update=bindparam("b_at"),
+    )
+)
+
+Fix = Tuple[float, float, datetime]
+
+
+class ProviderLocationWriter:
+    """Write-behind buffer for provider live locations.
+
+    record() is cheap and never touches the database; a background task
+    flushes the newest fix of every provider that moved since the last flush,
+    so database writes are bounded by the number of providers per interval
+    rather than by how often devices report. Fixes from a failed flush are
+    kept, unless a newer one arrived meanwhile, and retried with the next.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, interval: float = PROVIDER_LOCATION_FLUSH_INTERVAL,
+                 batch_size: int = PROVIDER_LOCATION_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.interval = interval
+        self.batch_size = batch_size
+        self.recorded = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.errors = 0
+        self.last_flush_ms = 0.0
+        self._pending: Dict[int, Fix] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, user_id: int, latitude: float, longitude: float):
+        """Buffer a provider's position, identified by its user id."""
+        if self.interval <= 0:
+            return
+        self.recorded += 1
+        self._pending[user_id] = (latitude, longitude, datetime.utcnow())
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while self._pending:
+            await asyncio.sleep(self.interval)
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write all buffered positions now; returns the number of rows sent."""
+        if not self._pending:
+            return 0
+        batch, self._pending = self._pending, {}
+        rows = [
+            {"b_user_id": user_id, "b_latitude": latitude, "b_longitude": longitude, "b_at": at}
+            for user_id, (latitude, longitude, at) in batch.items()
+        ]
+        start = time.perf_counter()
+        try:
+            async with self.session_factory() as db:
+                for i in range(0, len(rows), self.batch_size):
+                    await db.execute(UPDATE_PROVIDER_LOCATION, rows[i:i + self.batch_size])
+                await db.commit()
+                # Move the providers in the proximity index as well
+                user_ids = list(batch)
+                profiles = []
+                for i in range(0, len(user_ids), self.batch_size):
+                    profiles.extend((await db.scalars(
+                        select(ServiceProvider).where(ServiceProvider.user_id.in_(user_ids[i:i + self.batch_size]))
+                    )).all())
+        except Exception as e:
+            self.errors += 1
+            print(f"Provider location flush failed: {e}")
+            for user_id, fix in batch.items():
+                self._pending.setdefault(user_id, fix)
+            return 0
+        for profile in profiles:
+            sync_provider(profile)
+        self.flushes += 1
+        self.rows_written += len(rows)
+        self.last_flush_ms = round((time.perf_counter() - start) * 1000, 2)
+        return len(rows)
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "flush_interval": self.interval,
+            "pending": len(self._pending),
+            "recorded": self.recorded,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "errors": self.errors,
+            "last_flush_ms": self.last_flush_ms,
+        }
+
+
+# Global writer fed by the WebSocket manager
+provider_locations = ProviderLocationWriter()
@@ -8,19 +8,27 @@ project_root = pathlib.Path(__file__).resolve().parent.parent
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, WebSocket, status
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
+from typing import Optional
 import uvicorn
 import os
 from dotenv import load_dotenv
 
-from database import engine, SessionLocal
+from database import engine, SessionLocal, AsyncReadSessionLocal, database_pool_stats, dispose_async_engines
 from models import Base
-from routers import auth, users, vehicles, breakdowns, service_providers, assistance, upload
+from routers import auth, users, vehicles, breakdowns, service_providers, assistance, upload, telemetry
 # removed unused import: middleware.auth.get_current_user (module not present in repo)
-from websocket_manager import websocket_manager
+from websocket_manager import DEVICE_CACHE_ROOM, JOBS_ROOM, PRINCIPAL_CACHE_ROOM, PROVIDER_INDEX_ROOM, websocket_manager
+from location_writer import provider_locations
+from telemetry import device_cache_feed, telemetry_pipeline
+from dispatch import dispatcher
+from job_feed import JOBS_DELTA_HEADER, JOBS_VERSION_HEADER, job_feed
+from geo import provider_index_feed
+from pagination import NEXT_CURSOR_HEADER
+from auth import Principal, auth_cache_stats, password_hash_pool, principal_cache_feed, principal_for_token, require_admin
 
 # Load environment variables
 load_dotenv()
@@ -61,6 +69,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "ETag", JOBS_VERSION_HEADER, JOBS_DELTA_HEADER],
 )
 
 # Security
@@ -74,6 +83,7 @@ app.include_router(breakdowns.router, prefix="/api/breakdowns", tags=["Breakdown
 app.include_router(service_providers.router, prefix="/api/service-providers", tags=["Service Providers"])
 app.include_router(upload.router, prefix="/api/upload", tags=["Upload"])
 app.include_router(assistance.router, prefix="/api/assistance", tags=["Assistance"])
+app.include_router(telemetry.router, prefix="/api/telemetry", tags=["Telemetry"])
 
 # Mount static files
 from fastapi.staticfiles import StaticFiles
@@ -81,17 +91,92 @@ os.makedirs("uploads", exist_ok=True)
 app.mount("/static/uploads", StaticFiles(directory="uploads"), name="uploads")
 
 # WebSocket endpoint
+websocket_manager.location_sink = provider_locations.record
+# Job offers reach providers through the private room of their sockets
+dispatcher.notify = websocket_manager.notify_provider
+# Available-jobs events go to the feed of every worker, which pushes them on
+# to the providers subscribed on it
+job_feed.publish = lambda message: websocket_manager.broadcast(message, JOBS_ROOM)
+job_feed.send = websocket_manager.enqueue
+websocket_manager.room_handlers[JOBS_ROOM] = job_feed.apply
+websocket_manager.job_feed = job_feed
+# Provider online/offline and location changes reach the proximity index of
+# every worker, not only the one that handled them
+provider_index_feed.publish = lambda message: websocket_manager.broadcast(message, PROVIDER_INDEX_ROOM)
+websocket_manager.room_handlers[PROVIDER_INDEX_ROOM] = provider_index_feed.apply
+# Devices of changed or deleted vehicles are dropped from every worker's cache
+device_cache_feed.publish = lambda message: websocket_manager.broadcast(message, DEVICE_CACHE_ROOM)
+websocket_manager.room_handlers[DEVICE_CACHE_ROOM] = device_cache_feed.apply
+# Deactivated, suspended or deleted accounts lose their cached principal in
+# every worker, not only the one that changed them
+principal_cache_feed.publish = lambda message: websocket_manager.broadcast(message, PRINCIPAL_CACHE_ROOM)
+websocket_manager.room_handlers[PRINCIPAL_CACHE_ROOM] = principal_cache_feed.apply
+
+@app.on_event("startup")
+async def subscribe_job_feed():
+    # Needs the event loop; a no-op for the in-memory broker
+    websocket_manager.broker.room_added(JOBS_ROOM)
+    websocket_manager.broker.room_added(PROVIDER_INDEX_ROOM)
+    websocket_manager.broker.room_added(DEVICE_CACHE_ROOM)
+    websocket_manager.broker.room_added(PRINCIPAL_CACHE_ROOM)
+
+@app.on_event("startup")
+async def start_dispatch():
+    # Offers left by a worker that stopped or crashed are released first
+    # thing, and in batch mode requests already waiting are matched
+    dispatcher.start_sweeper()
+    dispatcher.schedule()
+
 @app.websocket("/ws/{client_id}")
-async def websocket_endpoint(websocket, client_id: str):
-    await websocket_manager.connect(websocket, client_id)
+async def websocket_endpoint(websocket: WebSocket, client_id: str, token: Optional[str] = None):
+    # Sockets opened with ?token= of a service provider have the location
+    # updates they send persisted as the provider's live location
+    provider_user_id = None
+    if token:
+        try:
+            async with AsyncReadSessionLocal() as db:
+                principal = await principal_for_token(token, db)
+        except HTTPException:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        if principal.role == "service_provider":
+            provider_user_id = principal.id
+    await websocket_manager.connect(websocket, client_id, provider_user_id)
     try:
         while True:
-            data = await websocket.receive_text()
-            await websocket_manager.handle_message(client_id, data)
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            websocket_manager.touch(client_id)
+            if message.get("text") is not None:
+                await websocket_manager.handle_message(client_id, message["text"])
+            elif message.get("bytes") is not None:
+                await websocket_manager.handle_binary(client_id, message["bytes"])
     except Exception as e:
         print(f"WebSocket error: {e}")
     finally:
-        await websocket_manager.disconnect(client_id)
+        websocket_manager.disconnect(client_id, websocket)
+
+@app.on_event("shutdown")
+async def flush_provider_locations():
+    # Before the pools are closed, so buffered fixes are not lost
+    await provider_locations.close()
+
+@app.on_event("shutdown")
+async def flush_telemetry():
+    await telemetry_pipeline.close()
+
+@app.on_event("shutdown")
+async def close_dispatcher():
+    await dispatcher.close()
+
+@app.on_event("shutdown")
+async def close_database_pools():
+    await dispose_async_engines()
+
+@app.on_event("shutdown")
+async def close_websocket_broker():
+    await websocket_manager.close()
 
 # Dependency to get database session
 def get_db():
@@ -115,6 +200,21 @@ async def root():
 async def health_check():
     return {"status": "healthy", "message": "API is running"}
 
+# Runtime counters for monitoring; they describe internals, so admins only
+@app.get("/metrics")
+async def metrics(current_user: Principal = Depends(require_admin)):
+    return {
+        "auth": auth_cache_stats(),
+        "password_hashing": password_hash_pool.stats(),
+        "database": database_pool_stats(),
+        "websocket": websocket_manager.stats(),
+        "provider_locations": provider_locations.stats(),
+        "telemetry": telemetry_pipeline.stats(),
+        "dispatch": dispatcher.stats(),
+        "job_feed": job_feed.stats(),
+        "provider_index": provider_index_feed.stats(),
+    }
+
 if __name__ == "__main__":
     uvicorn.run(
         "main:app",
@@ -0,0 +1,38 @@
+from bisect import bisect_left
+from typing import Sequence
+import threading
+
+# Upper bounds in milliseconds; anything slower lands in the overflow bucket
+DEFAULT_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class Histogram:
+    """Thread-safe latency histogram with fixed millisecond buckets."""
+
+    def __init__(self, buckets_ms: Sequence[float] = DEFAULT_BUCKETS_MS):
+        self.buckets_ms = tuple(buckets_ms)
+        self._counts = [0] * (len(self.buckets_ms) + 1)
+        self._count = 0
+        self._total_ms = 0.0
+        self._max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000.0
+        with self._lock:
+            self._counts[bisect_left(self.buckets_ms, ms)] += 1
+            self._count += 1
+            self._total_ms += ms
+            if ms > self._max_ms:
+                self._max_ms = ms
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            buckets = {f"le_{bound:g}ms": count for bound, count in zip(self.buckets_ms, self._counts)}
+            buckets["overflow"] = self._counts[-1]
+            return {
+                "count": self._count,
+                "avg_ms": round(self._total_ms / self._count, 3) if self._count else 0.0,
+                "max_ms": round(self._max_ms, 3),
+                "buckets": buckets,
+            }
@@ -1,8 +1,10 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, Text, Float, ForeignKey, Enum as SQLEnum
+from sqlalchemy import BigInteger, Column, Index, Integer, String, Boolean, DateTime, Text, Float, ForeignKey, Enum as SQLEnum
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
+from typing import Iterable, List
 import enum
+import json
 
 class UserRole(str, enum.Enum):
     DRIVER = "driver"
@@ -28,6 +30,11 @@ class User(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Keyset pagination of list endpoints, newest first
+    __table_args__ = (
+        Index("ix_users_created_id", "created_at", "id"),
+    )
+
     # Relationships
     vehicles = relationship("Vehicle", back_populates="owner")
     breakdowns = relationship("Breakdown", back_populates="driver", foreign_keys="Breakdown.driver_id")
@@ -67,14 +74,69 @@ class Vehicle(Base):
     insurance_policy_number = Column(String(50))
     insurance_expiry_date = Column(DateTime(timezone=True))
     iot_device_id = Column(String(50), unique=True)
+    # Last position reported by the vehicle's IoT device
+    latitude = Column(Float)
+    longitude = Column(Float)
+    last_location_update = Column(DateTime(timezone=True))
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Keyset pagination of list endpoints, newest first
+    __table_args__ = (
+        Index("ix_vehicles_owner_created_id", "owner_id", "created_at", "id"),
+    )
+
     # Relationships
     owner = relationship("User", back_populates="vehicles")
     breakdowns = relationship("Breakdown", back_populates="vehicle")
 
+# SQLite only auto-increments INTEGER PRIMARY KEY columns
+TelemetryId = BigInteger().with_variant(Integer, "sqlite")
+
+class VehicleTelemetry(Base):
+    """Raw IoT readings: append-only, written in batches by telemetry.py.
+    
+    Kept narrow, with no server defaults and only the indexes that reads
+    and retention need, so inserts stay cheap at high rates.
+    """
+    __tablename__ = "vehicle_telemetry"
+
+    id = Column(TelemetryId, primary_key=True, autoincrement=True)
+    vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), nullable=False)
+    ts = Column(BigInteger, nullable=False)  # reading time, epoch milliseconds
+    latitude = Column(Float)
+    longitude = Column(Float)
+    speed = Column(Float)  # km/h
+    battery_voltage = Column(Float)
+    engine_codes = Column(String(255))  # comma-separated diagnostic trouble codes
+
+    __table_args__ = (
+        Index("ix_vehicle_telemetry_vehicle_ts", "vehicle_id", "ts"),
+        Index("ix_vehicle_telemetry_ts", "ts"),
+    )
+
+class VehicleTelemetryRollup(Base):
+    """Readings older than the raw retention window, downsampled per time bucket."""
+    __tablename__ = "vehicle_telemetry_rollups"
+
+    id = Column(TelemetryId, primary_key=True, autoincrement=True)
+    vehicle_id = Column(Integer, ForeignKey("vehicles.id", ondelete="CASCADE"), nullable=False)
+    bucket_ts = Column(BigInteger, nullable=False)  # bucket start, epoch milliseconds
+    bucket_seconds = Column(Integer, nullable=False)
+    samples = Column(Integer, nullable=False)
+    latitude = Column(Float)  # mean position over the bucket
+    longitude = Column(Float)
+    avg_speed = Column(Float)
+    max_speed = Column(Float)
+    min_battery_voltage = Column(Float)
+    avg_battery_voltage = Column(Float)
+    fault_samples = Column(Integer, default=0)  # readings that carried engine codes
+
+    __table_args__ = (
+        Index("ix_vehicle_telemetry_rollups_vehicle_bucket", "vehicle_id", "bucket_ts"),
+    )
+
 class BreakdownCategory(str, enum.Enum):
     MECHANICAL = "mechanical"
     ELECTRICAL = "electrical"
@@ -126,6 +188,11 @@ class Breakdown(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Keyset pagination of list endpoints, newest first
+    __table_args__ = (
+        Index("ix_breakdowns_driver_created_id", "driver_id", "created_at", "id"),
+    )
+
     # Relationships
     vehicle = relationship("Vehicle", back_populates="breakdowns")
     driver = relationship("User", back_populates="breakdowns", foreign_keys=[driver_id])
@@ -140,6 +207,29 @@ class ServiceType(str, enum.Enum):
     LOCKOUT = "lockout"
     DIAGNOSTIC = "diagnostic"
 
+# Bit assigned to each service type in ServiceProvider.services_mask.
+# Never renumber existing entries; give new service types the next free bit.
+SERVICE_TYPE_BITS = {
+    ServiceType.TOWING.value: 1 << 0,
+    ServiceType.REPAIR.value: 1 << 1,
+    ServiceType.FUEL_DELIVERY.value: 1 << 2,
+    ServiceType.JUMP_START.value: 1 << 3,
+    ServiceType.TIRE_CHANGE.value: 1 << 4,
+    ServiceType.LOCKOUT.value: 1 << 5,
+    ServiceType.DIAGNOSTIC.value: 1 << 6,
+}
+
+def services_to_mask(services: Iterable) -> int:
+    """Pack service type values (or enums) into a bitmask, ignoring unknown ones."""
+    mask = 0
+    for service in services or []:
+        mask |= SERVICE_TYPE_BITS.get(getattr(service, "value", service), 0)
+    return mask
+
+def services_from_mask(mask: int) -> List[str]:
+    """Unpack a bitmask into service type values, in enum order."""
+    return [service for service, bit in SERVICE_TYPE_BITS.items() if mask & bit]
+
 class ServiceProvider(Base):
     __tablename__ = "service_providers"
 
@@ -147,7 +237,10 @@ class ServiceProvider(Base):
     user_id = Column(Integer, ForeignKey("users.id"), unique=True, nullable=False)
     business_name = Column(String(100), nullable=False)
     business_license = Column(String(50), unique=True, nullable=False)
-    services = Column(Text)  # JSON string of service types
+    services_json = Column("services", Text)  # JSON copy of services, kept for SQL views and exports
+    # SERVICE_TYPE_BITS bitmask. Not indexed: `services_mask & m = m` is a
+    # scan predicate on rows already narrowed by location, not a lookup
+    services_mask = Column(Integer, default=0, nullable=False)
     documents = Column(Text) # JSON string of uploaded documents
     service_radius = Column(Integer, default=50)  # kilometers
     latitude = Column(Float, nullable=False)
@@ -166,9 +259,27 @@ class ServiceProvider(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Keyset pagination of list endpoints, newest first
+    __table_args__ = (
+        Index("ix_service_providers_created_id", "created_at", "id"),
+    )
+
     # Relationships
     user = relationship("User", back_populates="service_provider_profile")
 
+    @property
+    def services(self) -> List[str]:
+        return services_from_mask(self.services_mask or 0)
+
+    @services.setter
+    def services(self, value):
+        # Legacy callers pass the JSON string that used to be stored directly
+        if isinstance(value, str):
+            value = json.loads(value) if value else []
+        values = [getattr(service, "value", service) for service in value or []]
+        self.services_mask = services_to_mask(values)
+        self.services_json = json.dumps(services_from_mask(self.services_mask))
+
 class AssistanceRequestStatus(str, enum.Enum):
     PENDING = "pending"
     ACCEPTED = "accepted"
@@ -205,9 +316,22 @@ class AssistanceRequest(Base):
     payment_method = Column(String(20))
     rating = Column(Integer)
     feedback = Column(Text)
+    # When the dispatch offer held in assigned_provider_id lapses (pending only)
+    offer_expires_at = Column(DateTime(timezone=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
+    # Keyset pagination of list endpoints, newest first
+    __table_args__ = (
+        Index("ix_assistance_requests_created_id", "created_at", "id"),
+        Index("ix_assistance_requests_requester_created_id", "requester_id", "created_at", "id"),
+        Index("ix_assistance_requests_provider_created_id", "assigned_provider_id", "created_at", "id"),
+        # Requests changed since a time, for GET /api/assistance/available?since=
+        Index("ix_assistance_requests_updated_at", "updated_at"),
+        # Lapsed dispatch offers, for the dispatcher's sweep
+        Index("ix_assistance_requests_offer_expires_at", "offer_expires_at"),
+    )
+
     # Relationships
     breakdown = relationship("Breakdown")
     requester = relationship("User", foreign_keys=[requester_id])
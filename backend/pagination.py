@@ -0,0 +1,126 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import String, and_, literal, or_, select, type_coerce
+
+# Response header carrying the cursor for the next page, if there is one
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(values: list) -> str:
+    """Encode the sort key of the last returned row as an opaque cursor."""
+    raw = json.dumps(values, separators=(",", ":"), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List]:
+    """Decode a cursor produced by encode_cursor, or None when no cursor was sent."""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return values
+
+
+# Page sizes of the list endpoints paginated newest first
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 500
+
+
+def newest_first(statement, created_at, id_column, cursor: Optional[str], limit: int, dialect_name: str):
+    """Page a select newest first by (created_at, id), starting after a cursor.
+
+    Keyset pagination: the cursor holds the sort key of the last row of the
+    previous page, so any page costs an index range scan, not an OFFSET.
+    One extra row is selected to tell whether there is a next page, along
+    with the sort key as `cursor_created_at` and `cursor_id`. SQLite keeps
+    timestamps as text in more than one format, so there the key is
+    compared as stored rather than as a datetime.
+    """
+    sqlite = dialect_name == "sqlite"
+    statement = statement.add_columns(
+        type_coerce(created_at, String).label("cursor_created_at"),
+        id_column.label("cursor_id"),
+    )
+    after = decode_cursor(cursor, 2)
+    if after:
+        created, row_id = after
+        try:
+            created = literal(str(created), String) if sqlite else datetime.fromisoformat(str(created))
+            row_id = int(row_id)
+        except (TypeError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        # The redundant `<=` gives the planner a range to seek the index to
+        statement = statement.where(created_at <= created, or_(
+            created_at < created,
+            and_(created_at == created, id_column < row_id)
+        ))
+    return statement.order_by(created_at.desc(), id_column.desc()).limit(limit + 1)
+
+
+async def fetch_page(db, statement, created_at, id_column, cursor: Optional[str], limit: int) -> Tuple[List, Optional[str]]:
+    """Run a select through newest_first; returns up to `limit` rows and the next cursor, if any."""
+    statement = newest_first(statement, created_at, id_column, cursor, limit, db.get_bind().dialect.name)
+    rows = (await db.execute(statement)).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor([rows[-1].cursor_created_at, rows[-1].cursor_id])
+
+
+def projection_columns(schema, table) -> Dict[str, Any]:
+    """Fields of a response schema stored in a column of the same name."""
+    return {name: table.c[name] for name in schema.model_fields if name in table.c}
+
+
+def parse_fields(fields: Optional[str], columns: Dict[str, Any]) -> Optional[List[str]]:
+    """Field names asked for with `fields=` (comma separated), or None for whole rows."""
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in columns]
+    if not names or unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown field(s): {', '.join(unknown) or '(none given)'}. "
+                   f"Selectable fields: {', '.join(columns)}"
+        )
+    return names
+
+
+def projected_select(columns: Dict[str, Any], names: List[str]):
+    """A select of just the named fields, each labelled with its field name."""
+    return select(*(columns[name].label(name) for name in names))
+
+
+def projected_response(rows, names: List[str], next_cursor: Optional[str],
+                       converters: Optional[Dict[str, Callable]] = None) -> JSONResponse:
+    """A page of rows selected by parse_fields, with only those fields."""
+    converters = converters or {}
+    items = []
+    for row in rows:
+        mapping = row._mapping
+        item = {}
+        for name in names:
+            value = mapping[name]
+            convert = converters.get(name)
+            item[name] = convert(value) if convert is not None else value
+        items.append(item)
+    headers = {NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None
+    return JSONResponse(jsonable_encoder(items), headers=headers)
@@ -1,31 +1,152 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+import hashlib
+import os
+from datetime import datetime, timedelta
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import String, and_, func, literal, or_, select, true, type_coerce, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from database import get_db
-from models import User, AssistanceRequest, Breakdown
+from database import get_async_db, get_async_read_db
+from models import User, AssistanceRequest, AssistanceRequestStatus, Breakdown, BreakdownStatus
 from schemas import (
     AssistanceRequestCreate, 
     AssistanceRequestResponse, 
     AssistanceRequestUpdate,
     MessageResponse
 )
-from auth import get_current_user, require_driver, require_service_provider
+from auth import Principal, get_current_principal, require_driver, require_service_provider
+from cache import TTLCache
+from dispatch import dispatcher
+from job_feed import JOBS_DELTA_HEADER, JOBS_VERSION_HEADER, job_feed, job_summary
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    decode_cursor,
+    encode_cursor,
+    fetch_page,
+    parse_fields,
+    projected_response,
+    projected_select,
+    projection_columns
+)
 
 router = APIRouter()
 
+_requests = AssistanceRequest.__table__
+_breakdowns = Breakdown.__table__
+
+# Fields that can be selected on their own with ?fields=
+REQUEST_FIELDS = projection_columns(AssistanceRequestResponse, _requests)
+
+# GET /available?since= also returns requests stamped this long before the
+# token, for transactions that committed after it was read with an earlier
+# now() (SQLite serialises writers, so it needs no overlap)
+SINCE_OVERLAP = timedelta(seconds=5)
+
+# The X-Jobs-Version of the whole table is reused for this many seconds
+# rather than read on every poll. A cached version is never newer than the
+# table, so deltas from it only overlap more.
+JOBS_VERSION_CACHE_TTL = float(os.getenv("JOBS_VERSION_CACHE_TTL", "1"))
+_jobs_version_cache = TTLCache(maxsize=1, ttl=JOBS_VERSION_CACHE_TTL)
+
+def _available_to(user_id: int):
+    """Pending requests offered to this provider or to nobody in particular."""
+    return and_(
+        AssistanceRequest.status == "pending",
+        or_(
+            AssistanceRequest.assigned_provider_id == None,
+            AssistanceRequest.assigned_provider_id == user_id
+        )
+    )
+
+async def _available_etag(db: AsyncSession, user_id: int) -> str:
+    """ETag of the requests available to a provider, from the rows themselves.
+
+    Requests entering or leaving the set change the count and id sum, and any
+    change to one of them moves its updated_at.
+    """
+    count, id_sum, changed = (await db.execute(select(
+        func.count(AssistanceRequest.id),
+        func.sum(AssistanceRequest.id),
+        func.max(type_coerce(func.coalesce(AssistanceRequest.updated_at, AssistanceRequest.created_at), String))
+    ).where(_available_to(user_id)))).one()
+    digest = hashlib.sha1(f"{user_id}:{count}:{id_sum}:{changed}".encode()).hexdigest()
+    return f'"{digest[:20]}"'
+
+async def _jobs_version(db: AsyncSession) -> list:
+    """`since` token values: when any assistance request last changed, the
+    highest request id and the number of requests.
+
+    The id and count reveal requests deleted since the token, which a delta
+    cannot report. Timestamps are kept as stored on SQLite, where they are
+    text in more than one format (see pagination.newest_first).
+    """
+    version = _jobs_version_cache.get("version")
+    if version is not None:
+        return version
+    # One aggregate per subquery, so each maximum is read from an index
+    updated, created, max_id, count = (await db.execute(select(
+        select(func.max(type_coerce(AssistanceRequest.updated_at, String))).scalar_subquery(),
+        select(func.max(type_coerce(AssistanceRequest.created_at, String))).scalar_subquery(),
+        select(func.max(AssistanceRequest.id)).scalar_subquery(),
+        select(func.count(AssistanceRequest.id)).scalar_subquery()
+    ))).one()
+    latest = max((value for value in (updated, created) if value is not None), default=None)
+    version = [latest, max_id or 0, count]
+    _jobs_version_cache.set("version", version)
+    return version
+
+def _changed_since(token: str, version: list, dialect_name: str):
+    """WHERE clause for requests created or updated at or after a `since`
+    token, or None if the token cannot be read or requests were deleted
+    since it was issued."""
+    try:
+        changed, max_id, count = decode_cursor(token, 3)
+        if not isinstance(max_id, int) or not isinstance(count, int):
+            return None
+        # Requests created since have higher ids, so fewer new rows than new
+        # ids means older ones were deleted (or ids were skipped)
+        if version[2] - count < version[1] - max_id:
+            return None
+        if changed is None:
+            return true()
+        if dialect_name == "sqlite":
+            changed = literal(str(changed), String)
+        else:
+            changed = datetime.fromisoformat(str(changed)) - SINCE_OVERLAP
+    except (HTTPException, ValueError):
+        return None
+    return or_(AssistanceRequest.updated_at >= changed, AssistanceRequest.created_at >= changed)
+
+async def _transition(db: AsyncSession, request_id: int, conditions, values: dict):
+    """Conditionally UPDATE one assistance request and return the updated row.
+
+    None means no row matched: the request does not exist or is no longer in
+    the state the caller expects. Where the database supports UPDATE ...
+    RETURNING the row comes back from the same statement.
+    """
+    statement = update(_requests).where(_requests.c.id == request_id, *conditions).values(**values)
+    if db.get_bind().dialect.update_returning:
+        return (await db.execute(statement.returning(*_requests.c))).first()
+    if (await db.execute(statement)).rowcount != 1:
+        return None
+    return (await db.execute(select(_requests).where(_requests.c.id == request_id))).first()
+
 @router.post("/", response_model=AssistanceRequestResponse, status_code=status.HTTP_201_CREATED)
 async def create_assistance_request(
     request_data: AssistanceRequestCreate,
-    current_user: User = Depends(require_driver),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_driver),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Create a new assistance request."""
     # Verify breakdown belongs to user
-    breakdown = db.query(Breakdown).filter(
+    breakdown = await db.scalar(select(Breakdown).where(
         Breakdown.id == request_data.breakdown_id,
         Breakdown.driver_id == current_user.id
-    ).first()
+    ))
     
     if not breakdown:
         raise HTTPException(
@@ -33,72 +154,144 @@ async def create_assistance_request(
             detail="Breakdown not found or does not belong to you"
         )
     
-    # Create assistance request
+    # Create assistance request; with dispatch on it stays pending until a
+    # provider accepts it
     request_dict = request_data.dict()
-    
-    # If user selected a specific provider, assign directly
-    if request_dict.get('service_provider_id'):
-        request_dict['assigned_provider_id'] = request_dict.pop('service_provider_id')
-        request_dict['status'] = 'assigned'  # Mark as assigned immediately
-        
-        # Update breakdown with selected provider
-        breakdown.service_provider_id = request_dict['assigned_provider_id']
-        breakdown.status = 'assigned'
+    selected_provider_id = request_dict.pop('service_provider_id', None)
     
     db_request = AssistanceRequest(
         requester_id=current_user.id,
         **request_dict
     )
     
+    # Offer the job to the best scoring provider (or first to the one the user
+    # selected); the offer is held in assigned_provider_id and moves on to the
+    # next candidate if declined or not accepted in time. In batch mode the
+    # next batch makes the offer instead.
+    candidates = []
+    dispatch_now = dispatcher.enabled and (selected_provider_id or not dispatcher.batch_window)
+    if dispatch_now:
+        candidates = await dispatcher.rank(
+            db,
+            request_data.latitude,
+            request_data.longitude,
+            request_data.service_type,
+            selected_provider_id
+        )
+        if candidates:
+            db_request.assigned_provider_id = candidates[0].user_id
+            db_request.offer_expires_at = dispatcher.offer_deadline()
+    elif selected_provider_id:
+        # Without dispatch, the provider the user selected is assigned directly
+        db_request.assigned_provider_id = selected_provider_id
+        db_request.status = AssistanceRequestStatus.ACCEPTED
+        breakdown.service_provider_id = selected_provider_id
+        breakdown.status = BreakdownStatus.ASSIGNED
+    
     db.add(db_request)
-    db.commit()
-    db.refresh(db_request)
+    await db.commit()
+    await db.refresh(db_request)
+    
+    # A directly assigned request never enters the available-jobs feed
+    if db_request.status == AssistanceRequestStatus.PENDING:
+        if db_request.assigned_provider_id is None:
+            job_feed.opened(job_summary(db_request))
+        else:
+            job_feed.changed(job_summary(db_request))
+    
+    if dispatch_now:
+        dispatcher.start(db_request, candidates)
+    elif dispatcher.enabled:
+        dispatcher.schedule()
     
     return AssistanceRequestResponse.from_orm(db_request)
 
 @router.get("/", response_model=List[AssistanceRequestResponse])
 async def get_assistance_requests(
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Get assistance requests based on user role."""
+    """Get assistance requests based on user role, newest first.
+    
+    At most `limit` requests are returned; when there are more, the
+    `X-Next-Cursor` response header holds a cursor for the next page.
+    `fields` (comma separated) returns only those fields of each request.
+    """
+    names = parse_fields(fields, REQUEST_FIELDS)
+    statement = projected_select(REQUEST_FIELDS, names) if names else select(AssistanceRequest)
     if current_user.role == "driver":
-        requests = db.query(AssistanceRequest).filter(
-            AssistanceRequest.requester_id == current_user.id
-        ).order_by(AssistanceRequest.created_at.desc()).all()
+        statement = statement.where(AssistanceRequest.requester_id == current_user.id)
     elif current_user.role == "service_provider":
-        requests = db.query(AssistanceRequest).filter(
-            AssistanceRequest.assigned_provider_id == current_user.id
-        ).order_by(AssistanceRequest.created_at.desc()).all()
-    else:
-        requests = db.query(AssistanceRequest).order_by(
-            AssistanceRequest.created_at.desc()
-        ).all()
+        statement = statement.where(AssistanceRequest.assigned_provider_id == current_user.id)
     
-    return [AssistanceRequestResponse.from_orm(request) for request in requests]
+    rows, next_cursor = await fetch_page(
+        db, statement, AssistanceRequest.created_at, AssistanceRequest.id, cursor, limit
+    )
+    if names:
+        return projected_response(rows, names, next_cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [AssistanceRequestResponse.from_orm(row[0]) for row in rows]
 
 @router.get("/available", response_model=List[AssistanceRequestResponse])
 async def get_available_requests(
-    current_user: User = Depends(require_service_provider),
-    db: Session = Depends(get_db)
+    response: Response,
+    since: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None),
+    current_user: Principal = Depends(require_service_provider),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Get all pending assistance requests available for pickup."""
-    requests = db.query(AssistanceRequest).filter(
-        AssistanceRequest.status == "pending"
-    ).order_by(AssistanceRequest.created_at.desc()).all()
+    """Get pending assistance requests offered to this provider or to nobody in particular.
+    
+    Responses carry an ETag; sending it back in If-None-Match gets 304 Not
+    Modified until the list has changed. With `since` set to the
+    X-Jobs-Version of an earlier response, only requests changed after it are
+    returned: in full if they are available, otherwise as `{id, status}` so
+    they can be dropped. X-Jobs-Delta is false when the full list was
+    returned instead, as it is when requests were deleted since the token.
+    """
+    # Both taken before reading, so a change made meanwhile is never skipped
+    etag = await _available_etag(db, current_user.id)
+    version = await _jobs_version(db)
+    headers = {"ETag": etag, JOBS_VERSION_HEADER: encode_cursor(version)}
+    tags = [tag.strip() for tag in if_none_match.split(",")] if if_none_match else []
+    if etag in tags or "*" in tags:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    changed = _changed_since(since, version, db.get_bind().dialect.name) if since else None
+    if changed is not None:
+        available = _available_to(current_user.id)
+        rows = (await db.execute(select(AssistanceRequest, available.label("available")).where(
+            changed
+        ).order_by(AssistanceRequest.created_at.desc()))).all()
+        items = [
+            jsonable_encoder(AssistanceRequestResponse.from_orm(request)) if is_available
+            else {"id": request.id, "status": request.status}
+            for request, is_available in rows
+        ]
+        return JSONResponse(jsonable_encoder(items), headers={**headers, JOBS_DELTA_HEADER: "true"})
+    
+    response.headers.update({**headers, JOBS_DELTA_HEADER: "false"})
+    requests = (await db.scalars(select(AssistanceRequest).where(
+        _available_to(current_user.id)
+    ).order_by(AssistanceRequest.created_at.desc()))).all()
     
     return [AssistanceRequestResponse.from_orm(request) for request in requests]
 
 @router.get("/{request_id}", response_model=AssistanceRequestResponse)
 async def get_assistance_request(
     request_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get a specific assistance request."""
-    request = db.query(AssistanceRequest).filter(
+    request = await db.scalar(select(AssistanceRequest).where(
         AssistanceRequest.id == request_id
-    ).first()
+    ))
     
     if not request:
         raise HTTPException(
@@ -120,13 +313,13 @@ async def get_assistance_request(
 async def update_assistance_request(
     request_id: int,
     request_data: AssistanceRequestUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update assistance request."""
-    request = db.query(AssistanceRequest).filter(
+    request = await db.scalar(select(AssistanceRequest).where(
         AssistanceRequest.id == request_id
-    ).first()
+    ))
     
     if not request:
         raise HTTPException(
@@ -147,67 +340,80 @@ async def update_assistance_request(
     for field, value in update_data.items():
         setattr(request, field, value)
     
-    db.commit()
-    db.refresh(request)
+    await db.commit()
+    await db.refresh(request)
+    
+    if "status" in update_data:
+        if request.status == AssistanceRequestStatus.PENDING and request.assigned_provider_id is None:
+            job_feed.opened(job_summary(request))
+        else:
+            job_feed.closed(job_summary(request))
     
     return AssistanceRequestResponse.from_orm(request)
 
 @router.put("/{request_id}/accept", response_model=AssistanceRequestResponse)
 async def accept_assistance_request(
     request_id: int,
-    current_user: User = Depends(require_service_provider),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_service_provider),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Accept an assistance request."""
-    request = db.query(AssistanceRequest).filter(
-        AssistanceRequest.id == request_id,
-        AssistanceRequest.status == "pending"
-    ).first()
+    # The conditional UPDATE settles concurrent accepts: only a pending request
+    # offered to this provider, or to nobody, can be taken, and only once
+    request = await _transition(db, request_id, (
+        _requests.c.status == AssistanceRequestStatus.PENDING,
+        or_(
+            _requests.c.assigned_provider_id == None,
+            _requests.c.assigned_provider_id == current_user.id
+        )
+    ), {
+        "status": AssistanceRequestStatus.ACCEPTED,
+        "assigned_provider_id": current_user.id,
+        "offer_expires_at": None
+    })
     
-    if not request:
+    if request is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Assistance request not found or already processed"
         )
     
-    request.status = "accepted"
-    request.assigned_provider_id = current_user.id
-    
-    # Update breakdown status
-    breakdown = db.query(Breakdown).filter(
-        Breakdown.id == request.breakdown_id
-    ).first()
-    if breakdown:
-        breakdown.status = "assigned"
-        breakdown.service_provider_id = current_user.id
-    
-    db.commit()
-    db.refresh(request)
+    # Update breakdown status in the same transaction
+    await db.execute(update(_breakdowns).where(_breakdowns.c.id == request.breakdown_id).values(
+        status=BreakdownStatus.ASSIGNED,
+        service_provider_id=current_user.id
+    ))
+    await db.commit()
+    dispatcher.resolve(request_id)
+    job_feed.closed(job_summary(request))
     
     return AssistanceRequestResponse.from_orm(request)
 
 @router.put("/{request_id}/reject", response_model=AssistanceRequestResponse)
 async def reject_assistance_request(
     request_id: int,
-    current_user: User = Depends(require_service_provider),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_service_provider),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Reject an assistance request."""
-    request = db.query(AssistanceRequest).filter(
-        AssistanceRequest.id == request_id,
-        AssistanceRequest.status == "pending"
-    ).first()
-    
-    if not request:
+    """Reject an assistance request, or decline the offer of one."""
+    # A declined offer goes to the next candidate; the request stays pending
+    if await dispatcher.decline(request_id, current_user.id, db):
+        request = (await db.execute(select(_requests).where(_requests.c.id == request_id))).first()
+        return AssistanceRequestResponse.from_orm(request)
+    
+    request = await _transition(db, request_id, (
+        _requests.c.status == AssistanceRequestStatus.PENDING,
+        _requests.c.assigned_provider_id == None
+    ), {"status": AssistanceRequestStatus.REJECTED})
+    
+    if request is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Assistance request not found or already processed"
         )
     
-    request.status = "rejected"
-    
-    db.commit()
-    db.refresh(request)
+    await db.commit()
+    job_feed.closed(job_summary(request))
     
     return AssistanceRequestResponse.from_orm(request)
 
@@ -215,40 +421,40 @@ async def reject_assistance_request(
 async def complete_assistance_request(
     request_id: int,
     completion_data: dict,
-    current_user: User = Depends(require_service_provider),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_service_provider),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Mark assistance request as completed."""
-    request = db.query(AssistanceRequest).filter(
-        AssistanceRequest.id == request_id,
-        AssistanceRequest.assigned_provider_id == current_user.id
-    ).first()
+    completed_at = datetime.utcnow()
+    values = {
+        "status": AssistanceRequestStatus.COMPLETED,
+        "actual_completion_time": completed_at
+    }
     
-    if not request:
+    if "actual_cost" in completion_data:
+        values["actual_cost"] = completion_data["actual_cost"]
+    
+    if "feedback" in completion_data:
+        values["feedback"] = completion_data["feedback"]
+    
+    # Only a job this provider accepted and has not completed yet
+    request = await _transition(db, request_id, (
+        _requests.c.assigned_provider_id == current_user.id,
+        _requests.c.status.in_((AssistanceRequestStatus.ACCEPTED, AssistanceRequestStatus.IN_PROGRESS))
+    ), values)
+    
+    if request is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Assistance request not found or not assigned to you"
         )
     
-    request.status = "completed"
-    request.actual_completion_time = datetime.utcnow()
-    
-    if "actual_cost" in completion_data:
-        request.actual_cost = completion_data["actual_cost"]
-    
-    if "feedback" in completion_data:
-        request.feedback = completion_data["feedback"]
-    
-    # Update breakdown status
-    breakdown = db.query(Breakdown).filter(
-        Breakdown.id == request.breakdown_id
-    ).first()
-    if breakdown:
-        breakdown.status = "completed"
-        breakdown.actual_completion_time = datetime.utcnow()
-        breakdown.is_resolved = True
-    
-    db.commit()
-    db.refresh(request)
+    # Update breakdown status in the same transaction
+    await db.execute(update(_breakdowns).where(_breakdowns.c.id == request.breakdown_id).values(
+        status=BreakdownStatus.COMPLETED,
+        actual_completion_time=completed_at,
+        is_resolved=True
+    ))
+    await db.commit()
     
     return AssistanceRequestResponse.from_orm(request)
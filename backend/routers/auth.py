@@ -1,12 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from datetime import timedelta
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
 
-from sqlalchemy import or_
-from database import get_db
-from models import User
-from schemas import UserCreate, UserResponse, LoginRequest, Token, UserLocationUpdate, MessageResponse
-from auth import get_password_hash, verify_password, create_access_token
+from sqlalchemy import bindparam, or_, select, update
+from database import get_async_db
+from models import User, Vehicle
+from schemas import (
+    UserCreate, UserResponse, LoginRequest, Token, UserLocationUpdate, MessageResponse,
+    BulkLocationItem, BulkLocationResult, BulkLocationResponse
+)
+from auth import Principal, get_current_active_user, get_password_hash_async, verify_password_async, create_access_token
+from json_lines import read_json_items
 
 import os
 
@@ -19,10 +25,10 @@ from auth import get_current_user
 router = APIRouter()
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserCreate, db: Session = Depends(get_db)):
+async def register(user_data: UserCreate, db: AsyncSession = Depends(get_async_db)):
     """Register a new user."""
     # Check if the user already exists
-    existing_user = db.query(User).filter(User.email == user_data.email).first()
+    existing_user = await db.scalar(select(User).where(User.email == user_data.email))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -30,36 +36,37 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
         )
     
     # Create a new user instance (ACTIVE immediately)
+    hashed_password = await get_password_hash_async(user_data.password)
     new_user = User(
         first_name=user_data.first_name,
         last_name=user_data.last_name,
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=hashed_password,
         phone=user_data.phone,
         role=user_data.role,
         is_active=True  # User is active immediately
     )
     
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
+    await db.refresh(new_user)
     
     return UserResponse.from_orm(new_user)
 
 
 @router.post("/login", response_model=Token)
-async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
+async def login(login_data: LoginRequest, db: AsyncSession = Depends(get_async_db)):
     """Login a user and return a JWT token."""
     try:
         print(f"[LOGIN] Attempting login for: {login_data.email}")
         
         # Check by email OR phone
-        db_user = db.query(User).filter(
+        db_user = await db.scalar(select(User).where(
             or_(
                 User.email == login_data.email,
                 User.phone == login_data.email
             )
-        ).first()
+        ))
         
         print(f"[LOGIN] User found: {db_user is not None}")
         
@@ -75,7 +82,7 @@ async def login(login_data: LoginRequest, db: Session = Depends(get_db)):
             hashed_pw = str(hashed_pw)
         
         print(f"[LOGIN] Verifying password...")
-        if not verify_password(login_data.password, hashed_pw):
+        if not await verify_password_async(login_data.password, hashed_pw):
             print(f"[LOGIN] Password verification failed")
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -114,15 +121,187 @@ async def get_current_user_info(current_user: User = Depends(get_current_user)):
 async def update_user_location(
     location_data: UserLocationUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update user's current location."""
     setattr(current_user, 'latitude', location_data.latitude)
     setattr(current_user, 'longitude', location_data.longitude)
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
     return MessageResponse(message="Location updated successfully")
 
+# Bulk position ingestion for fleets and IoT devices
+BULK_LOCATION_MAX_ITEMS = int(os.getenv("BULK_LOCATION_MAX_ITEMS", "5000"))
+BULK_LOCATION_BATCH_SIZE = 500
+
+_vehicles = Vehicle.__table__
+_users = User.__table__
+# A position not newer than the stored one (a client replaying a queue) is ignored
+UPDATE_VEHICLE_LOCATION = update(_vehicles).where(
+    _vehicles.c.id == bindparam("b_id"),
+    or_(_vehicles.c.last_location_update == None, _vehicles.c.last_location_update < bindparam("b_at"))
+).values(
+    latitude=bindparam("b_latitude"),
+    longitude=bindparam("b_longitude"),
+    last_location_update=bindparam("b_at"),
+)
+UPDATE_USER_LOCATION = update(_users).where(_users.c.id == bindparam("b_id")).values(
+    latitude=bindparam("b_latitude"),
+    longitude=bindparam("b_longitude"),
+)
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+async def _vehicle_location_times(db: AsyncSession, vehicle_ids: List[int]) -> Dict[int, datetime]:
+    """last_location_update of vehicles, a batch of ids per query."""
+    stored = {}
+    for i in range(0, len(vehicle_ids), BULK_LOCATION_BATCH_SIZE):
+        stored.update((await db.execute(
+            select(Vehicle.id, Vehicle.last_location_update)
+            .where(Vehicle.id.in_(vehicle_ids[i:i + BULK_LOCATION_BATCH_SIZE]))
+        )).all())
+    return stored
+
+@router.post("/update-locations", response_model=BulkLocationResponse)
+async def update_locations_bulk(
+    request: Request,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Update many device and user positions in one request.
+    
+    The body is a JSON array, or NDJSON (one object per line) sent with
+    Content-Type application/x-ndjson. Each item names either a `device_id`
+    (a vehicle's iot_device_id) or a `user_id`, plus latitude, longitude and
+    an optional recorded_at. Non-admins can update their own user and the
+    vehicles they own. When a target appears more than once, the newest
+    recorded_at wins (items without one count as now, later items win ties).
+    A vehicle position not newer than the one stored is reported `stale`
+    and not written.
+    
+    All accepted positions are written with one bulk UPDATE per table and a
+    single commit; `results` has a status for every item, by index.
+    """
+    raw_items = await read_json_items(request, BULK_LOCATION_MAX_ITEMS)
+    results: List[BulkLocationResult] = [None] * len(raw_items)
+    now = datetime.utcnow()
+    
+    valid: List[Tuple[int, BulkLocationItem]] = []
+    for index, raw in enumerate(raw_items):
+        if not isinstance(raw, dict):
+            results[index] = BulkLocationResult(index=index, status="invalid", detail="Item must be a JSON object")
+            continue
+        try:
+            item = BulkLocationItem(**raw)
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            results[index] = BulkLocationResult(index=index, status="invalid", detail=f"{field}: {error['msg']}")
+            continue
+        if (item.device_id is None) == (item.user_id is None):
+            results[index] = BulkLocationResult(index=index, status="invalid", detail="Give exactly one of device_id or user_id")
+            continue
+        valid.append((index, item))
+    
+    is_admin = current_user.role == "admin"
+    
+    # Resolve device ids to vehicles, a batch of ids per query
+    device_ids = sorted({item.device_id for _, item in valid if item.device_id is not None})
+    vehicles: Dict[str, Tuple[int, int]] = {}  # iot_device_id -> (vehicle id, owner id)
+    for i in range(0, len(device_ids), BULK_LOCATION_BATCH_SIZE):
+        rows = await db.execute(
+            select(Vehicle.iot_device_id, Vehicle.id, Vehicle.owner_id)
+            .where(Vehicle.iot_device_id.in_(device_ids[i:i + BULK_LOCATION_BATCH_SIZE]))
+        )
+        for device_id, vehicle_id, owner_id in rows:
+            vehicles[device_id] = (vehicle_id, owner_id)
+    
+    user_ids = sorted({item.user_id for _, item in valid if item.user_id is not None})
+    if is_admin:
+        known_users = set()
+        for i in range(0, len(user_ids), BULK_LOCATION_BATCH_SIZE):
+            known_users.update((await db.scalars(
+                select(User.id).where(User.id.in_(user_ids[i:i + BULK_LOCATION_BATCH_SIZE]))
+            )).all())
+    else:
+        known_users = {current_user.id}
+    
+    # Newest item per target
+    latest: Dict[Tuple[str, int], Tuple[tuple, int, BulkLocationItem]] = {}
+    for index, item in valid:
+        if item.device_id is not None:
+            vehicle = vehicles.get(item.device_id)
+            # Other owners' devices are reported as unknown, not forbidden
+            if vehicle is None or (not is_admin and vehicle[1] != current_user.id):
+                results[index] = BulkLocationResult(index=index, status="not_found", detail="Unknown device")
+                continue
+            target = ("vehicle", vehicle[0])
+        else:
+            if not is_admin and item.user_id != current_user.id:
+                results[index] = BulkLocationResult(index=index, status="forbidden", detail="Not enough permissions")
+                continue
+            if item.user_id not in known_users:
+                results[index] = BulkLocationResult(index=index, status="not_found", detail="Unknown user")
+                continue
+            target = ("user", item.user_id)
+        recorded_at = _as_utc(item.recorded_at) if item.recorded_at else now
+        order = (recorded_at, index)
+        previous = latest.get(target)
+        if previous is None or order > previous[0]:
+            if previous is not None:
+                results[previous[1]] = BulkLocationResult(index=previous[1], status="superseded")
+            latest[target] = (order, index, item)
+        else:
+            results[index] = BulkLocationResult(index=index, status="superseded")
+    
+    vehicle_rows = []
+    user_rows = []
+    vehicle_results = {}  # vehicle id -> index of the item written for it
+    for (kind, target_id), ((recorded_at, _), index, item) in latest.items():
+        row = {"b_id": target_id, "b_latitude": item.latitude, "b_longitude": item.longitude}
+        if kind == "vehicle":
+            row["b_at"] = recorded_at
+            vehicle_rows.append(row)
+            vehicle_results[target_id] = index
+        else:
+            user_rows.append(row)
+        results[index] = BulkLocationResult(index=index, status="updated")
+    
+    stale = set()
+    if vehicle_rows:
+        # Positions not newer than the stored one are left out up front; the
+        # UPDATE only matching older rows covers writes made meanwhile
+        stored = await _vehicle_location_times(db, [row["b_id"] for row in vehicle_rows])
+        for row in vehicle_rows:
+            current = stored.get(row["b_id"])
+            if current is not None and _as_utc(current) >= row["b_at"]:
+                stale.add(row["b_id"])
+        fresh = [row for row in vehicle_rows if row["b_id"] not in stale]
+        written = (await db.execute(UPDATE_VEHICLE_LOCATION, fresh)).rowcount if fresh else 0
+        if 0 <= written < len(fresh):
+            stored = await _vehicle_location_times(db, [row["b_id"] for row in fresh])
+            stale.update(
+                row["b_id"] for row in fresh
+                if stored.get(row["b_id"]) is not None and _as_utc(stored[row["b_id"]]) != row["b_at"]
+            )
+        for vehicle_id in stale:
+            index = vehicle_results[vehicle_id]
+            results[index] = BulkLocationResult(index=index, status="stale", detail="A newer position is stored")
+    if user_rows:
+        await db.execute(UPDATE_USER_LOCATION, user_rows)
+    if latest:
+        await db.commit()
+    
+    updated = len(latest) - len(stale)
+    return BulkLocationResponse(
+        updated=updated,
+        rejected=sum(1 for result in results if result.status not in ("updated", "superseded", "stale")),
+        results=results
+    )
+
 @router.post("/logout", response_model=MessageResponse)
 async def logout():
     """Logout user (client-side token removal)."""
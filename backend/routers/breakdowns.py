@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from datetime import datetime
 
-from database import get_db
+from database import get_async_db, get_async_read_db
 from models import User, Vehicle, Breakdown, BreakdownStatus
 from schemas import (
     BreakdownCreate, 
@@ -11,23 +12,38 @@ from schemas import (
     BreakdownUpdate,
     MessageResponse
 )
-from auth import get_current_user, require_driver
+from auth import Principal, get_current_principal, require_driver
+from cascade import delete_breakdown_rows
+from geo import PointArrays, bounding_box, longitude_between
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    fetch_page,
+    parse_fields,
+    projected_response,
+    projected_select,
+    projection_columns
+)
 
 router = APIRouter()
 
+# Fields that can be selected on their own with ?fields=
+BREAKDOWN_FIELDS = projection_columns(BreakdownResponse, Breakdown.__table__)
+
 @router.post("/", response_model=BreakdownResponse, status_code=status.HTTP_201_CREATED)
 async def report_breakdown(
     breakdown_data: BreakdownCreate,
-    current_user: User = Depends(require_driver),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_driver),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Report a new vehicle breakdown."""
     # Verify vehicle belongs to user
-    vehicle = db.query(Vehicle).filter(
+    vehicle = await db.scalar(select(Vehicle).where(
         Vehicle.id == breakdown_data.vehicle_id,
         Vehicle.owner_id == current_user.id,
         Vehicle.is_active == True
-    ).first()
+    ))
     
     if not vehicle:
         raise HTTPException(
@@ -52,8 +68,8 @@ async def report_breakdown(
         db_breakdown = Breakdown(**data)
         
         db.add(db_breakdown)
-        db.commit()
-        db.refresh(db_breakdown)
+        await db.commit()
+        await db.refresh(db_breakdown)
         
         return BreakdownResponse.from_orm(db_breakdown)
     except Exception as e:
@@ -66,26 +82,45 @@ async def report_breakdown(
 
 @router.get("/", response_model=List[BreakdownResponse])
 async def get_user_breakdowns(
-    current_user: User = Depends(require_driver),
-    db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: Principal = Depends(require_driver),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Get all breakdowns reported by the current user."""
-    breakdowns = db.query(Breakdown).filter(
-        Breakdown.driver_id == current_user.id
-    ).order_by(Breakdown.created_at.desc()).all()
+    """Get the breakdowns reported by the current user, newest first.
     
-    return [BreakdownResponse.from_orm(breakdown) for breakdown in breakdowns]
+    At most `limit` breakdowns are returned; when there are more, the
+    `X-Next-Cursor` response header holds a cursor for the next page.
+    `fields` (comma separated) returns only those fields of each breakdown.
+    """
+    names = parse_fields(fields, BREAKDOWN_FIELDS)
+    statement = projected_select(BREAKDOWN_FIELDS, names) if names else select(Breakdown)
+    rows, next_cursor = await fetch_page(
+        db,
+        statement.where(Breakdown.driver_id == current_user.id),
+        Breakdown.created_at,
+        Breakdown.id,
+        cursor,
+        limit
+    )
+    if names:
+        return projected_response(rows, names, next_cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [BreakdownResponse.from_orm(row[0]) for row in rows]
 
 @router.get("/{breakdown_id}", response_model=BreakdownResponse)
 async def get_breakdown(
     breakdown_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get a specific breakdown by ID."""
-    breakdown = db.query(Breakdown).filter(
+    breakdown = await db.scalar(select(Breakdown).where(
         Breakdown.id == breakdown_id
-    ).first()
+    ))
     
     if not breakdown:
         raise HTTPException(
@@ -107,13 +142,13 @@ async def get_breakdown(
 async def update_breakdown(
     breakdown_id: int,
     breakdown_data: BreakdownUpdate,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update breakdown information."""
-    breakdown = db.query(Breakdown).filter(
+    breakdown = await db.scalar(select(Breakdown).where(
         Breakdown.id == breakdown_id
-    ).first()
+    ))
     
     if not breakdown:
         raise HTTPException(
@@ -134,8 +169,8 @@ async def update_breakdown(
     for field, value in update_data.items():
         setattr(breakdown, field, value)
     
-    db.commit()
-    db.refresh(breakdown)
+    await db.commit()
+    await db.refresh(breakdown)
     
     return BreakdownResponse.from_orm(breakdown)
 
@@ -143,13 +178,13 @@ async def update_breakdown(
 async def update_breakdown_status(
     breakdown_id: int,
     status_data: dict,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update breakdown status."""
-    breakdown = db.query(Breakdown).filter(
+    breakdown = await db.scalar(select(Breakdown).where(
         Breakdown.id == breakdown_id
-    ).first()
+    ))
     
     if not breakdown:
         raise HTTPException(
@@ -181,8 +216,8 @@ async def update_breakdown_status(
         breakdown.actual_completion_time = datetime.utcnow()
         breakdown.is_resolved = True
     
-    db.commit()
-    db.refresh(breakdown)
+    await db.commit()
+    await db.refresh(breakdown)
     
     return BreakdownResponse.from_orm(breakdown)
 
@@ -191,36 +226,44 @@ async def get_nearby_breakdowns(
     latitude: float,
     longitude: float,
     radius: float = 10.0,  # kilometers
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Get breakdowns near a specific location."""
-    # This would require PostGIS or similar for proper geospatial queries
-    # For now, we'll use a simple bounding box approximation
-    breakdowns = db.query(Breakdown).filter(
-        Breakdown.status.in_([BreakdownStatus.REPORTED.value, BreakdownStatus.ASSIGNED.value])
-    ).all()
-    
-    # Filter by distance (simplified - in production, use proper geospatial queries)
-    nearby_breakdowns = []
-    for breakdown in breakdowns:
-        # Simple distance calculation (not accurate for large distances)
-        distance = ((breakdown.latitude - latitude) ** 2 + (breakdown.longitude - longitude) ** 2) ** 0.5
-        if distance <= radius / 111.0:  # Rough conversion: 1 degree ≈ 111 km
-            nearby_breakdowns.append(breakdown)
-    
-    return [BreakdownResponse.from_orm(breakdown) for breakdown in nearby_breakdowns]
+    """Get breakdowns near a specific location, sorted by distance."""
+    # Bounding-box prefilter in SQL, loading only ids and coordinates
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius)
+    rows = (await db.execute(select(Breakdown.id, Breakdown.latitude, Breakdown.longitude).where(
+        Breakdown.status.in_([BreakdownStatus.REPORTED.value, BreakdownStatus.ASSIGNED.value]),
+        Breakdown.latitude.between(min_lat, max_lat),
+        longitude_between(Breakdown.longitude, min_lon, max_lon)
+    ))).all()
+    
+    # Exact great-circle distance for every candidate in one vectorized pass
+    matches = PointArrays.from_rows(rows).within(latitude, longitude, radius)
+    if not matches:
+        return []
+    
+    breakdowns = (await db.scalars(select(Breakdown).where(
+        Breakdown.id.in_([breakdown_id for breakdown_id, _ in matches])
+    ))).all()
+    breakdowns_by_id = {breakdown.id: breakdown for breakdown in breakdowns}
+    
+    return [
+        BreakdownResponse.from_orm(breakdowns_by_id[breakdown_id])
+        for breakdown_id, _ in matches
+        if breakdown_id in breakdowns_by_id
+    ]
 
 @router.delete("/{breakdown_id}", response_model=MessageResponse)
 async def delete_breakdown(
     breakdown_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Delete a breakdown report."""
-    breakdown = db.query(Breakdown).filter(
+    """Delete a breakdown report and its assistance requests."""
+    breakdown = await db.scalar(select(Breakdown).where(
         Breakdown.id == breakdown_id
-    ).first()
+    ))
     
     if not breakdown:
         raise HTTPException(
@@ -235,7 +278,8 @@ async def delete_breakdown(
             detail="Not authorized to delete this breakdown"
         )
     
-    db.delete(breakdown)
-    db.commit()
+    deleted = await delete_breakdown_rows(db, breakdown_id)
+    await db.commit()
+    deleted.announce()
     
     return MessageResponse(message="Breakdown deleted successfully")
@@ -1,11 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import contains_eager, selectinload
+from typing import List, Optional
 from datetime import datetime
 import json
 
-from database import get_db
-from models import User, ServiceProvider
+from database import get_async_db, get_async_read_db
+from models import User, ServiceProvider, services_from_mask, services_to_mask
 from schemas import (
     ServiceProviderCreate, 
     ServiceProviderResponse, 
@@ -16,19 +18,44 @@ from schemas import (
     EarningsResponse,
     ServiceProviderAdminDetail
 )
-from auth import get_current_user, require_service_provider, require_admin, require_service_provider_any_status
+from auth import Principal, invalidate_principal, require_service_provider, require_admin, require_service_provider_any_status
+from cascade import delete_user_rows
+from geo import bounding_box, ensure_provider_index, longitude_between, sync_provider
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    decode_cursor,
+    encode_cursor,
+    fetch_page,
+    parse_fields,
+    projected_response,
+    projected_select,
+    projection_columns
+)
 
 router = APIRouter()
 
+# Fields that can be selected on their own with ?fields=; services come from
+# the bitmask and documents are stored as JSON text
+PROVIDER_FIELDS = {
+    **projection_columns(ServiceProviderResponse, ServiceProvider.__table__),
+    "services": ServiceProvider.services_mask,
+}
+PROVIDER_FIELD_CONVERTERS = {
+    "services": lambda mask: services_from_mask(mask or 0),
+    "documents": lambda documents: json.loads(documents) if documents else [],
+}
+
 # ... (Previous endpoints omitted)
 
 @router.get("/profile", response_model=ServiceProviderResponse)
 async def get_current_service_provider(
-    current_user: User = Depends(require_service_provider_any_status),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_service_provider_any_status),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get current service provider profile."""
-    profile = db.query(ServiceProvider).filter(ServiceProvider.user_id == current_user.id).first()
+    profile = await db.scalar(select(ServiceProvider).where(ServiceProvider.user_id == current_user.id))
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
     return profile
@@ -36,11 +63,11 @@ async def get_current_service_provider(
 @router.put("/profile", response_model=ServiceProviderResponse)
 async def update_current_service_provider(
     profile_data: ServiceProviderUpdate,
-    current_user: User = Depends(require_service_provider_any_status),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_service_provider_any_status),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update current service provider profile."""
-    profile = db.query(ServiceProvider).filter(ServiceProvider.user_id == current_user.id).first()
+    profile = await db.scalar(select(ServiceProvider).where(ServiceProvider.user_id == current_user.id))
     
     # Logic to map schema to model - assumes schema fields match model fields
     update_data = profile_data.dict(exclude_unset=True)
@@ -50,20 +77,16 @@ async def update_current_service_provider(
         profile = ServiceProvider(user_id=current_user.id, **update_data)
         
         # Defaults
-        if not profile.business_name: profile.business_name = current_user.first_name + "'s Business"
+        if not profile.business_name:
+            first_name = await db.scalar(select(User.first_name).where(User.id == current_user.id))
+            profile.business_name = first_name + "'s Business"
         if not profile.business_license: profile.business_license = f"TEMP-{current_user.id}"
         if not profile.latitude: profile.latitude = 0.0
         if not profile.longitude: profile.longitude = 0.0
         if not profile.base_rate: profile.base_rate = 500.0
         
-        # Handle services serialization
-        services_list = update_data.get('services', [])
-        # Provide default empty list if None, otherwise serialize
-        if services_list is None:
-            profile.services = json.dumps([])
-        else:
-            # Convert Enums to string values for JSON serialization
-            profile.services = json.dumps([s.value if hasattr(s, 'value') else s for s in services_list])
+        # Services are stored as a bitmask by the model's services setter
+        profile.services = update_data.get('services') or []
         
         # Handle documents serialization
         docs_list = update_data.get('documents', [])
@@ -76,62 +99,123 @@ async def update_current_service_provider(
     else:
         for k, v in update_data.items():
             # Handle list fields that need serialization to JSON string for Text columns
-            if k == 'services' and isinstance(v, list):
-                # Convert Enums to string values
-                serialized = json.dumps([s.value if hasattr(s, 'value') else s for s in v])
-                setattr(profile, k, serialized)
-            elif k == 'documents' and isinstance(v, list):
+            if k == 'documents' and isinstance(v, list):
                 setattr(profile, k, json.dumps(v))
             else:
                 setattr(profile, k, v)
     
-    db.commit()
-    db.refresh(profile)
+    await db.commit()
+    await db.refresh(profile)
+    sync_provider(profile)
     return profile
 
+@router.put("/location", response_model=MessageResponse)
+async def update_service_provider_location(
+    location_data: ServiceProviderLocationUpdate,
+    current_user: Principal = Depends(require_service_provider_any_status),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Update the current service provider's live location."""
+    profile = await db.scalar(select(ServiceProvider).where(ServiceProvider.user_id == current_user.id))
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
+    profile.current_latitude = location_data.latitude
+    profile.current_longitude = location_data.longitude
+    profile.last_location_update = datetime.utcnow()
+    
+    await db.commit()
+    sync_provider(profile)
+    return MessageResponse(message="Location updated successfully")
+
 @router.get("/nearby/{latitude}/{longitude}", response_model=List[ServiceProviderPublicResponse])
 async def get_nearby_service_providers(
     latitude: float,
     longitude: float,
+    response: Response,
     radius: float = 50.0,  # kilometers
     service_type: str = None,
-    db: Session = Depends(get_db)
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Get verified service providers near a specific location, sorted by distance."""
-    # ONLY get verified, active, and online providers
-    providers = db.query(ServiceProvider).join(User).filter(
-        ServiceProvider.is_active == True,
-        ServiceProvider.is_online == True,
-        ServiceProvider.is_verified == True  # ONLY VERIFIED PROVIDERS
-    ).all()
+    """Get the nearest verified service providers, sorted by distance.
+    
+    At most `limit` providers are returned. When more follow, the
+    `X-Next-Cursor` response header holds a cursor for the next ring of results.
+    """
+    after = decode_cursor(cursor, 2)
+    last_key = (float(after[0]), int(after[1])) if after else None
     
-    # Filter by distance and service type
+    # Service type filtering is a bitmask test, both in the index and in SQL
+    required_mask = services_to_mask([service_type]) if service_type else 0
+    if service_type and not required_mask:
+        return []
+    
+    # Candidates come from grid cells overlapping the search radius; great-circle
+    # distances for all of them are computed in one vectorized pass
+    candidates = (await ensure_provider_index(db)).query_points(latitude, longitude, radius, required_mask)
+    
+    # Bounding-box prefilter so far-away rows are never loaded
+    min_lat, max_lat, min_lon, max_lon = bounding_box(latitude, longitude, radius)
+    provider_lat = func.coalesce(ServiceProvider.current_latitude, ServiceProvider.latitude)
+    provider_lon = func.coalesce(ServiceProvider.current_longitude, ServiceProvider.longitude)
+    
+    # One provider past the page is looked up to tell whether another page follows
     nearby_providers = []
-    for provider in providers:
-        # Simple distance calculation
-        distance = ((provider.latitude - latitude) ** 2 + (provider.longitude - longitude) ** 2) ** 0.5
-        # 1 degree lat approx 111km
-        dist_km = distance * 111.0
+    keys = []
+    while len(nearby_providers) <= limit:
+        # Only the next k nearest are selected and hydrated; another round is
+        # needed only if the index was ahead of the database
+        batch = candidates.nearest(
+            latitude, longitude, radius,
+            limit + 1 - len(nearby_providers),
+            after=last_key
+        )
+        if not batch:
+            break
+        
+        # ONLY get verified, active, and online providers
+        providers = (await db.scalars(select(ServiceProvider).join(User).options(
+            contains_eager(ServiceProvider.user)
+        ).where(
+            ServiceProvider.id.in_([provider_id for provider_id, _ in batch]),
+            ServiceProvider.is_active == True,
+            ServiceProvider.is_online == True,
+            ServiceProvider.is_verified == True,  # ONLY VERIFIED PROVIDERS
+            ServiceProvider.services_mask.op("&")(required_mask) == required_mask,
+            provider_lat.between(min_lat, max_lat),
+            longitude_between(provider_lon, min_lon, max_lon)
+        ))).all()
+        providers_by_id = {provider.id: provider for provider in providers}
         
-        if dist_km <= radius:
-            if not service_type or service_type in provider.services:
-                # Create public response with user details
-                entry = ServiceProviderPublicResponse.from_orm(provider)
-                entry.first_name = provider.user.first_name
-                entry.last_name = provider.user.last_name
-                entry.phone = provider.user.phone
-                entry.distance = round(dist_km, 1)
-                nearby_providers.append(entry)
+        # Hydrate in distance order (nearest first)
+        for provider_id, dist_km in batch:
+            last_key = (dist_km, provider_id)
+            provider = providers_by_id.get(provider_id)
+            if provider is None:
+                continue
+            # Create public response with user details
+            entry = ServiceProviderPublicResponse(
+                **ServiceProviderResponse.from_orm(provider).dict(),
+                first_name=provider.user.first_name,
+                last_name=provider.user.last_name,
+                phone=provider.user.phone,
+                distance=round(dist_km, 1)
+            )
+            nearby_providers.append(entry)
+            keys.append(last_key)
     
-    # Sort by distance (nearest first)
-    nearby_providers.sort(key=lambda p: p.distance)
+    if len(nearby_providers) > limit:
+        nearby_providers = nearby_providers[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor(list(keys[limit - 1]))
     
     return nearby_providers
 
 @router.get("/earnings", response_model=EarningsResponse)
 async def get_provider_earnings(
-    current_user: User = Depends(require_service_provider),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_service_provider),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get service provider earnings (Dummy Data)."""
     # In a real app, this would aggregate from the database based on completed jobs
@@ -179,21 +263,40 @@ async def get_provider_earnings(
 
 @router.get("/", response_model=List[ServiceProviderAdminDetail])
 async def get_all_service_providers(
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Get all service providers (Admin only)."""
-    providers = db.query(ServiceProvider).all()
-    return providers
+    """Get all service providers (Admin only), newest first.
+    
+    At most `limit` providers are returned; when there are more, the
+    `X-Next-Cursor` response header holds a cursor for the next page.
+    `fields` (comma separated) returns only those fields of each provider,
+    without the nested user.
+    """
+    names = parse_fields(fields, PROVIDER_FIELDS)
+    if names:
+        statement = projected_select(PROVIDER_FIELDS, names)
+    else:
+        statement = select(ServiceProvider).options(selectinload(ServiceProvider.user))
+    rows, next_cursor = await fetch_page(db, statement, ServiceProvider.created_at, ServiceProvider.id, cursor, limit)
+    if names:
+        return projected_response(rows, names, next_cursor, PROVIDER_FIELD_CONVERTERS)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [row[0] for row in rows]
 
 @router.put("/{user_id}/approve", response_model=MessageResponse)
 async def approve_service_provider(
     user_id: int,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Approve a service provider and ensure profile exists."""
-    user = db.query(User).filter(User.id == user_id, User.role == "service_provider").first()
+    user = await db.scalar(select(User).where(User.id == user_id, User.role == "service_provider"))
     if not user:
         raise HTTPException(status_code=404, detail="Service provider user not found")
     
@@ -201,7 +304,7 @@ async def approve_service_provider(
     user.is_verified = True
     
     # 2. Check/Create Profile
-    profile = db.query(ServiceProvider).filter(ServiceProvider.user_id == user.id).first()
+    profile = await db.scalar(select(ServiceProvider).where(ServiceProvider.user_id == user.id))
     if not profile:
         profile = ServiceProvider(
             user_id=user.id,
@@ -218,21 +321,23 @@ async def approve_service_provider(
         profile.is_verified = True
         profile.is_active = True
         
-    db.commit()
+    await db.commit()
+    invalidate_principal(user_id)
+    sync_provider(profile)
     return MessageResponse(message="Service Provider approved successfully")
 
 @router.put("/{user_id}/suspend", response_model=MessageResponse)
 async def suspend_service_provider(
     user_id: int,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Suspend a service provider."""
-    user = db.query(User).filter(User.id == user_id, User.role == "service_provider").first()
+    user = await db.scalar(select(User).where(User.id == user_id, User.role == "service_provider"))
     if not user:
         raise HTTPException(status_code=404, detail="Service provider user not found")
     
-    profile = db.query(ServiceProvider).filter(ServiceProvider.user_id == user.id).first()
+    profile = await db.scalar(select(ServiceProvider).where(ServiceProvider.user_id == user.id))
     
     # Suspend user account
     user.is_active = False
@@ -244,27 +349,28 @@ async def suspend_service_provider(
         profile.is_verified = False
         profile.is_online = False
         
-    db.commit()
+    await db.commit()
+    invalidate_principal(user_id)
+    sync_provider(profile)
     return MessageResponse(message="Service Provider suspended successfully")
 
 @router.delete("/{user_id}", response_model=MessageResponse)
 async def delete_service_provider(
     user_id: int,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """Delete a service provider and their profile."""
-    user = db.query(User).filter(User.id == user_id, User.role == "service_provider").first()
+    """Delete a service provider and their profile.
+    
+    Requests and breakdowns assigned to the provider are kept, unassigned.
+    """
+    user = await db.scalar(select(User.id).where(User.id == user_id, User.role == "service_provider"))
     if not user:
         raise HTTPException(status_code=404, detail="Service provider user not found")
     
-    # Delete provider profile first (foreign key)
-    profile = db.query(ServiceProvider).filter(ServiceProvider.user_id == user.id).first()
-    if profile:
-        db.delete(profile)
-    
-    # Delete user
-    db.delete(user)
-    db.commit()
+    deleted = await delete_user_rows(db, user_id)
+    await db.commit()
+    invalidate_principal(user_id)
+    deleted.announce()
     
     return MessageResponse(message="Service Provider deleted successfully")
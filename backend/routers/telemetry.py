@@ -0,0 +1,204 @@
+from datetime import datetime, timezone
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Dict, List, Optional, Tuple
+
+import os
+
+from database import get_async_db, get_async_read_db
+from models import Vehicle, VehicleTelemetry, VehicleTelemetryRollup
+from schemas import (
+    TelemetryReadingIn,
+    TelemetryItemError,
+    TelemetryIngestResponse,
+    TelemetryReading,
+    TelemetryRollup
+)
+from auth import Principal, get_current_active_user
+from json_lines import read_json_items
+from telemetry import TELEMETRY_RING_SIZE, device_cache, now_ms, telemetry_pipeline
+
+router = APIRouter()
+
+TELEMETRY_MAX_ITEMS = int(os.getenv("TELEMETRY_MAX_ITEMS", "10000"))
+DEVICE_LOOKUP_BATCH_SIZE = 500
+MAX_HISTORY_LIMIT = 1000
+
+async def _resolve_devices(db: AsyncSession, device_ids) -> Dict[str, Tuple[int, int]]:
+    """Map iot_device_ids of active vehicles to (vehicle id, owner id)."""
+    found = {}
+    missing = []
+    for device_id in device_ids:
+        vehicle = device_cache.get(device_id)
+        if vehicle is None:
+            missing.append(device_id)
+        else:
+            found[device_id] = vehicle
+    for i in range(0, len(missing), DEVICE_LOOKUP_BATCH_SIZE):
+        rows = await db.execute(
+            select(Vehicle.iot_device_id, Vehicle.id, Vehicle.owner_id).where(
+                Vehicle.iot_device_id.in_(missing[i:i + DEVICE_LOOKUP_BATCH_SIZE]),
+                Vehicle.is_active == True
+            )
+        )
+        for device_id, vehicle_id, owner_id in rows:
+            found[device_id] = (vehicle_id, owner_id)
+            device_cache.set(device_id, (vehicle_id, owner_id))
+    return found
+
+async def _vehicle_for_device(db: AsyncSession, device_id: str, current_user: Principal) -> int:
+    vehicle = (await _resolve_devices(db, [device_id])).get(device_id)
+    if vehicle is None or (current_user.role != "admin" and vehicle[1] != current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Device not found"
+        )
+    return vehicle[0]
+
+def _to_ms(value: datetime) -> int:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+def _from_ms(value: int) -> datetime:
+    return datetime.fromtimestamp(value / 1000, tz=timezone.utc)
+
+def _reading_response(row) -> TelemetryReading:
+    return TelemetryReading(
+        recorded_at=_from_ms(row["ts"]),
+        latitude=row["latitude"],
+        longitude=row["longitude"],
+        speed=row["speed"],
+        battery_voltage=row["battery_voltage"],
+        engine_codes=row["engine_codes"].split(",") if row["engine_codes"] else []
+    )
+
+@router.post("/ingest", response_model=TelemetryIngestResponse, status_code=status.HTTP_202_ACCEPTED)
+async def ingest_telemetry(
+    request: Request,
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Accept a batch of IoT readings for the caller's vehicles.
+
+    The body is a JSON array, or NDJSON sent with Content-Type
+    application/x-ndjson, of readings naming a `device_id`. Accepted readings
+    are buffered and written in batches shortly after the response; only
+    rejected items are listed in `errors`, by index.
+    """
+    raw_items = await read_json_items(request, TELEMETRY_MAX_ITEMS)
+    errors: List[TelemetryItemError] = []
+    received_at = now_ms()
+
+    readings: List[Tuple[int, TelemetryReadingIn]] = []
+    for index, raw in enumerate(raw_items):
+        if not isinstance(raw, dict):
+            errors.append(TelemetryItemError(index=index, status="invalid", detail="Item must be a JSON object"))
+            continue
+        try:
+            readings.append((index, TelemetryReadingIn(**raw)))
+        except ValidationError as e:
+            error = e.errors()[0]
+            field = ".".join(str(part) for part in error["loc"])
+            errors.append(TelemetryItemError(index=index, status="invalid", detail=f"{field}: {error['msg']}"))
+
+    vehicles = await _resolve_devices(db, list({reading.device_id for _, reading in readings}))
+    is_admin = current_user.role == "admin"
+    accepted = 0
+    for index, reading in readings:
+        vehicle = vehicles.get(reading.device_id)
+        # Other owners' devices are reported as unknown, not forbidden
+        if vehicle is None or (not is_admin and vehicle[1] != current_user.id):
+            errors.append(TelemetryItemError(index=index, status="not_found", detail="Unknown device"))
+            continue
+        submitted = telemetry_pipeline.submit({
+            "vehicle_id": vehicle[0],
+            "ts": _to_ms(reading.recorded_at) if reading.recorded_at else received_at,
+            "latitude": reading.latitude,
+            "longitude": reading.longitude,
+            "speed": reading.speed,
+            "battery_voltage": reading.battery_voltage,
+            "engine_codes": ",".join(reading.engine_codes)[:255] if reading.engine_codes else None,
+        })
+        if not submitted:
+            errors.append(TelemetryItemError(index=index, status="backlog_full", detail="Ingestion backlog is full, retry later"))
+            continue
+        accepted += 1
+
+    errors.sort(key=lambda error: error.index)
+    return TelemetryIngestResponse(accepted=accepted, rejected=len(errors), errors=errors)
+
+@router.get("/{device_id}/latest", response_model=List[TelemetryReading])
+async def get_latest_telemetry(
+    device_id: str,
+    limit: int = Query(20, ge=1, le=TELEMETRY_RING_SIZE),
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Newest readings of a device, newest first.
+    
+    Readings ingested by any worker are read from the database; ones this
+    worker has not flushed yet are added from its buffer.
+    """
+    vehicle_id = await _vehicle_for_device(db, device_id, current_user)
+    result = await db.execute(
+        select(VehicleTelemetry.__table__)
+        .where(VehicleTelemetry.vehicle_id == vehicle_id)
+        .order_by(VehicleTelemetry.ts.desc())
+        .limit(limit)
+    )
+    readings = telemetry_pipeline.merge_latest(vehicle_id, result.mappings().all(), limit)
+    return [_reading_response(row) for row in readings]
+
+@router.get("/{device_id}/history")
+async def get_telemetry_history(
+    device_id: str,
+    since: datetime,
+    until: Optional[datetime] = None,
+    resolution: str = Query("raw", pattern="^(raw|rollup)$"),
+    limit: int = Query(500, ge=1, le=MAX_HISTORY_LIMIT),
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Readings of a device in a time range, oldest first.
+
+    `raw` covers the raw retention window; older data is only available as
+    `rollup` buckets.
+    """
+    vehicle_id = await _vehicle_for_device(db, device_id, current_user)
+    start = _to_ms(since)
+    end = _to_ms(until) if until else now_ms()
+    if resolution == "raw":
+        table = VehicleTelemetry.__table__
+        result = await db.execute(
+            select(table)
+            .where(table.c.vehicle_id == vehicle_id, table.c.ts >= start, table.c.ts < end)
+            .order_by(table.c.ts)
+            .limit(limit)
+        )
+        return [_reading_response(row) for row in result.mappings()]
+
+    table = VehicleTelemetryRollup.__table__
+    result = await db.execute(
+        select(table)
+        .where(table.c.vehicle_id == vehicle_id, table.c.bucket_ts >= start, table.c.bucket_ts < end)
+        .order_by(table.c.bucket_ts)
+        .limit(limit)
+    )
+    return [
+        TelemetryRollup(
+            bucket_start=_from_ms(row["bucket_ts"]),
+            bucket_seconds=row["bucket_seconds"],
+            samples=row["samples"],
+            latitude=row["latitude"],
+            longitude=row["longitude"],
+            avg_speed=row["avg_speed"],
+            max_speed=row["max_speed"],
+            min_battery_voltage=row["min_battery_voltage"],
+            avg_battery_voltage=row["avg_battery_voltage"],
+            fault_samples=row["fault_samples"] or 0
+        )
+        for row in result.mappings()
+    ]
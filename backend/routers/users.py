@@ -1,31 +1,61 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from database import get_db
+from database import get_async_db, get_async_read_db
 from models import User
 from schemas import UserResponse, UserUpdate, MessageResponse
-from auth import get_current_user, require_admin
+from auth import Principal, get_current_principal, get_current_user, invalidate_principal, require_admin
+from cascade import delete_user_rows
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    fetch_page,
+    parse_fields,
+    projected_response,
+    projected_select,
+    projection_columns
+)
 
 router = APIRouter()
 
+# Fields that can be selected on their own with ?fields=
+USER_FIELDS = projection_columns(UserResponse, User.__table__)
+
 @router.get("/", response_model=List[UserResponse])
 async def get_all_users(
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Get all users (admin only)."""
-    users = db.query(User).all()
-    return [UserResponse.from_orm(user) for user in users]
+    """Get all users (admin only), newest first.
+    
+    At most `limit` users are returned; when there are more, the
+    `X-Next-Cursor` response header holds a cursor for the next page.
+    `fields` (comma separated) returns only those fields of each user.
+    """
+    names = parse_fields(fields, USER_FIELDS)
+    statement = projected_select(USER_FIELDS, names) if names else select(User)
+    rows, next_cursor = await fetch_page(db, statement, User.created_at, User.id, cursor, limit)
+    if names:
+        return projected_response(rows, names, next_cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [UserResponse.from_orm(row[0]) for row in rows]
 
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user(
     user_id: int,
-    current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_principal),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get user by ID."""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     
     if not user:
         raise HTTPException(
@@ -46,26 +76,27 @@ async def get_user(
 async def update_user_profile(
     user_data: UserUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update current user's profile."""
     update_data = user_data.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(current_user, field, value)
     
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    invalidate_principal(current_user.id)
+    await db.refresh(current_user)
     
     return UserResponse.from_orm(current_user)
 
 @router.put("/{user_id}/deactivate", response_model=MessageResponse)
 async def deactivate_user(
     user_id: int,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Deactivate a user (admin only)."""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     
     if not user:
         raise HTTPException(
@@ -74,18 +105,19 @@ async def deactivate_user(
         )
     
     user.is_active = False
-    db.commit()
+    await db.commit()
+    invalidate_principal(user_id)
     
     return MessageResponse(message="User deactivated successfully")
 
 @router.put("/{user_id}/activate", response_model=MessageResponse)
 async def activate_user(
     user_id: int,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Activate a user (admin only)."""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     
     if not user:
         raise HTTPException(
@@ -94,18 +126,19 @@ async def activate_user(
         )
     
     user.is_active = True
-    db.commit()
+    await db.commit()
+    invalidate_principal(user_id)
     
     return MessageResponse(message="User activated successfully")
 
 @router.put("/{user_id}/suspend", response_model=MessageResponse)
 async def suspend_user(
     user_id: int,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Suspend a user account (admin only)."""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     
     if not user:
         raise HTTPException(
@@ -122,18 +155,19 @@ async def suspend_user(
     
     user.is_active = False
     user.is_verified = False  # Also unverify suspended users
-    db.commit()
+    await db.commit()
+    invalidate_principal(user_id)
     
     return MessageResponse(message="User suspended successfully")
 
 @router.delete("/{user_id}", response_model=MessageResponse)
 async def delete_user(
     user_id: int,
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a user account permanently (admin only)."""
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).where(User.id == user_id))
     
     if not user:
         raise HTTPException(
@@ -148,22 +182,25 @@ async def delete_user(
             detail="Cannot delete your own account"
         )
     
-    db.delete(user)
-    db.commit()
+    # Along with everything the user owns; see cascade.delete_user_rows
+    deleted = await delete_user_rows(db, user_id)
+    await db.commit()
+    invalidate_principal(user_id)
+    deleted.announce()
     
     return MessageResponse(message="User deleted successfully")
 
 @router.get("/stats/overview")
 async def get_user_stats(
-    current_user: User = Depends(require_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_admin),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get user statistics overview (admin only)."""
-    total_users = db.query(User).count()
-    active_users = db.query(User).filter(User.is_active == True).count()
-    drivers = db.query(User).filter(User.role == "driver", User.is_active == True).count()
-    service_providers = db.query(User).filter(User.role == "service_provider", User.is_active == True).count()
-    admins = db.query(User).filter(User.role == "admin", User.is_active == True).count()
+    total_users = await db.scalar(select(func.count(User.id)))
+    active_users = await db.scalar(select(func.count(User.id)).where(User.is_active == True))
+    drivers = await db.scalar(select(func.count(User.id)).where(User.role == "driver", User.is_active == True))
+    service_providers = await db.scalar(select(func.count(User.id)).where(User.role == "service_provider", User.is_active == True))
+    admins = await db.scalar(select(func.count(User.id)).where(User.role == "admin", User.is_active == True))
     
     return {
         "total_users": total_users,
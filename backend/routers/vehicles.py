@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 
-from database import get_db
+from database import get_async_db, get_async_read_db
 from models import User, Vehicle
 from schemas import (
     VehicleCreate, 
@@ -11,21 +12,35 @@ from schemas import (
     VehicleMileageUpdate,
     MessageResponse
 )
-from auth import get_current_user, require_driver
+from auth import Principal, require_driver
+from telemetry import device_cache_feed
+from pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    NEXT_CURSOR_HEADER,
+    fetch_page,
+    parse_fields,
+    projected_response,
+    projected_select,
+    projection_columns
+)
 
 router = APIRouter()
 
+# Fields that can be selected on their own with ?fields=
+VEHICLE_FIELDS = projection_columns(VehicleResponse, Vehicle.__table__)
+
 @router.post("/", response_model=VehicleResponse, status_code=status.HTTP_201_CREATED)
 async def create_vehicle(
     vehicle_data: VehicleCreate,
-    current_user: User = Depends(require_driver),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_driver),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Register a new vehicle."""
     # Check if license plate already exists
-    existing_vehicle = db.query(Vehicle).filter(
+    existing_vehicle = await db.scalar(select(Vehicle).where(
         Vehicle.license_plate == vehicle_data.license_plate
-    ).first()
+    ))
     if existing_vehicle:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -33,7 +48,7 @@ async def create_vehicle(
         )
     
     # Check if VIN already exists
-    existing_vin = db.query(Vehicle).filter(Vehicle.vin == vehicle_data.vin).first()
+    existing_vin = await db.scalar(select(Vehicle).where(Vehicle.vin == vehicle_data.vin))
     if existing_vin:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -47,36 +62,57 @@ async def create_vehicle(
     )
     
     db.add(db_vehicle)
-    db.commit()
-    db.refresh(db_vehicle)
+    await db.commit()
+    await db.refresh(db_vehicle)
     
     return VehicleResponse.from_orm(db_vehicle)
 
 @router.get("/", response_model=List[VehicleResponse])
 async def get_user_vehicles(
-    current_user: User = Depends(require_driver),
-    db: Session = Depends(get_db)
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: Principal = Depends(require_driver),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    """Get all vehicles owned by the current user."""
-    vehicles = db.query(Vehicle).filter(
-        Vehicle.owner_id == current_user.id,
-        Vehicle.is_active == True
-    ).all()
-    
-    return [VehicleResponse.from_orm(vehicle) for vehicle in vehicles]
+    """Get the vehicles owned by the current user, newest first.
+    
+    At most `limit` vehicles are returned; when there are more, the
+    `X-Next-Cursor` response header holds a cursor for the next page.
+    `fields` (comma separated) returns only those fields of each vehicle.
+    """
+    names = parse_fields(fields, VEHICLE_FIELDS)
+    statement = projected_select(VEHICLE_FIELDS, names) if names else select(Vehicle)
+    rows, next_cursor = await fetch_page(
+        db,
+        statement.where(
+            Vehicle.owner_id == current_user.id,
+            Vehicle.is_active == True
+        ),
+        Vehicle.created_at,
+        Vehicle.id,
+        cursor,
+        limit
+    )
+    if names:
+        return projected_response(rows, names, next_cursor)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return [VehicleResponse.from_orm(row[0]) for row in rows]
 
 @router.get("/{vehicle_id}", response_model=VehicleResponse)
 async def get_vehicle(
     vehicle_id: int,
-    current_user: User = Depends(require_driver),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_driver),
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Get a specific vehicle by ID."""
-    vehicle = db.query(Vehicle).filter(
+    vehicle = await db.scalar(select(Vehicle).where(
         Vehicle.id == vehicle_id,
         Vehicle.owner_id == current_user.id,
         Vehicle.is_active == True
-    ).first()
+    ))
     
     if not vehicle:
         raise HTTPException(
@@ -90,15 +126,15 @@ async def get_vehicle(
 async def update_vehicle(
     vehicle_id: int,
     vehicle_data: VehicleUpdate,
-    current_user: User = Depends(require_driver),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_driver),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update vehicle information."""
-    vehicle = db.query(Vehicle).filter(
+    vehicle = await db.scalar(select(Vehicle).where(
         Vehicle.id == vehicle_id,
         Vehicle.owner_id == current_user.id,
         Vehicle.is_active == True
-    ).first()
+    ))
     
     if not vehicle:
         raise HTTPException(
@@ -108,10 +144,10 @@ async def update_vehicle(
     
     # Check for duplicate license plate if being updated
     if vehicle_data.license_plate and vehicle_data.license_plate != vehicle.license_plate:
-        existing_vehicle = db.query(Vehicle).filter(
+        existing_vehicle = await db.scalar(select(Vehicle).where(
             Vehicle.license_plate == vehicle_data.license_plate,
             Vehicle.id != vehicle_id
-        ).first()
+        ))
         if existing_vehicle:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -120,10 +156,10 @@ async def update_vehicle(
     
     # Check for duplicate VIN if being updated
     if vehicle_data.vin and vehicle_data.vin != vehicle.vin:
-        existing_vin = db.query(Vehicle).filter(
+        existing_vin = await db.scalar(select(Vehicle).where(
             Vehicle.vin == vehicle_data.vin,
             Vehicle.id != vehicle_id
-        ).first()
+        ))
         if existing_vin:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
@@ -131,27 +167,30 @@ async def update_vehicle(
             )
     
     # Update vehicle
+    previous_device_id = vehicle.iot_device_id
     update_data = vehicle_data.dict(exclude_unset=True)
     for field, value in update_data.items():
         setattr(vehicle, field, value)
     
-    db.commit()
-    db.refresh(vehicle)
+    await db.commit()
+    await db.refresh(vehicle)
+    if previous_device_id:
+        device_cache_feed.invalidate(previous_device_id)
     
     return VehicleResponse.from_orm(vehicle)
 
 @router.delete("/{vehicle_id}", response_model=MessageResponse)
 async def delete_vehicle(
     vehicle_id: int,
-    current_user: User = Depends(require_driver),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_driver),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a vehicle (soft delete)."""
-    vehicle = db.query(Vehicle).filter(
+    vehicle = await db.scalar(select(Vehicle).where(
         Vehicle.id == vehicle_id,
         Vehicle.owner_id == current_user.id,
         Vehicle.is_active == True
-    ).first()
+    ))
     
     if not vehicle:
         raise HTTPException(
@@ -160,7 +199,9 @@ async def delete_vehicle(
         )
     
     vehicle.is_active = False
-    db.commit()
+    await db.commit()
+    if vehicle.iot_device_id:
+        device_cache_feed.invalidate(vehicle.iot_device_id)
     
     return MessageResponse(message="Vehicle deleted successfully")
 
@@ -168,15 +209,15 @@ async def delete_vehicle(
 async def update_vehicle_mileage(
     vehicle_id: int,
     mileage_data: VehicleMileageUpdate,
-    current_user: User = Depends(require_driver),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(require_driver),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Update vehicle mileage."""
-    vehicle = db.query(Vehicle).filter(
+    vehicle = await db.scalar(select(Vehicle).where(
         Vehicle.id == vehicle_id,
         Vehicle.owner_id == current_user.id,
         Vehicle.is_active == True
-    ).first()
+    ))
     
     if not vehicle:
         raise HTTPException(
@@ -185,7 +226,7 @@ async def update_vehicle_mileage(
         )
     
     vehicle.mileage = mileage_data.mileage
-    db.commit()
-    db.refresh(vehicle)
+    await db.commit()
+    await db.refresh(vehicle)
     
     return VehicleResponse.from_orm(vehicle)
@@ -93,6 +93,93 @@ class UserLocationUpdate(BaseModel):
     latitude: float
     longitude: float
 
+class BulkLocationItem(BaseModel):
+    device_id: Optional[str] = None  # Vehicle.iot_device_id
+    user_id: Optional[int] = None
+    latitude: float
+    longitude: float
+    recorded_at: Optional[datetime] = None
+
+    @validator('latitude')
+    def validate_latitude(cls, v):
+        if not -90 <= v <= 90:
+            raise ValueError('Latitude must be between -90 and 90')
+        return v
+
+    @validator('longitude')
+    def validate_longitude(cls, v):
+        if not -180 <= v <= 180:
+            raise ValueError('Longitude must be between -180 and 180')
+        return v
+
+class BulkLocationResult(BaseModel):
+    index: int
+    status: str  # updated | superseded | stale | invalid | not_found | forbidden
+    detail: Optional[str] = None
+
+class BulkLocationResponse(BaseModel):
+    updated: int
+    rejected: int
+    results: List[BulkLocationResult]
+
+# Telemetry Schemas
+class TelemetryReadingIn(BaseModel):
+    device_id: str  # Vehicle.iot_device_id
+    recorded_at: Optional[datetime] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    speed: Optional[float] = None  # km/h
+    battery_voltage: Optional[float] = None
+    engine_codes: Optional[List[str]] = None
+
+    @validator('latitude')
+    def validate_latitude(cls, v):
+        if v is not None and not -90 <= v <= 90:
+            raise ValueError('Latitude must be between -90 and 90')
+        return v
+
+    @validator('longitude')
+    def validate_longitude(cls, v):
+        if v is not None and not -180 <= v <= 180:
+            raise ValueError('Longitude must be between -180 and 180')
+        return v
+
+    @validator('speed')
+    def validate_speed(cls, v):
+        if v is not None and v < 0:
+            raise ValueError('Speed must be a positive number')
+        return v
+
+class TelemetryItemError(BaseModel):
+    index: int
+    status: str  # invalid | not_found | backlog_full
+    detail: Optional[str] = None
+
+class TelemetryIngestResponse(BaseModel):
+    accepted: int
+    rejected: int
+    errors: List[TelemetryItemError]
+
+class TelemetryReading(BaseModel):
+    recorded_at: datetime
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    speed: Optional[float] = None
+    battery_voltage: Optional[float] = None
+    engine_codes: List[str] = []
+
+class TelemetryRollup(BaseModel):
+    bucket_start: datetime
+    bucket_seconds: int
+    samples: int
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    avg_speed: Optional[float] = None
+    max_speed: Optional[float] = None
+    min_battery_voltage: Optional[float] = None
+    avg_battery_voltage: Optional[float] = None
+    fault_samples: int = 0
+
 # Vehicle Schemas
 class VehicleBase(BaseModel):
     make: str
@@ -132,6 +219,9 @@ class VehicleResponse(VehicleBase):
     owner_id: int
     last_service_date: datetime
     next_service_due: Optional[datetime]
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    last_location_update: Optional[datetime] = None
     is_active: bool
     created_at: datetime
     updated_at: Optional[datetime]
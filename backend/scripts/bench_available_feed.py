@@ -0,0 +1,172 @@
+"""Measure provider polling of GET /api/assistance/available.
+
+--providers providers poll the endpoint for --cycles rounds against a table
+of --pending open requests, while a new request is filed every
+--change-every rounds. Each provider polls in one of three ways:
+- full: a plain GET, the whole list every time
+- etag: If-None-Match with the last ETag, the whole list only after a change
+- since: ?since= with the last X-Jobs-Version, only the requests changed
+
+Reports the average time per poll, the response bytes and the SQL
+statements the polls cost. Drives the app in-process over httpx's ASGI
+transport against a scratch SQLite database.
+
+Run from the backend folder:
+    python scripts/bench_available_feed.py [--pending 2000] [--providers 20] [--cycles 20] [--change-every 5]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "vbams_bench_available_feed.db")
+os.environ["USE_SQLITE"] = "false"
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["DISPATCH_ENABLED"] = "false"
+for suffix in ("", "-wal", "-shm"):
+    if os.path.exists(DB_PATH + suffix):
+        os.remove(DB_PATH + suffix)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from sqlalchemy import event, insert, select
+
+import database
+from auth import create_access_token
+from database import AsyncReadSessionLocal, async_engine, engine
+from main import app
+from models import (
+    AssistanceRequest,
+    AssistanceRequestStatus,
+    Breakdown,
+    BreakdownCategory,
+    FuelType,
+    ServiceType,
+    User,
+    UserRole,
+    Vehicle,
+    VehicleType,
+)
+
+ORIGIN = (14.5995, 120.9842)  # Manila
+MODES = ("full", "etag", "since")
+
+
+def setup(pending, providers, breakdowns):
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {
+                "first_name": "Bench", "last_name": str(i), "email": f"bench{i}@example.com",
+                "hashed_password": "-", "phone": f"0917{i:07d}", "is_verified": True,
+                "role": UserRole.DRIVER if i == 0 else UserRole.SERVICE_PROVIDER,
+            }
+            for i in range(providers + 1)
+        ])
+        user_ids = [row[0] for row in conn.execute(select(User.id).order_by(User.id))]
+        vehicle_id = conn.execute(insert(Vehicle).values(
+            owner_id=user_ids[0], make="Toyota", model="Vios", year=2020, license_plate="BENCH-1",
+            vin="BENCH00000000001", color="red", vehicle_type=VehicleType.CAR, fuel_type=FuelType.GASOLINE
+        )).inserted_primary_key[0]
+        conn.execute(insert(Breakdown), [
+            {
+                "vehicle_id": vehicle_id, "driver_id": user_ids[0], "latitude": ORIGIN[0], "longitude": ORIGIN[1],
+                "address": "EDSA", "description": "Flat tire", "category": BreakdownCategory.TIRE,
+            }
+            for _ in range(pending + breakdowns)
+        ])
+        breakdown_ids = [row[0] for row in conn.execute(select(Breakdown.id).order_by(Breakdown.id))]
+        conn.execute(insert(AssistanceRequest), [
+            {
+                "breakdown_id": breakdown_id, "requester_id": user_ids[0], "service_type": ServiceType.TIRE_CHANGE,
+                "latitude": ORIGIN[0], "longitude": ORIGIN[1], "status": AssistanceRequestStatus.PENDING,
+                "address": "EDSA corner Ayala Avenue, Makati",
+            }
+            for breakdown_id in breakdown_ids[:pending]
+        ])
+    return user_ids[0], user_ids[1:], breakdown_ids[pending:]
+
+
+async def run(pending, providers, cycles, change_every):
+    driver_id, provider_ids, spare_breakdowns = setup(pending, providers, len(MODES) * cycles)
+    driver = {"Authorization": f"Bearer {create_access_token({'sub': str(driver_id)})}"}
+    headers = {
+        provider_id: {"Authorization": f"Bearer {create_access_token({'sub': str(provider_id)})}"}
+        for provider_id in provider_ids
+    }
+    statements = Counter()
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements["sql"] += 1
+
+    # GET endpoints may read through their own engine
+    for bind in {async_engine, AsyncReadSessionLocal.kw["bind"]}:
+        event.listen(bind.sync_engine, "before_cursor_execute", count_statement)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        # Warm up authentication caches so they do not count as statements
+        for provider_id in provider_ids:
+            (await client.get("/api/auth/me", headers=headers[provider_id])).raise_for_status()
+
+        print(f"{pending} pending requests, {providers} providers, {cycles} rounds, "
+              f"a new request every {change_every} round(s)")
+        print(f"{'mode':>6} {'ms/poll':>8} {'KB/poll':>8} {'stmts/poll':>11} {'304s':>6} {'rows/poll':>10}")
+        for mode in MODES:
+            state = {provider_id: {} for provider_id in provider_ids}
+            elapsed = 0.0
+            received = 0
+            rows = 0
+            not_modified = 0
+            polls = 0
+            statements.clear()
+            for cycle in range(cycles):
+                if cycle % change_every == 0:
+                    (await client.post("/api/assistance/", headers=driver, json={
+                        "breakdown_id": spare_breakdowns.pop(), "service_type": "tire_change",
+                        "latitude": ORIGIN[0], "longitude": ORIGIN[1],
+                    })).raise_for_status()
+                before = statements["sql"]
+                for provider_id in provider_ids:
+                    last = state[provider_id]
+                    params, extra = {}, {}
+                    if mode == "etag" and "etag" in last:
+                        extra["If-None-Match"] = last["etag"]
+                    if mode == "since" and "version" in last:
+                        params["since"] = last["version"]
+                    start = time.perf_counter()
+                    r = await client.get("/api/assistance/available", params=params,
+                                         headers={**headers[provider_id], **extra})
+                    elapsed += time.perf_counter() - start
+                    if r.status_code == 304:
+                        not_modified += 1
+                    else:
+                        r.raise_for_status()
+                        rows += len(r.json())
+                    received += len(r.content)
+                    last["etag"] = r.headers["ETag"]
+                    last["version"] = r.headers["X-Jobs-Version"]
+                    polls += 1
+                statements["polls"] += statements["sql"] - before
+            print(f"{mode:>6} {elapsed / polls * 1000:8.2f} {received / polls / 1024:8.1f} "
+                  f"{statements['polls'] / polls:11.2f} {not_modified:6} {rows / polls:10.1f}")
+    await database.dispose_async_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pending", type=int, default=2000)
+    parser.add_argument("--providers", type=int, default=20)
+    parser.add_argument("--cycles", type=int, default=20)
+    parser.add_argument("--change-every", type=int, default=5)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.pending, args.providers, args.cycles, args.change_every))
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(DB_PATH + suffix):
+                os.remove(DB_PATH + suffix)
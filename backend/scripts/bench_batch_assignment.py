@@ -0,0 +1,87 @@
+"""Compare greedy matching with min-cost assignment on synthetic request bursts.
+
+For each size n, n requests and n providers are drawn around Manila:
+- uniform: requests and providers spread evenly over a ~60 km square
+- spike: providers spread evenly, requests clustered around 3 incidents
+
+greedy takes requests in arrival order and gives each the nearest free
+provider, which is what offering requests one at a time amounts to. optimal
+solves the min-cost assignment on the same great-circle distance matrix
+with assignment.linear_sum_assignment. Times are per instance and exclude
+building the distance matrix, which is reported separately.
+
+Run from the backend folder:
+    python scripts/bench_batch_assignment.py [--sizes 100,250,500] [--trials 5]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from assignment import SOLVER, linear_sum_assignment
+from geo import haversine_matrix_km
+
+ORIGIN = (14.5995, 120.9842)  # Manila
+SPREAD_DEGREES = 0.27  # ~30 km either way
+
+
+def instance(rng, n, scenario):
+    providers = ORIGIN + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES, size=(n, 2))
+    if scenario == "uniform":
+        requests = ORIGIN + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES, size=(n, 2))
+    else:
+        incidents = ORIGIN + rng.uniform(-SPREAD_DEGREES, SPREAD_DEGREES, size=(3, 2))
+        requests = incidents[rng.integers(0, 3, size=n)] + rng.normal(0, 0.02, size=(n, 2))
+    return requests, providers
+
+
+def greedy(distances):
+    taken = np.zeros(distances.shape[1], dtype=bool)
+    cols = np.empty(distances.shape[0], dtype=np.int64)
+    for i, row in enumerate(distances):
+        j = int(np.argmin(np.where(taken, np.inf, row)))
+        taken[j] = True
+        cols[i] = j
+    return np.arange(distances.shape[0]), cols
+
+
+def run(sizes, trials, seed):
+    print(f"solver: {SOLVER}, {trials} trials per row, times in ms")
+    print(f"{'scenario':>8} {'n':>5} {'matrix':>8} {'greedy':>8} {'optimal':>8} "
+          f"{'greedy km':>10} {'optimal km':>11} {'saved':>7} {'greedy max':>11} {'optimal max':>12}")
+    for scenario in ("uniform", "spike"):
+        for n in sizes:
+            rng = np.random.default_rng(seed + n)
+            totals = {"matrix": 0.0, "greedy": 0.0, "optimal": 0.0, "greedy_km": 0.0, "optimal_km": 0.0,
+                      "greedy_max": 0.0, "optimal_max": 0.0}
+            for _ in range(trials):
+                requests, providers = instance(rng, n, scenario)
+                start = time.perf_counter()
+                distances = haversine_matrix_km(requests[:, 0], requests[:, 1], providers[:, 0], providers[:, 1])
+                totals["matrix"] += time.perf_counter() - start
+                for name, solve in (("greedy", greedy), ("optimal", linear_sum_assignment)):
+                    start = time.perf_counter()
+                    rows, cols = solve(distances)
+                    totals[name] += time.perf_counter() - start
+                    assert len(set(cols.tolist())) == n
+                    travelled = distances[rows, cols]
+                    totals[f"{name}_km"] += travelled.sum()
+                    totals[f"{name}_max"] += travelled.max()
+            avg = {key: value / trials for key, value in totals.items()}
+            saved = 1 - avg["optimal_km"] / avg["greedy_km"]
+            print(f"{scenario:>8} {n:5} {avg['matrix'] * 1000:8.1f} {avg['greedy'] * 1000:8.1f} "
+                  f"{avg['optimal'] * 1000:8.1f} {avg['greedy_km']:10,.0f} {avg['optimal_km']:11,.0f} "
+                  f"{saved:7.1%} {avg['greedy_max']:11.1f} {avg['optimal_max']:12.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="100,250,500")
+    parser.add_argument("--trials", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    run([int(size) for size in args.sizes.split(",")], args.trials, args.seed)
@@ -0,0 +1,146 @@
+"""Compare pushing fleet positions one request at a time against the bulk endpoint.
+
+A driver owns --devices vehicles with IoT device ids. Each mode pushes one
+position per device for --rounds rounds:
+- per-call: PUT /api/auth/update-location once per position, the only way
+  to report a position before the bulk endpoint
+- bulk-json / bulk-ndjson: POST /api/auth/update-locations with --batch
+  positions per request
+
+Drives the app in-process over httpx's ASGI transport against a scratch
+SQLite database.
+
+Run from the backend folder:
+    python scripts/bench_bulk_locations.py [--devices 500] [--rounds 4] [--batch 500]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "vbams_bulk_locations.db")
+os.environ["USE_SQLITE"] = "false"
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+for suffix in ("", "-wal", "-shm"):
+    if os.path.exists(DB_PATH + suffix):
+        os.remove(DB_PATH + suffix)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from sqlalchemy import insert
+
+import database
+from database import engine
+from main import app
+from models import FuelType, Vehicle, VehicleType
+
+ORIGIN = (14.5995, 120.9842)  # Manila
+
+
+async def setup(client, devices):
+    """Register a driver and give it a fleet of IoT-equipped vehicles."""
+    user = {
+        "first_name": "Fleet",
+        "last_name": "Operator",
+        "email": "fleet@example.com",
+        "phone": "09170000001",
+        "role": "driver",
+        "password": "fleet12345",
+    }
+    r = await client.post("/api/auth/register", json=user)
+    r.raise_for_status()
+    owner_id = r.json()["id"]
+    r = await client.post("/api/auth/login", json={"email": user["email"], "password": user["password"]})
+    r.raise_for_status()
+    with engine.begin() as conn:
+        conn.execute(insert(Vehicle), [
+            {
+                "owner_id": owner_id, "make": "Isuzu", "model": "Elf", "year": 2022,
+                "license_plate": f"FL-{i:05d}", "vin": f"FLEET{i:012d}", "color": "white",
+                "vehicle_type": VehicleType.TRUCK, "fuel_type": FuelType.DIESEL,
+                "iot_device_id": f"dev-{i:05d}",
+            }
+            for i in range(devices)
+        ])
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+
+def positions(devices, rounds):
+    rng = random.Random(devices)
+    return [
+        {
+            "device_id": f"dev-{i:05d}",
+            "latitude": ORIGIN[0] + rng.uniform(-0.5, 0.5),
+            "longitude": ORIGIN[1] + rng.uniform(-0.5, 0.5),
+        }
+        for _ in range(rounds)
+        for i in range(devices)
+    ]
+
+
+async def per_call(client, headers, items, batch):
+    for item in items:
+        r = await client.put("/api/auth/update-location", headers=headers, json={
+            "latitude": item["latitude"], "longitude": item["longitude"],
+        })
+        r.raise_for_status()
+    return len(items)
+
+
+async def bulk(client, headers, items, batch, ndjson):
+    requests = 0
+    for i in range(0, len(items), batch):
+        chunk = items[i:i + batch]
+        if ndjson:
+            body = "".join(json.dumps(item) + "\n" for item in chunk)
+            r = await client.post(
+                "/api/auth/update-locations",
+                headers={**headers, "Content-Type": "application/x-ndjson"},
+                content=body,
+            )
+        else:
+            r = await client.post("/api/auth/update-locations", headers=headers, json=chunk)
+        r.raise_for_status()
+        assert r.json()["updated"] == len(chunk), r.json()
+        requests += 1
+    return requests
+
+
+async def run(devices, rounds, batch):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        headers = await setup(client, devices)
+        items = positions(devices, rounds)
+        print(f"{devices} devices x {rounds} rounds = {len(items):,} positions, batch {batch}")
+        print(f"{'mode':>12} {'requests':>9} {'seconds':>8} {'positions/s':>12}")
+        modes = (
+            ("per-call", per_call),
+            ("bulk-json", lambda *args: bulk(*args, ndjson=False)),
+            ("bulk-ndjson", lambda *args: bulk(*args, ndjson=True)),
+        )
+        for name, push in modes:
+            start = time.perf_counter()
+            requests = await push(client, headers, items, batch)
+            elapsed = time.perf_counter() - start
+            print(f"{name:>12} {requests:9,} {elapsed:8.2f} {len(items) / elapsed:12,.0f}")
+    await database.dispose_async_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=500)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.devices, args.rounds, args.batch))
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(DB_PATH + suffix):
+                os.remove(DB_PATH + suffix)
@@ -0,0 +1,215 @@
+"""Measure how long a new assistance request waits for a provider.
+
+- polling: dispatch disabled; provider dashboards refresh
+  GET /api/assistance/available every --poll seconds (at random phases) and
+  race to accept the newest pending request
+- dispatch: the dispatcher offers each request to its best provider as it is
+  created; the provider accepts --react seconds after the offer arrives
+
+A driver files --requests requests, one every --interval seconds, around
+--providers verified, online towing providers. Latency is from the create
+call until the accept succeeded.
+
+Drives the app in-process over httpx's ASGI transport against a scratch
+SQLite database.
+
+Run from the backend folder:
+    python scripts/bench_dispatch.py [--providers 50] [--requests 50] [--poll 5] [--react 0]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "vbams_dispatch.db")
+os.environ["USE_SQLITE"] = "false"
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+for suffix in ("", "-wal", "-shm"):
+    if os.path.exists(DB_PATH + suffix):
+        os.remove(DB_PATH + suffix)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from sqlalchemy import delete, insert, select
+
+import database
+from auth import create_access_token
+from database import engine
+from dispatch import dispatcher
+from main import app
+from models import (
+    AssistanceRequest,
+    Breakdown,
+    BreakdownCategory,
+    FuelType,
+    ServiceProvider,
+    User,
+    UserRole,
+    Vehicle,
+    VehicleType,
+    services_to_mask,
+)
+
+ORIGIN = (14.5995, 120.9842)  # Manila
+
+
+def headers_for(user_id):
+    return {"Authorization": f"Bearer {create_access_token({'sub': str(user_id)})}"}
+
+
+def setup(providers, requests):
+    """Insert a driver with one breakdown per request, and the providers."""
+    rng = random.Random(providers)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {
+                "first_name": "Bench", "last_name": str(i), "email": f"user{i}@example.com",
+                "hashed_password": "-", "phone": f"0917{i:07d}",
+                "role": UserRole.DRIVER if i == 0 else UserRole.SERVICE_PROVIDER, "is_verified": True,
+            }
+            for i in range(providers + 1)
+        ])
+        user_ids = [row[0] for row in conn.execute(select(User.id).order_by(User.id))]
+        driver_id, provider_ids = user_ids[0], user_ids[1:]
+        conn.execute(insert(ServiceProvider), [
+            {
+                "user_id": user_id, "business_name": f"Tow {user_id}", "business_license": f"LIC-{user_id}",
+                "services_mask": services_to_mask(["towing"]), "service_radius": 50,
+                "latitude": ORIGIN[0] + rng.uniform(-0.3, 0.3), "longitude": ORIGIN[1] + rng.uniform(-0.3, 0.3),
+                "base_rate": 500.0, "average_rating": rng.uniform(3.5, 5.0), "rating_count": 10,
+                "is_verified": True, "is_active": True, "is_online": True,
+            }
+            for user_id in provider_ids
+        ])
+        vehicle_id = conn.execute(insert(Vehicle).values(
+            owner_id=driver_id, make="Toyota", model="Vios", year=2020, license_plate="BENCH-1",
+            vin="BENCH00000000001", color="red", vehicle_type=VehicleType.CAR, fuel_type=FuelType.GASOLINE
+        )).inserted_primary_key[0]
+        conn.execute(insert(Breakdown), [
+            {
+                "vehicle_id": vehicle_id, "driver_id": driver_id, "latitude": ORIGIN[0], "longitude": ORIGIN[1],
+                "address": "EDSA", "description": "Won't start", "category": BreakdownCategory.MECHANICAL,
+            }
+            for _ in range(requests)
+        ])
+        breakdown_ids = [row[0] for row in conn.execute(select(Breakdown.id).order_by(Breakdown.id))]
+    return driver_id, provider_ids, breakdown_ids
+
+
+def reset():
+    with engine.begin() as conn:
+        conn.execute(delete(AssistanceRequest))
+
+
+async def file_requests(client, driver, breakdown_ids, interval, created):
+    rng = random.Random(len(breakdown_ids))
+    for breakdown_id in breakdown_ids:
+        start = time.perf_counter()
+        r = await client.post("/api/assistance/", headers=driver, json={
+            "breakdown_id": breakdown_id,
+            "service_type": "towing",
+            "latitude": ORIGIN[0] + rng.uniform(-0.2, 0.2),
+            "longitude": ORIGIN[1] + rng.uniform(-0.2, 0.2),
+        })
+        r.raise_for_status()
+        created[r.json()["id"]] = start
+        await asyncio.sleep(interval)
+
+
+async def polling(client, driver, provider_ids, breakdown_ids, interval, poll, react):
+    dispatcher.enabled = False
+    created, accepted = {}, {}
+    counters = {"polls": 0, "conflicts": 0}
+
+    async def dashboard(user_id, headers):
+        await asyncio.sleep(random.uniform(0, poll))
+        while len(accepted) < len(breakdown_ids):
+            r = await client.get("/api/assistance/available", headers=headers)
+            r.raise_for_status()
+            counters["polls"] += 1
+            pending = r.json()
+            if pending:
+                await asyncio.sleep(react)
+                request_id = pending[0]["id"]
+                r = await client.put(f"/api/assistance/{request_id}/accept", headers=headers)
+                if r.status_code == 200:
+                    accepted[request_id] = time.perf_counter()
+                else:
+                    counters["conflicts"] += 1
+            await asyncio.sleep(poll)
+
+    dashboards = [asyncio.create_task(dashboard(user_id, headers_for(user_id))) for user_id in provider_ids]
+    await file_requests(client, driver, breakdown_ids, interval, created)
+    await asyncio.gather(*dashboards)
+    return created, accepted, counters
+
+
+async def dispatching(client, driver, provider_ids, breakdown_ids, interval, poll, react):
+    dispatcher.enabled = True
+    created, accepted = {}, {}
+    counters = {"polls": 0, "conflicts": 0}
+    headers = {user_id: headers_for(user_id) for user_id in provider_ids}
+    tasks = []
+
+    async def accept(user_id, request_id):
+        await asyncio.sleep(react)
+        r = await client.put(f"/api/assistance/{request_id}/accept", headers=headers[user_id])
+        if r.status_code == 200:
+            accepted[request_id] = time.perf_counter()
+        else:
+            counters["conflicts"] += 1
+
+    def on_offer(user_id, message):
+        message = json.loads(message)
+        if message["type"] == "job_offer":
+            tasks.append(asyncio.create_task(accept(user_id, message["request_id"])))
+
+    dispatcher.notify = on_offer
+    await file_requests(client, driver, breakdown_ids, interval, created)
+    # Requests nobody qualified for are left open and never accepted
+    while tasks or dispatcher.stats()["open_offers"]:
+        await asyncio.gather(*tasks)
+        tasks.clear()
+        await asyncio.sleep(0.01)
+    return created, accepted, counters
+
+
+async def run(providers, requests, interval, poll, react):
+    driver_id, provider_ids, breakdown_ids = setup(providers, requests)
+    driver = headers_for(driver_id)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        print(f"{providers} providers, {requests} requests every {interval}s, poll {poll}s, react {react}s")
+        print(f"{'mode':>9} {'accepted':>9} {'p50 ms':>9} {'p95 ms':>9} {'max ms':>9} {'polls':>6} {'conflicts':>10}")
+        for name, mode in (("polling", polling), ("dispatch", dispatching)):
+            reset()
+            created, accepted, counters = await mode(client, driver, provider_ids, breakdown_ids, interval, poll, react)
+            latencies = sorted((accepted[request_id] - created[request_id]) * 1000 for request_id in accepted)
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+            print(f"{name:>9} {len(accepted):9} {statistics.median(latencies):9.1f} {p95:9.1f} "
+                  f"{latencies[-1]:9.1f} {counters['polls']:6} {counters['conflicts']:10}")
+    await dispatcher.close()
+    await database.dispose_async_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--providers", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=50)
+    parser.add_argument("--interval", type=float, default=0.1)
+    parser.add_argument("--poll", type=float, default=5.0)
+    parser.add_argument("--react", type=float, default=0.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.providers, args.requests, args.interval, args.poll, args.react))
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(DB_PATH + suffix):
+                os.remove(DB_PATH + suffix)
@@ -0,0 +1,76 @@
+"""Compare the old per-row distance loop with the vectorized haversine engine.
+
+Run from the backend folder:
+    python scripts/bench_geo_distance.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo import PointArrays
+
+ORIGIN = (14.5995, 120.9842)  # Manila
+RADIUS_KM = 50.0
+REPEAT = 5
+
+
+def make_points(count):
+    rng = random.Random(count)
+    return [
+        (i, ORIGIN[0] + rng.uniform(-2.0, 2.0), ORIGIN[1] + rng.uniform(-2.0, 2.0))
+        for i in range(count)
+    ]
+
+
+def loop_nearby(points):
+    """The previous router implementation: flat degree distance, one row at a time."""
+    latitude, longitude = ORIGIN
+    nearby = []
+    for point_id, lat, lon in points:
+        distance = ((lat - latitude) ** 2 + (lon - longitude) ** 2) ** 0.5
+        dist_km = distance * 111.0
+        if dist_km <= RADIUS_KM:
+            nearby.append((point_id, round(dist_km, 1)))
+    nearby.sort(key=lambda p: p[1])
+    return nearby
+
+
+def vectorized_nearby(points):
+    """Rows packed into arrays on every call, as the breakdowns router does."""
+    return PointArrays.from_rows(points).within(ORIGIN[0], ORIGIN[1], RADIUS_KM)
+
+
+def prepacked_nearby(arrays):
+    """Coordinates already held in arrays, as the provider index supplies them."""
+    return arrays.within(ORIGIN[0], ORIGIN[1], RADIUS_KM)
+
+
+def best_of(func, points):
+    best = float("inf")
+    for _ in range(REPEAT):
+        start = time.perf_counter()
+        result = func(points)
+        best = min(best, time.perf_counter() - start)
+    return best, len(result)
+
+
+if __name__ == "__main__":
+    # Speedups are loop time over the numpy (pack + compute) and packed
+    # (compute only) columns
+    print(
+        f"{'points':>8} {'loop ms':>9} {'numpy ms':>9} {'packed ms':>10} "
+        f"{'numpy x':>8} {'packed x':>9} {'loop hits':>10} {'numpy hits':>10}"
+    )
+    for count in (1_000, 10_000, 100_000):
+        points = make_points(count)
+        loop_time, loop_hits = best_of(loop_nearby, points)
+        numpy_time, numpy_hits = best_of(vectorized_nearby, points)
+        packed_time, _ = best_of(prepacked_nearby, PointArrays.from_rows(points))
+        print(
+            f"{count:>8} {loop_time * 1000:>9.2f} {numpy_time * 1000:>9.2f} {packed_time * 1000:>10.2f} "
+            f"{loop_time / numpy_time:>7.1f}x {loop_time / packed_time:>8.1f}x {loop_hits:>10} {numpy_hits:>10}"
+        )
+    print("Hit counts differ because the loop uses a flat-earth approximation.")
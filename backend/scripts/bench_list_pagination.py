@@ -0,0 +1,193 @@
+"""Measure the admin assistance request list as the table grows.
+
+Fills a scratch SQLite database with --rows assistance requests and times
+GET /api/assistance/ as an admin:
+- whole table: every row loaded and serialised, as the endpoint did before
+  it was paginated (replayed with an ORM session, not over HTTP)
+- first page / deep page: one page of --limit rows, at the start and after
+  --depth pages, by keyset cursor
+- OFFSET deep page: the same deep page selected with LIMIT/OFFSET, for
+  comparison (query only)
+- projected page: one page with fields=id,status,created_at
+
+Drives the app in-process over httpx's ASGI transport.
+
+Run from the backend folder:
+    python scripts/bench_list_pagination.py [--rows 200000] [--limit 100] [--depth 1000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "vbams_bench_list_pagination.db")
+os.environ["USE_SQLITE"] = "false"
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+for suffix in ("", "-wal", "-shm"):
+    if os.path.exists(DB_PATH + suffix):
+        os.remove(DB_PATH + suffix)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import insert, select, text
+
+import database
+from auth import create_access_token
+from database import AsyncReadSessionLocal, engine
+from main import app
+from models import (
+    AssistanceRequest,
+    AssistanceRequestStatus,
+    Breakdown,
+    BreakdownCategory,
+    FuelType,
+    ServiceType,
+    User,
+    UserRole,
+    Vehicle,
+    VehicleType,
+)
+from schemas import AssistanceRequestResponse
+
+ORIGIN = (14.5995, 120.9842)  # Manila
+BATCH = 20000
+
+
+def setup(rows):
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {
+                "first_name": "Bench", "last_name": role.value, "email": f"bench-{role.value}@example.com",
+                "hashed_password": "-", "phone": f"0917000000{i}", "is_verified": True, "role": role,
+            }
+            for i, role in enumerate((UserRole.ADMIN, UserRole.DRIVER))
+        ])
+        admin_id, driver_id = [row[0] for row in conn.execute(select(User.id).order_by(User.id))]
+        vehicle_id = conn.execute(insert(Vehicle).values(
+            owner_id=driver_id, make="Toyota", model="Vios", year=2020, license_plate="BENCH-1",
+            vin="BENCH00000000001", color="red", vehicle_type=VehicleType.CAR, fuel_type=FuelType.GASOLINE
+        )).inserted_primary_key[0]
+        breakdown_id = conn.execute(insert(Breakdown).values(
+            vehicle_id=vehicle_id, driver_id=driver_id, latitude=ORIGIN[0], longitude=ORIGIN[1],
+            address="EDSA", description="Flat tire", category=BreakdownCategory.TIRE,
+        )).inserted_primary_key[0]
+        # Several requests per second, so pages end in the middle of ties
+        start = datetime(2025, 1, 1)
+        for first in range(0, rows, BATCH):
+            conn.execute(insert(AssistanceRequest), [
+                {
+                    "breakdown_id": breakdown_id, "requester_id": driver_id, "service_type": ServiceType.TIRE_CHANGE,
+                    "latitude": ORIGIN[0], "longitude": ORIGIN[1], "status": AssistanceRequestStatus.COMPLETED,
+                    "address": "EDSA corner Ayala Avenue, Makati", "created_at": start + timedelta(seconds=i // 4),
+                }
+                for i in range(first, min(first + BATCH, rows))
+            ])
+    return admin_id
+
+
+async def timed(client, headers, params, repeat=3):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        r = await client.get("/api/assistance/", headers=headers, params=params)
+        elapsed = time.perf_counter() - start
+        r.raise_for_status()
+        best = elapsed if best is None else min(best, elapsed)
+    return best, r
+
+
+async def whole_table():
+    start = time.perf_counter()
+    async with AsyncReadSessionLocal() as db:
+        requests = (await db.scalars(select(AssistanceRequest).order_by(
+            AssistanceRequest.created_at.desc()
+        ))).all()
+        body = json.dumps(jsonable_encoder(
+            [AssistanceRequestResponse.from_orm(request) for request in requests]
+        )).encode()
+    return time.perf_counter() - start, len(body), len(requests)
+
+
+def offset_query(limit, offset):
+    with engine.connect() as conn:
+        start = time.perf_counter()
+        conn.execute(
+            select(AssistanceRequest.__table__)
+            .order_by(AssistanceRequest.created_at.desc(), AssistanceRequest.id.desc())
+            .limit(limit).offset(offset)
+        ).all()
+        return time.perf_counter() - start
+
+
+async def run(rows, limit, depth):
+    start = time.perf_counter()
+    admin_id = setup(rows)
+    print(f"{rows:,} assistance requests inserted in {time.perf_counter() - start:.1f}s")
+    headers = {"Authorization": f"Bearer {create_access_token({'sub': str(admin_id)})}"}
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        (await client.get("/api/auth/me", headers=headers)).raise_for_status()
+        results = []
+
+        elapsed, size, count = await whole_table()
+        results.append(("whole table (replayed)", elapsed, size, count))
+
+        elapsed, r = await timed(client, headers, {"limit": limit})
+        results.append(("first page", elapsed, len(r.content), len(r.json())))
+
+        # Walk to the deep page by cursor
+        cursor = None
+        for _ in range(depth):
+            r = await client.get("/api/assistance/", headers=headers,
+                                 params={"limit": limit, "fields": "id", **({"cursor": cursor} if cursor else {})})
+            cursor = r.headers.get("X-Next-Cursor")
+            if not cursor:
+                break
+        elapsed, r = await timed(client, headers, {"limit": limit, "cursor": cursor})
+        results.append((f"page {depth + 1} (keyset)", elapsed, len(r.content), len(r.json())))
+        keyset_ids = [item["id"] for item in r.json()]
+
+        results.append((f"page {depth + 1} (OFFSET, query)", offset_query(limit, depth * limit), 0, limit))
+        with engine.connect() as conn:
+            offset_ids = [row[0] for row in conn.execute(
+                select(AssistanceRequest.id)
+                .order_by(AssistanceRequest.created_at.desc(), AssistanceRequest.id.desc())
+                .limit(limit).offset(depth * limit)
+            )]
+        assert keyset_ids == offset_ids, "keyset and OFFSET pages differ"
+
+        elapsed, r = await timed(client, headers, {"limit": limit, "fields": "id,status,created_at"})
+        results.append(("projected page", elapsed, len(r.content), len(r.json())))
+
+    with engine.connect() as conn:
+        plan = conn.execute(text(
+            "EXPLAIN QUERY PLAN SELECT id FROM assistance_requests "
+            "ORDER BY created_at DESC, id DESC LIMIT 100"
+        )).all()
+    print("plan:", "; ".join(row[-1] for row in plan))
+    print(f"{'request':>28} {'ms':>9} {'KB':>9} {'rows':>8}")
+    for name, elapsed, size, count in results:
+        print(f"{name:>28} {elapsed * 1000:9.1f} {size / 1024:9.1f} {count:8}")
+    await database.dispose_async_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--depth", type=int, default=1000)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.rows, args.limit, args.depth))
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(DB_PATH + suffix):
+                os.remove(DB_PATH + suffix)
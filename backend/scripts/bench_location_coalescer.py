@@ -0,0 +1,108 @@
+"""Compare relaying every location fix with the tick-based LocationCoalescer.
+
+Providers emit GPS fixes at --emit-hz into their breakdown rooms, each
+watched by a few clients; some providers are parked and only jitter below the
+quantization step. Each mode runs in real time for --seconds, and the
+messages and bytes handed to the sockets are counted.
+
+Run from the backend folder:
+    python scripts/bench_location_coalescer.py [--providers 200] [--seconds 5]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from websocket_manager import ConnectionManager, LocationCoalescer
+
+WATCHERS_PER_ROOM = 5
+PARKED_SHARE = 0.3
+
+
+class CountingSocket:
+    def __init__(self, totals):
+        self.totals = totals
+
+    scope = {}
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def send_text(self, message):
+        self.totals["messages"] += 1
+        self.totals["bytes"] += len(message)
+
+
+async def simulate(providers, seconds, emit_hz, tick_hz, precision, skip_unchanged):
+    totals = {"messages": 0, "bytes": 0}
+    manager = ConnectionManager()
+    manager.locations = LocationCoalescer(manager, tick_hz=tick_hz, precision=precision, skip_unchanged=skip_unchanged)
+    rng = random.Random(providers)
+    positions = {}
+    for p in range(providers):
+        room = f"breakdown_{p}"
+        sender = f"provider-{p}"
+        await manager.connect(CountingSocket(totals), sender)
+        for w in range(WATCHERS_PER_ROOM):
+            watcher = f"watcher-{p}-{w}"
+            await manager.connect(CountingSocket(totals), watcher)
+            await manager.join_room(watcher, room)
+        parked = rng.random() < PARKED_SHARE
+        positions[sender] = [room, 14.5 + rng.random(), 120.9 + rng.random(), parked]
+
+    interval = 1.0 / emit_hz
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    for step in range(int(seconds * emit_hz)):
+        for sender, state in positions.items():
+            room, lat, lon, parked = state
+            # Moving providers cover ~10 m per fix; parked ones only jitter
+            spread = 0.000001 if parked else 0.0001
+            state[1] = lat + rng.uniform(-spread, spread)
+            state[2] = lon + rng.uniform(-spread, spread)
+            data = {"type": "location_update", "room": room, "latitude": state[1], "longitude": state[2]}
+            manager.locations.submit(sender, room, data)
+        await asyncio.sleep(max(0.0, start + (step + 1) * interval - time.perf_counter()))
+    manager.locations.flush()
+    await asyncio.sleep(0.1)
+    cpu = time.process_time() - cpu_start
+
+    for client_id in list(manager.active_connections):
+        manager.disconnect(client_id)
+    return totals, manager.locations.stats(), cpu
+
+
+async def main(providers, seconds, emit_hz):
+    print(f"{providers} providers at {emit_hz:g} Hz, {WATCHERS_PER_ROOM} watchers each, "
+          f"{seconds:g} s per mode")
+    print(f"{'mode':>26} {'fixes in':>9} {'relayed':>8} {'socket msgs':>12} {'socket KB':>10} {'cpu s':>7}")
+    modes = (
+        ("relay every fix", 0, None, False),
+        ("2 Hz tick", 2, None, False),
+        ("2 Hz tick, 5 dp, skip same", 2, 5, True),
+    )
+    for name, tick_hz, precision, skip in modes:
+        stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+        try:
+            totals, stats, cpu = await simulate(providers, seconds, emit_hz, tick_hz, precision, skip)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        print(f"{name:>26} {stats['received']:9d} {stats['relayed']:8d} {totals['messages']:12d} "
+              f"{totals['bytes'] / 1024:10.0f} {cpu:7.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--providers", type=int, default=200)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--emit-hz", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.providers, args.seconds, args.emit_hz))
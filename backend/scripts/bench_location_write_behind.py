@@ -0,0 +1,118 @@
+"""Compare persisting provider GPS fixes one commit at a time against write-behind.
+
+--providers devices each report at --hz for --seconds of simulated time.
+"per-fix" runs one UPDATE and commit per fix, like PUT
+/api/service-providers/location. "write-behind" records every fix in a
+ProviderLocationWriter and flushes once per --interval of simulated time.
+Both run against a scratch SQLite database with the app's engine settings.
+
+Run from the backend folder:
+    python scripts/bench_location_write_behind.py [--providers 500] [--hz 1] [--seconds 30] [--interval 5]
+"""
+from datetime import datetime
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "vbams_write_behind.db")
+os.environ["USE_SQLITE"] = "false"
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+for suffix in ("", "-wal", "-shm"):
+    if os.path.exists(DB_PATH + suffix):
+        os.remove(DB_PATH + suffix)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import insert
+
+import database
+from database import AsyncSessionLocal, Base, engine
+from location_writer import UPDATE_PROVIDER_LOCATION, ProviderLocationWriter
+from models import ServiceProvider, User, UserRole
+
+ORIGIN = (14.5995, 120.9842)  # Manila
+
+
+def seed(providers):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {
+                "id": i, "first_name": "P", "last_name": str(i), "email": f"p{i}@example.com",
+                "hashed_password": "-", "phone": "0", "role": UserRole.SERVICE_PROVIDER,
+            }
+            for i in range(1, providers + 1)
+        ])
+        conn.execute(insert(ServiceProvider), [
+            {
+                "user_id": i, "business_name": f"Provider {i}", "business_license": f"L-{i}",
+                "latitude": ORIGIN[0], "longitude": ORIGIN[1], "base_rate": 500.0,
+            }
+            for i in range(1, providers + 1)
+        ])
+
+
+def fixes(providers, hz, seconds):
+    """(tick, user_id, latitude, longitude) in report order."""
+    rng = random.Random(providers)
+    ticks = int(hz * seconds)
+    for tick in range(ticks):
+        for user_id in range(1, providers + 1):
+            yield tick / hz, user_id, ORIGIN[0] + rng.uniform(-0.5, 0.5), ORIGIN[1] + rng.uniform(-0.5, 0.5)
+
+
+async def per_fix(stream):
+    commits = 0
+    for _, user_id, latitude, longitude in stream:
+        async with AsyncSessionLocal() as db:
+            await db.execute(UPDATE_PROVIDER_LOCATION, [{
+                "b_user_id": user_id, "b_latitude": latitude, "b_longitude": longitude, "b_at": datetime.utcnow(),
+            }])
+            await db.commit()
+        commits += 1
+    return commits, commits
+
+
+async def write_behind(stream, interval):
+    # Flushes are driven by simulated time; the writer's own timer is not started
+    writer = ProviderLocationWriter(interval=3600)
+    next_flush = interval
+    for at, user_id, latitude, longitude in stream:
+        if at >= next_flush:
+            await writer.flush()
+            next_flush += interval
+        writer.record(user_id, latitude, longitude)
+    await writer.close()
+    return writer.flushes, writer.rows_written
+
+
+async def main(providers, hz, seconds, interval):
+    seed(providers)
+    total = int(hz * seconds) * providers
+    print(f"{providers} providers x {hz:g} Hz x {seconds:g} s = {total:,} fixes, flush every {interval:g} s")
+    print(f"{'mode':>12} {'seconds':>8} {'fixes/s':>10} {'commits':>8} {'rows':>8}")
+    for name in ("per-fix", "write-behind"):
+        stream = fixes(providers, hz, seconds)
+        start = time.perf_counter()
+        if name == "per-fix":
+            commits, rows = await per_fix(stream)
+        else:
+            commits, rows = await write_behind(stream, interval)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>12} {elapsed:8.2f} {total / elapsed:10,.0f} {commits:8,} {rows:8,}")
+    await database.dispose_async_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--providers", type=int, default=500)
+    parser.add_argument("--hz", type=float, default=1.0)
+    parser.add_argument("--seconds", type=float, default=30.0)
+    parser.add_argument("--interval", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.providers, args.hz, args.seconds, args.interval))
@@ -0,0 +1,104 @@
+"""Measure room fan-out latency with one slow receiver in the room.
+
+Fake sockets record when each message reaches them. One member takes
+--slow-ms per send (a phone on a bad link); the rest send instantly. The old
+sequential send_to_room is compared with the queued ConnectionManager.
+
+Run from the backend folder:
+    python scripts/bench_room_fanout.py [--members 100] [--messages 20] [--slow-ms 250]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from websocket_manager import ConnectionManager
+
+ROOM = "breakdown_1"
+INTERVAL = 0.02
+
+
+class FakeSocket:
+    def __init__(self, delay, latencies):
+        self.delay = delay
+        self.latencies = latencies
+
+    scope = {}
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def send_text(self, message):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        self.latencies.append(time.perf_counter() - float(message))
+
+
+async def sequential_send_to_room(manager, message, room):
+    """The previous send_to_room: one awaited send per member, in turn."""
+    for client_id in manager.rooms.members(room):
+        await manager.active_connections[client_id].websocket.send_text(message)
+
+
+async def run(queued, members, messages, slow_delay):
+    manager = ConnectionManager()
+    fast, slow = [], []
+    for i in range(members):
+        latencies = slow if i == 0 else fast
+        socket = FakeSocket(slow_delay if i == 0 else 0, latencies)
+        await manager.connect(socket, f"client-{i}")
+        await manager.join_room(f"client-{i}", ROOM)
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        message = repr(time.perf_counter())
+        if queued:
+            await manager.send_to_room(message, ROOM)
+        else:
+            await sequential_send_to_room(manager, message, ROOM)
+        await asyncio.sleep(INTERVAL)
+    broadcast_time = time.perf_counter() - start
+
+    # Let queued fast clients drain, then shut the writers down
+    while len(fast) < messages * (members - 1):
+        await asyncio.sleep(0.01)
+    for i in range(members):
+        manager.disconnect(f"client-{i}")
+
+    fast.sort()
+    return {
+        "broadcast_s": broadcast_time,
+        "fast_p50_ms": fast[len(fast) // 2] * 1000,
+        "fast_max_ms": fast[-1] * 1000,
+    }
+
+
+async def main(members, messages, slow_ms):
+    print(f"{members} members, {messages} broadcasts every {INTERVAL * 1000:g} ms, "
+          f"one member at {slow_ms:g} ms/send")
+    print(f"{'impl':>10} {'broadcast s':>12} {'fast p50 ms':>12} {'fast max ms':>12}")
+    for name, queued in (("sequential", False), ("queued", True)):
+        # Silence the per-client connect/join logging
+        stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+        try:
+            result = await run(queued, members, messages, slow_ms / 1000)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        print(f"{name:>10} {result['broadcast_s']:12.2f} {result['fast_p50_ms']:12.2f} "
+              f"{result['fast_max_ms']:12.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--members", type=int, default=100)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--slow-ms", type=float, default=250.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.members, args.messages, args.slow_ms))
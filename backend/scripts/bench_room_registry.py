@@ -0,0 +1,96 @@
+"""Compare the old list-based room bookkeeping with RoomRegistry.
+
+Simulates 10k clients spread over 5k breakdown rooms (each client joins a few
+rooms), then times joins, leaves and disconnects. The old disconnect scanned
+every room in the system, so it is timed on a sample and reported per call.
+
+Run from the backend folder:
+    python scripts/bench_room_registry.py [--clients 10000] [--rooms 5000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from websocket_manager import RoomRegistry
+
+ROOMS_PER_CLIENT = 3
+DISCONNECT_SAMPLE = 500
+
+
+class ListRooms:
+    """The previous ConnectionManager room logic: room -> list of clients."""
+
+    def __init__(self):
+        self.user_rooms = {}
+
+    def join(self, client_id, room):
+        if room not in self.user_rooms:
+            self.user_rooms[room] = []
+        if client_id not in self.user_rooms[room]:
+            self.user_rooms[room].append(client_id)
+
+    def leave(self, client_id, room):
+        if room in self.user_rooms and client_id in self.user_rooms[room]:
+            self.user_rooms[room].remove(client_id)
+
+    def remove_client(self, client_id):
+        for room, clients in self.user_rooms.items():
+            if client_id in clients:
+                clients.remove(client_id)
+
+
+def make_memberships(clients, rooms):
+    rng = random.Random(clients * rooms)
+    return [
+        (f"client-{c}", f"breakdown_{rng.randrange(rooms)}")
+        for c in range(clients)
+        for _ in range(ROOMS_PER_CLIENT)
+    ]
+
+
+def timed(func, items):
+    start = time.perf_counter()
+    for item in items:
+        func(*item)
+    return time.perf_counter() - start
+
+
+def empty_rooms(registry):
+    if isinstance(registry, ListRooms):
+        return sum(1 for clients in registry.user_rooms.values() if not clients)
+    return sum(1 for room in registry._members.values() if not room)
+
+
+def run(registry, memberships, clients):
+    joins = timed(registry.join, memberships)
+    sample = memberships[:DISCONNECT_SAMPLE * ROOMS_PER_CLIENT]
+    leaves = timed(registry.leave, sample)
+    timed(registry.join, sample)
+    departed = [(f"client-{c}",) for c in range(DISCONNECT_SAMPLE)]
+    disconnects = timed(registry.remove_client, departed)
+    return {
+        "join_us": joins / len(memberships) * 1e6,
+        "leave_us": leaves / len(sample) * 1e6,
+        "disconnect_us": disconnects / len(departed) * 1e6,
+        "empty_rooms": empty_rooms(registry),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=10000)
+    parser.add_argument("--rooms", type=int, default=5000)
+    args = parser.parse_args()
+
+    memberships = make_memberships(args.clients, args.rooms)
+    print(f"{args.clients} clients, {args.rooms} rooms, {len(memberships)} joins, "
+          f"{DISCONNECT_SAMPLE} disconnects")
+    print(f"{'impl':>8} {'join us':>10} {'leave us':>10} {'disconnect us':>14} {'empty rooms':>12}")
+    for name, registry in (("list", ListRooms()), ("registry", RoomRegistry())):
+        result = run(registry, memberships, args.clients)
+        print(f"{name:>8} {result['join_us']:10.2f} {result['leave_us']:10.2f} "
+              f"{result['disconnect_us']:14.2f} {result['empty_rooms']:12d}")
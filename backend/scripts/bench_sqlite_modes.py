@@ -0,0 +1,137 @@
+"""Compare mixed read/write throughput of a default and a tuned SQLite setup.
+
+"default" is a bare engine in rollback-journal mode, as database.py used to
+create. "tuned" applies database.apply_sqlite_pragmas (WAL, synchronous=NORMAL,
+page cache, mmap, busy timeout) and reads through a separate query_only pool.
+
+Writer threads update provider locations one commit at a time while reader
+threads run bounding-box queries, for a fixed duration per mode.
+
+Run from the backend folder:
+    python scripts/bench_sqlite_modes.py [--writers 4] [--readers 8] [--seconds 5]
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.exc import OperationalError
+
+from database import apply_sqlite_pragmas
+
+ROWS = 5000
+ORIGIN = (14.5995, 120.9842)  # Manila
+
+
+def make_engine(path, tuned, read_only=False):
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, pool_size=16)
+    if tuned:
+        @event.listens_for(engine, "connect")
+        def _on_connect(dbapi_connection, connection_record):
+            apply_sqlite_pragmas(dbapi_connection, read_only=read_only)
+    return engine
+
+
+def seed(engine):
+    rng = random.Random(ROWS)
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE locations (id INTEGER PRIMARY KEY, latitude REAL, longitude REAL, updated_at REAL)"
+        ))
+        conn.execute(text("CREATE INDEX ix_locations_latitude ON locations (latitude)"))
+        conn.execute(
+            text("INSERT INTO locations (id, latitude, longitude, updated_at) VALUES (:id, :lat, :lon, 0)"),
+            [
+                {"id": i, "lat": ORIGIN[0] + rng.uniform(-1, 1), "lon": ORIGIN[1] + rng.uniform(-1, 1)}
+                for i in range(ROWS)
+            ]
+        )
+
+
+def writer(engine, stop, counts, seed_value):
+    rng = random.Random(seed_value)
+    while not stop.is_set():
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("UPDATE locations SET latitude = :lat, longitude = :lon, updated_at = :ts WHERE id = :id"),
+                    {
+                        "id": rng.randrange(ROWS),
+                        "lat": ORIGIN[0] + rng.uniform(-1, 1),
+                        "lon": ORIGIN[1] + rng.uniform(-1, 1),
+                        "ts": time.time(),
+                    }
+                )
+            counts["writes"] += 1
+        except OperationalError:
+            counts["errors"] += 1
+
+
+def reader(engine, stop, counts, seed_value):
+    rng = random.Random(seed_value)
+    while not stop.is_set():
+        lat = ORIGIN[0] + rng.uniform(-0.5, 0.5)
+        try:
+            with engine.connect() as conn:
+                conn.execute(
+                    text("SELECT id, latitude, longitude FROM locations WHERE latitude BETWEEN :lo AND :hi"),
+                    {"lo": lat - 0.05, "hi": lat + 0.05}
+                ).fetchall()
+            counts["reads"] += 1
+        except OperationalError:
+            counts["errors"] += 1
+
+
+def run_mode(tuned, writers, readers, seconds):
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, "bench.db")
+    write_engine = make_engine(path, tuned)
+    read_engine = make_engine(path, tuned, read_only=True) if tuned else write_engine
+    seed(write_engine)
+
+    stop = threading.Event()
+    write_counts = [{"writes": 0, "errors": 0} for _ in range(writers)]
+    read_counts = [{"reads": 0, "errors": 0} for _ in range(readers)]
+    threads = [
+        threading.Thread(target=writer, args=(write_engine, stop, counts, i))
+        for i, counts in enumerate(write_counts)
+    ] + [
+        threading.Thread(target=reader, args=(read_engine, stop, counts, 1000 + i))
+        for i, counts in enumerate(read_counts)
+    ]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    write_engine.dispose()
+    read_engine.dispose()
+    shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "writes": sum(c["writes"] for c in write_counts) / seconds,
+        "reads": sum(c["reads"] for c in read_counts) / seconds,
+        "errors": sum(c["errors"] for c in write_counts + read_counts),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{ROWS} rows, {args.writers} writers, {args.readers} readers, {args.seconds:g}s per mode")
+    print(f"{'mode':>8} {'writes/s':>10} {'reads/s':>10} {'errors':>8}")
+    for name, tuned in (("default", False), ("tuned", True)):
+        result = run_mode(tuned, args.writers, args.readers, args.seconds)
+        print(f"{name:>8} {result['writes']:10.0f} {result['reads']:10.0f} {result['errors']:8d}")
@@ -0,0 +1,176 @@
+"""Measure sustained IoT telemetry ingestion on one node.
+
+- row-at-a-time: one INSERT and commit per reading, the baseline
+- pipeline: TelemetryPipeline.submit() plus batched executemany flushes
+- http-ndjson: POST /api/telemetry/ingest with --batch readings per NDJSON
+  request, timed until every reading is in the database
+
+Runs against a scratch SQLite database with the app's engine settings.
+
+Run from the backend folder:
+    python scripts/bench_telemetry_ingest.py [--devices 200] [--readings 50000] [--batch 1000]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "vbams_telemetry.db")
+os.environ["USE_SQLITE"] = "false"
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+for suffix in ("", "-wal", "-shm"):
+    if os.path.exists(DB_PATH + suffix):
+        os.remove(DB_PATH + suffix)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from sqlalchemy import delete, func, insert, select
+
+import database
+from database import AsyncSessionLocal, engine
+from main import app
+from models import FuelType, Vehicle, VehicleTelemetry, VehicleType
+from telemetry import TelemetryPipeline, telemetry_pipeline
+
+ORIGIN = (14.5995, 120.9842)  # Manila
+ROW_AT_A_TIME_LIMIT = 5000
+
+
+async def setup(client, devices):
+    user = {
+        "first_name": "Fleet",
+        "last_name": "Telemetry",
+        "email": "telemetry@example.com",
+        "phone": "09170000002",
+        "role": "driver",
+        "password": "fleet12345",
+    }
+    r = await client.post("/api/auth/register", json=user)
+    r.raise_for_status()
+    owner_id = r.json()["id"]
+    r = await client.post("/api/auth/login", json={"email": user["email"], "password": user["password"]})
+    r.raise_for_status()
+    with engine.begin() as conn:
+        conn.execute(insert(Vehicle), [
+            {
+                "owner_id": owner_id, "make": "Isuzu", "model": "Elf", "year": 2022,
+                "license_plate": f"TM-{i:05d}", "vin": f"TELEM{i:012d}", "color": "white",
+                "vehicle_type": VehicleType.TRUCK, "fuel_type": FuelType.DIESEL,
+                "iot_device_id": f"dev-{i:05d}",
+            }
+            for i in range(devices)
+        ])
+        vehicle_ids = [row[0] for row in conn.execute(select(Vehicle.id).order_by(Vehicle.id))]
+    return {"Authorization": f"Bearer {r.json()['access_token']}"}, vehicle_ids
+
+
+def sample(rng, i, devices):
+    return {
+        "device_id": f"dev-{i % devices:05d}",
+        "latitude": ORIGIN[0] + rng.uniform(-0.5, 0.5),
+        "longitude": ORIGIN[1] + rng.uniform(-0.5, 0.5),
+        "speed": rng.uniform(0, 90),
+        "battery_voltage": rng.uniform(11.8, 14.4),
+        "engine_codes": ["P0300"] if i % 500 == 0 else None,
+    }
+
+
+def as_row(reading, vehicle_ids, devices, i):
+    return {
+        "vehicle_id": vehicle_ids[i % devices],
+        "ts": int(time.time() * 1000),
+        "latitude": reading["latitude"],
+        "longitude": reading["longitude"],
+        "speed": reading["speed"],
+        "battery_voltage": reading["battery_voltage"],
+        "engine_codes": ",".join(reading["engine_codes"]) if reading["engine_codes"] else None,
+    }
+
+
+async def stored():
+    async with AsyncSessionLocal() as db:
+        return await db.scalar(select(func.count()).select_from(VehicleTelemetry))
+
+
+async def clear():
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(VehicleTelemetry))
+        await db.commit()
+
+
+async def row_at_a_time(readings, vehicle_ids, devices):
+    count = min(len(readings), ROW_AT_A_TIME_LIMIT)
+    start = time.perf_counter()
+    for i in range(count):
+        async with AsyncSessionLocal() as db:
+            await db.execute(insert(VehicleTelemetry), [as_row(readings[i], vehicle_ids, devices, i)])
+            await db.commit()
+    return count, time.perf_counter() - start
+
+
+async def pipeline(readings, vehicle_ids, devices):
+    # A private pipeline, flushed explicitly, so only insert cost is measured
+    writer = TelemetryPipeline(flush_interval=3600, retention_interval=0)
+    start = time.perf_counter()
+    for i, reading in enumerate(readings):
+        writer.submit(as_row(reading, vehicle_ids, devices, i))
+        if i % writer.batch_size == writer.batch_size - 1:
+            await writer.flush()
+    await writer.close()
+    return len(readings), time.perf_counter() - start
+
+
+async def http_ndjson(client, headers, readings, batch):
+    start = time.perf_counter()
+    for i in range(0, len(readings), batch):
+        body = "".join(json.dumps(reading) + "\n" for reading in readings[i:i + batch])
+        r = await client.post(
+            "/api/telemetry/ingest",
+            headers={**headers, "Content-Type": "application/x-ndjson"},
+            content=body,
+        )
+        r.raise_for_status()
+        assert r.json()["rejected"] == 0, r.json()
+    await telemetry_pipeline.flush()
+    return len(readings), time.perf_counter() - start
+
+
+async def run(devices, total, batch):
+    rng = random.Random(devices)
+    readings = [sample(rng, i, devices) for i in range(total)]
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        headers, vehicle_ids = await setup(client, devices)
+        print(f"{devices} devices, {total:,} readings, batch {batch}")
+        print(f"{'mode':>14} {'readings':>9} {'seconds':>8} {'readings/s':>11} {'in db':>8}")
+        for name in ("row-at-a-time", "pipeline", "http-ndjson"):
+            await clear()
+            if name == "row-at-a-time":
+                count, elapsed = await row_at_a_time(readings, vehicle_ids, devices)
+            elif name == "pipeline":
+                count, elapsed = await pipeline(readings, vehicle_ids, devices)
+            else:
+                count, elapsed = await http_ndjson(client, headers, readings, batch)
+            print(f"{name:>14} {count:9,} {elapsed:8.2f} {count / elapsed:11,.0f} {await stored():8,}")
+    await telemetry_pipeline.close()
+    await database.dispose_async_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=200)
+    parser.add_argument("--readings", type=int, default=50000)
+    parser.add_argument("--batch", type=int, default=1000)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.devices, args.readings, args.batch))
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(DB_PATH + suffix):
+                os.remove(DB_PATH + suffix)
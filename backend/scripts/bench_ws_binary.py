@@ -0,0 +1,91 @@
+"""Compare JSON text and binary struct frames for location updates.
+
+Reports the bytes per frame, then encode and decode throughput in frames per
+second on one core, for the JSON codec in use (and the stdlib one, if that
+differs) and for ws_binary location frames.
+
+Run from the backend folder:
+    python scripts/bench_ws_binary.py [--frames 200000]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ws_protocol
+from ws_binary import decode_location, encode_location
+
+ROOM = "breakdown_42"
+ROOM_ID = 42
+SENDER = "provider-7f3a9c"
+SENDER_ID = 7
+
+
+def sample_updates(count):
+    rng = random.Random(7)
+    now = int(time.time())
+    return [
+        (
+            14.5 + rng.random() * 0.2,
+            120.9 + rng.random() * 0.2,
+            now + i,
+            round(rng.random() * 360, 2),
+            round(rng.random() * 30, 2),
+        )
+        for i in range(count)
+    ]
+
+
+def as_json(latitude, longitude, timestamp, heading, speed):
+    return {
+        "type": "location_update",
+        "room": ROOM,
+        "sender": SENDER,
+        "latitude": latitude,
+        "longitude": longitude,
+        "timestamp": timestamp,
+        "heading": heading,
+        "speed": speed,
+    }
+
+
+def rate(count, seconds):
+    return f"{count / seconds:12,.0f} frames/s"
+
+
+def main(count):
+    updates = sample_updates(count)
+    payloads = [as_json(*update) for update in updates]
+
+    codecs = {ws_protocol.CODEC: ws_protocol.CODECS[ws_protocol.CODEC]}
+    codecs.setdefault("stdlib", ws_protocol.CODECS["stdlib"])
+    for name, (loads, dumps) in codecs.items():
+        start = time.process_time()
+        frames = [dumps(payload) for payload in payloads]
+        encode = time.process_time() - start
+        start = time.process_time()
+        for frame in frames:
+            loads(frame)
+        decode = time.process_time() - start
+        size = sum(len(frame.encode()) for frame in frames) / count
+        print(f"json/{name:<8} {size:6.1f} B/frame  encode {rate(count, encode)}  decode {rate(count, decode)}")
+
+    start = time.process_time()
+    frames = [encode_location(SENDER_ID, ROOM_ID, *update) for update in updates]
+    encode = time.process_time() - start
+    start = time.process_time()
+    for frame in frames:
+        decode_location(frame)
+    decode = time.process_time() - start
+    size = sum(len(frame) for frame in frames) / count
+    print(f"{'binary':<13} {size:6.1f} B/frame  encode {rate(count, encode)}  decode {rate(count, decode)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--frames", type=int, default=200000)
+    args = parser.parse_args()
+    main(args.frames)
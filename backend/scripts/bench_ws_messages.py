@@ -0,0 +1,152 @@
+"""Micro-benchmarks for WebSocket message handling, in messages per second on one core.
+
+- decode: decode_envelope with the stdlib codec and with orjson (if installed)
+- dispatch: the previous if/elif handle_message against the handler table,
+  relaying chat messages to a room of --members fake sockets
+- broadcast: encoding a payload once per room against once per member
+
+Run from the backend folder:
+    python scripts/bench_ws_messages.py [--messages 50000] [--members 10]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ws_protocol
+from websocket_manager import ConnectionManager
+
+ROOM = "breakdown_42"
+FRAMES = [
+    json.dumps({"type": "chat_message", "room": ROOM, "sender": "driver-1", "text": "On my way, 5 minutes out"}),
+    json.dumps({"type": "assistance_status", "room": ROOM, "status": "in_progress", "request_id": 42}),
+    json.dumps({"type": "join_room", "room": ROOM}),
+    json.dumps({"type": "typing", "room": ROOM}),
+]
+DRAIN_EVERY = 32
+
+
+class NullSocket:
+    scope = {}
+
+    async def accept(self, subprotocol=None):
+        pass
+
+    async def close(self, code=1000):
+        pass
+
+    async def send_text(self, message):
+        pass
+
+
+async def legacy_handle_message(manager, client_id, message):
+    """The previous handle_message: json.loads and an if/elif chain."""
+    try:
+        data = json.loads(message)
+        message_type = data.get("type")
+        if message_type == "join_room":
+            room = data.get("room")
+            if room:
+                await manager.join_room(client_id, room)
+        elif message_type == "leave_room":
+            room = data.get("room")
+            if room:
+                await manager.leave_room(client_id, room)
+        elif message_type == "location_update":
+            room = data.get("room")
+            if room:
+                manager.locations.submit(client_id, room, data)
+        elif message_type == "assistance_status":
+            room = data.get("room")
+            if room:
+                await manager.send_to_room(message, room)
+        elif message_type == "chat_message":
+            room = data.get("room")
+            if room:
+                await manager.send_to_room(message, room)
+        else:
+            await manager.send_personal_message(message, client_id)
+    except json.JSONDecodeError:
+        await manager.send_personal_message("Invalid JSON format", client_id)
+
+
+def rate(count, seconds):
+    return f"{count / seconds:12,.0f} msg/s"
+
+
+def bench_decode(count):
+    frames = (FRAMES * (count // len(FRAMES) + 1))[:count]
+    for name, (loads, _) in ws_protocol.CODECS.items():
+        start = time.process_time()
+        for frame in frames:
+            ws_protocol.decode_envelope(frame, loads)
+        print(f"  decode    {name:>14} {rate(count, time.process_time() - start)}")
+
+
+async def bench_dispatch(count, members):
+    frames = (FRAMES * (count // len(FRAMES) + 1))[:count]
+    results = []
+    for name in ("if/elif", "handler table"):
+        manager = ConnectionManager()
+        for i in range(members):
+            await manager.connect(NullSocket(), f"client-{i}")
+            await manager.join_room(f"client-{i}", ROOM)
+        handle = manager.handle_message if name == "handler table" else (
+            lambda client_id, frame, manager=manager: legacy_handle_message(manager, client_id, frame)
+        )
+        start = time.process_time()
+        for i, frame in enumerate(frames):
+            await handle("client-0", frame)
+            if i % DRAIN_EVERY == 0:
+                # Let the writer tasks empty the queues, as the event loop would
+                await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        elapsed = time.process_time() - start
+        for i in range(members):
+            manager.disconnect(f"client-{i}")
+        results.append(f"  dispatch  {name:>14} {rate(count, elapsed)}  ({members} members)")
+    return results
+
+
+def bench_broadcast(count, members):
+    payload = {"type": "location_update", "room": ROOM, "latitude": 14.599512, "longitude": 120.984222}
+    recipients = range(members)
+    start = time.process_time()
+    for _ in range(count):
+        for _ in recipients:
+            ws_protocol.dumps(payload)
+    per_member = time.process_time() - start
+    start = time.process_time()
+    for _ in range(count):
+        message = ws_protocol.dumps(payload)
+        for _ in recipients:
+            message  # the same string is queued for every member
+    once = time.process_time() - start
+    print(f"  broadcast {'encode/member':>14} {rate(count, per_member)}  ({members} members)")
+    print(f"  broadcast {'encode once':>14} {rate(count, once)}  ({members} members)")
+
+
+async def main(count, members):
+    print(f"codec in use: {ws_protocol.CODEC}")
+    bench_decode(count)
+    # Silence the per-client connect/join logging
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        results = await bench_dispatch(count, members)
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    print("\n".join(results))
+    bench_broadcast(count, members)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=50000)
+    parser.add_argument("--members", type=int, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.messages, args.members))
@@ -0,0 +1,129 @@
+"""Measure API throughput under concurrent database-backed requests.
+
+Drives the app in-process over httpx's ASGI transport against a scratch SQLite
+database. While the list endpoints are hammered, /health is probed to show how
+long the event loop is held up by database work.
+
+Run from the backend folder:
+    python scripts/load_test_async_db.py [--requests 2000] [--concurrency 50]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "vbams_load_test.db")
+os.environ["USE_SQLITE"] = "false"
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+if os.path.exists(DB_PATH):
+    os.remove(DB_PATH)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+import database
+from main import app
+
+ENDPOINTS = ("/api/vehicles/", "/api/breakdowns/")
+VEHICLES = 20
+PROBE_INTERVAL = 0.01
+
+
+async def setup(client):
+    """Register a driver with a handful of vehicles and breakdowns."""
+    user = {
+        "first_name": "Load",
+        "last_name": "Test",
+        "email": "load.test@example.com",
+        "phone": "09170000000",
+        "role": "driver",
+        "password": "loadtest123",
+    }
+    r = await client.post("/api/auth/register", json=user)
+    r.raise_for_status()
+    r = await client.post("/api/auth/login", json={"email": user["email"], "password": user["password"]})
+    r.raise_for_status()
+    headers = {"Authorization": f"Bearer {r.json()['access_token']}"}
+
+    for i in range(VEHICLES):
+        r = await client.post("/api/vehicles/", headers=headers, json={
+            "make": "Toyota",
+            "model": "Vios",
+            "year": 2020,
+            "license_plate": f"LT-{i:04d}",
+            "vin": f"LOADTEST{i:09d}",
+            "color": "white",
+            "vehicle_type": "car",
+            "fuel_type": "gasoline",
+        })
+        r.raise_for_status()
+        r = await client.post("/api/breakdowns/", headers=headers, json={
+            "vehicle_id": r.json()["id"],
+            "description": "Load test breakdown",
+            "category": "tire",
+            "latitude": 14.5995,
+            "longitude": 120.9842,
+            "address": "Manila",
+        })
+        r.raise_for_status()
+    return headers
+
+
+async def probe_health(client, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await client.get("/health")
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(PROBE_INTERVAL)
+
+
+async def run(total, concurrency):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        headers = await setup(client)
+        queue = asyncio.Queue()
+        for i in range(total):
+            queue.put_nowait(ENDPOINTS[i % len(ENDPOINTS)])
+        errors = 0
+
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                path = queue.get_nowait()
+                r = await client.get(path, headers=headers)
+                if r.status_code != 200:
+                    errors += 1
+
+        stop = asyncio.Event()
+        health = []
+        prober = asyncio.create_task(probe_health(client, stop, health))
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await prober
+
+    await database.dispose_async_engines()
+
+    health.sort()
+    p50 = health[len(health) // 2] * 1000 if health else 0.0
+    p99 = health[int(len(health) * 0.99)] * 1000 if health else 0.0
+    print(f"{total} requests, concurrency {concurrency}, {errors} errors")
+    print(f"  throughput:        {total / elapsed:10.1f} req/s")
+    print(f"  /health probes:    {len(health):10d}")
+    print(f"  /health p50 / p99: {p50:10.2f} / {p99:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.requests, args.concurrency))
+    finally:
+        if os.path.exists(DB_PATH):
+            os.remove(DB_PATH)
@@ -0,0 +1,42 @@
+"""Add the (created_at, id) indexes used to paginate list endpoints newest first,
+and the updated_at index GET /api/assistance/available?since= reads changes by.
+
+Run from the backend folder:
+    python scripts/migrate_keyset_indexes.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import engine
+from models import AssistanceRequest, Breakdown, ServiceProvider, User, Vehicle
+from sqlalchemy import inspect
+
+MODELS = (User, Vehicle, Breakdown, ServiceProvider, AssistanceRequest)
+OTHER_INDEXES = {"ix_assistance_requests_updated_at"}
+
+
+def run_migration():
+    inspector = inspect(engine)
+
+    with engine.connect() as conn:
+        for model in MODELS:
+            table = model.__table__
+            if not inspector.has_table(table.name):
+                print(f"Table '{table.name}' missing. Creation should be handled by create_all.")
+                continue
+            existing = {i['name'] for i in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                wanted = index.name.endswith("_created_id") or index.name in OTHER_INDEXES
+                if wanted and index.name not in existing:
+                    print(f"Adding index '{index.name}'...")
+                    index.create(conn)
+        conn.commit()
+        print("List and change-tracking indexes are in place.")
+
+if __name__ == "__main__":
+    try:
+        run_migration()
+    except Exception as e:
+        print(f"Migration Failed: {e}")
@@ -0,0 +1,44 @@
+"""Add assistance_requests.offer_expires_at and its index.
+
+Dispatch offers record when they lapse, so the dispatcher can release
+offers left behind by a worker that stopped or crashed.
+
+Run from the backend folder:
+    python scripts/migrate_offer_deadline.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import engine
+from models import AssistanceRequest
+from sqlalchemy import text, inspect
+
+INDEX_NAME = "ix_assistance_requests_offer_expires_at"
+
+
+def run_migration():
+    inspector = inspect(engine)
+    if not inspector.has_table("assistance_requests"):
+        print("Table 'assistance_requests' missing. Creation should be handled by create_all.")
+        return
+
+    columns = [c['name'] for c in inspector.get_columns("assistance_requests")]
+    indexes = {i['name'] for i in inspector.get_indexes("assistance_requests")}
+
+    with engine.connect() as conn:
+        if "offer_expires_at" not in columns:
+            print("Adding 'offer_expires_at' column...")
+            conn.execute(text("ALTER TABLE assistance_requests ADD COLUMN offer_expires_at TIMESTAMP"))
+        if INDEX_NAME not in indexes:
+            print(f"Adding index '{INDEX_NAME}'...")
+            next(i for i in AssistanceRequest.__table__.indexes if i.name == INDEX_NAME).create(conn)
+        conn.commit()
+        print("Offer deadline column is in place.")
+
+if __name__ == "__main__":
+    try:
+        run_migration()
+    except Exception as e:
+        print(f"Migration Failed: {e}")
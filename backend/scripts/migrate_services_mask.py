@@ -0,0 +1,66 @@
+"""Add service_providers.services_mask and backfill it from the JSON services column.
+
+Also drops the index on services_mask that earlier runs created: a B-tree
+cannot serve the bitmask test, so it only slowed down writes.
+
+Run from the backend folder:
+    python scripts/migrate_services_mask.py
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import engine
+from models import services_to_mask
+from sqlalchemy import text, inspect
+
+BATCH_SIZE = 1000
+
+
+def run_migration():
+    inspector = inspect(engine)
+    if not inspector.has_table("service_providers"):
+        print("Table 'service_providers' missing. Creation should be handled by create_all.")
+        return
+
+    columns = [c['name'] for c in inspector.get_columns("service_providers")]
+    indexes = [i['name'] for i in inspector.get_indexes("service_providers")]
+
+    with engine.connect() as conn:
+        if 'services_mask' not in columns:
+            print("Adding 'services_mask' column...")
+            conn.execute(text("ALTER TABLE service_providers ADD COLUMN services_mask INTEGER NOT NULL DEFAULT 0"))
+
+        for index in ('ix_service_providers_services_mask', 'idx_service_providers_services_mask'):
+            if index in indexes:
+                print(f"Dropping index '{index}'...")
+                conn.execute(text(f"DROP INDEX {index} ON service_providers" if engine.dialect.name == "mysql"
+                                  else f"DROP INDEX {index}"))
+
+        # Backfill from the JSON text column in batches
+        rows = conn.execute(text("SELECT id, services FROM service_providers")).fetchall()
+        updates = []
+        for provider_id, services in rows:
+            try:
+                values = json.loads(services) if services else []
+            except ValueError:
+                print(f"Provider {provider_id}: unreadable services {services!r}, clearing")
+                values = []
+            updates.append({"id": provider_id, "mask": services_to_mask(values)})
+
+        for start in range(0, len(updates), BATCH_SIZE):
+            conn.execute(
+                text("UPDATE service_providers SET services_mask = :mask WHERE id = :id"),
+                updates[start:start + BATCH_SIZE]
+            )
+
+        conn.commit()
+        print(f"Backfilled services_mask for {len(updates)} providers.")
+
+if __name__ == "__main__":
+    try:
+        run_migration()
+    except Exception as e:
+        print(f"Migration Failed: {e}")
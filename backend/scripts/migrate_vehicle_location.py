@@ -0,0 +1,41 @@
+"""Add vehicles.latitude, vehicles.longitude and vehicles.last_location_update.
+
+Run from the backend folder:
+    python scripts/migrate_vehicle_location.py
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import engine
+from sqlalchemy import text, inspect
+
+NEW_COLUMNS = {
+    "latitude": "FLOAT",
+    "longitude": "FLOAT",
+    "last_location_update": "TIMESTAMP",
+}
+
+
+def run_migration():
+    inspector = inspect(engine)
+    if not inspector.has_table("vehicles"):
+        print("Table 'vehicles' missing. Creation should be handled by create_all.")
+        return
+
+    columns = [c['name'] for c in inspector.get_columns("vehicles")]
+
+    with engine.connect() as conn:
+        for name, column_type in NEW_COLUMNS.items():
+            if name not in columns:
+                print(f"Adding '{name}' column...")
+                conn.execute(text(f"ALTER TABLE vehicles ADD COLUMN {name} {column_type}"))
+        conn.commit()
+        print("Vehicle location columns are in place.")
+
+if __name__ == "__main__":
+    try:
+        run_migration()
+    except Exception as e:
+        print(f"Migration Failed: {e}")
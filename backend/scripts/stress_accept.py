@@ -0,0 +1,194 @@
+"""Stress concurrent accepts of the same assistance requests.
+
+For each of --requests pending requests, --contenders providers try to
+accept it at the same moment:
+- read-modify-write: the pattern accept used before, replayed with ORM
+  sessions (SELECT the pending request, set it accepted, SELECT and update
+  the breakdown, commit)
+- endpoint: PUT /api/assistance/{id}/accept, a conditional UPDATE plus the
+  breakdown UPDATE in one transaction
+
+A request must end up with exactly one winner, and its breakdown must name
+that winner. Statements counts every SQL statement sent to the database,
+commits included, per accept attempt.
+
+Drives the app in-process over httpx's ASGI transport against a scratch
+SQLite database.
+
+Run from the backend folder:
+    python scripts/stress_accept.py [--requests 200] [--contenders 8]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+from collections import Counter
+
+DB_PATH = os.path.join(tempfile.gettempdir(), "vbams_stress_accept.db")
+os.environ["USE_SQLITE"] = "false"
+os.environ["DATABASE_URL"] = f"sqlite:///{DB_PATH}"
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ["DISPATCH_ENABLED"] = "false"
+for suffix in ("", "-wal", "-shm"):
+    if os.path.exists(DB_PATH + suffix):
+        os.remove(DB_PATH + suffix)
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from sqlalchemy import event, insert, select
+
+import database
+from auth import create_access_token
+from database import AsyncSessionLocal, async_engine, engine
+from main import app
+from models import (
+    AssistanceRequest,
+    AssistanceRequestStatus,
+    Breakdown,
+    BreakdownCategory,
+    BreakdownStatus,
+    FuelType,
+    ServiceType,
+    User,
+    UserRole,
+    Vehicle,
+    VehicleType,
+)
+
+ORIGIN = (14.5995, 120.9842)  # Manila
+
+
+def setup(contenders):
+    with engine.begin() as conn:
+        conn.execute(insert(User), [
+            {
+                "first_name": "Stress", "last_name": str(i), "email": f"stress{i}@example.com",
+                "hashed_password": "-", "phone": f"0918{i:07d}", "is_verified": True,
+                "role": UserRole.DRIVER if i == 0 else UserRole.SERVICE_PROVIDER,
+            }
+            for i in range(contenders + 1)
+        ])
+        user_ids = [row[0] for row in conn.execute(select(User.id).order_by(User.id))]
+        vehicle_id = conn.execute(insert(Vehicle).values(
+            owner_id=user_ids[0], make="Toyota", model="Vios", year=2020, license_plate="STRESS-1",
+            vin="STRESS0000000001", color="red", vehicle_type=VehicleType.CAR, fuel_type=FuelType.GASOLINE
+        )).inserted_primary_key[0]
+    return user_ids[0], vehicle_id, user_ids[1:]
+
+
+def file_requests(driver_id, vehicle_id, count):
+    """Insert `count` breakdowns with one pending, unoffered request each."""
+    with engine.begin() as conn:
+        first = conn.execute(select(Breakdown.id).order_by(Breakdown.id.desc())).scalar() or 0
+        conn.execute(insert(Breakdown), [
+            {
+                "vehicle_id": vehicle_id, "driver_id": driver_id, "latitude": ORIGIN[0], "longitude": ORIGIN[1],
+                "address": "EDSA", "description": "Flat tire", "category": BreakdownCategory.TIRE,
+            }
+            for _ in range(count)
+        ])
+        breakdown_ids = [row[0] for row in conn.execute(
+            select(Breakdown.id).where(Breakdown.id > first).order_by(Breakdown.id)
+        )]
+        conn.execute(insert(AssistanceRequest), [
+            {
+                "breakdown_id": breakdown_id, "requester_id": driver_id, "service_type": ServiceType.TIRE_CHANGE,
+                "latitude": ORIGIN[0], "longitude": ORIGIN[1], "status": AssistanceRequestStatus.PENDING,
+            }
+            for breakdown_id in breakdown_ids
+        ])
+        return [row[0] for row in conn.execute(
+            select(AssistanceRequest.id).where(AssistanceRequest.breakdown_id.in_(breakdown_ids))
+        )]
+
+
+async def read_modify_write(client, request_id, provider_id, headers):
+    async with AsyncSessionLocal() as db:
+        request = await db.scalar(select(AssistanceRequest).where(
+            AssistanceRequest.id == request_id,
+            AssistanceRequest.status == "pending"
+        ))
+        if not request:
+            return 404
+        request.status = "accepted"
+        request.assigned_provider_id = provider_id
+        breakdown = await db.scalar(select(Breakdown).where(Breakdown.id == request.breakdown_id))
+        if breakdown:
+            breakdown.status = "assigned"
+            breakdown.service_provider_id = provider_id
+        await db.commit()
+        return 200
+
+
+async def endpoint(client, request_id, provider_id, headers):
+    r = await client.put(f"/api/assistance/{request_id}/accept", headers=headers)
+    return r.status_code
+
+
+async def run(requests, contenders):
+    driver_id, vehicle_id, provider_ids = setup(contenders)
+    headers = {
+        provider_id: {"Authorization": f"Bearer {create_access_token({'sub': str(provider_id)})}"}
+        for provider_id in provider_ids
+    }
+    statements = Counter()
+
+    @event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        statements["sql"] += 1
+
+    @event.listens_for(async_engine.sync_engine, "commit")
+    def count_commit(conn):
+        statements["sql"] += 1
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        # Warm up authentication caches so they do not count as statements
+        for provider_id in provider_ids:
+            await client.get("/api/auth/me", headers=headers[provider_id])
+
+        print(f"{requests} requests x {contenders} concurrent accepts")
+        print(f"{'mode':>17} {'single winner':>14} {'double accept':>14} {'no winner':>10} "
+              f"{'inconsistent':>13} {'errors':>7} {'stmts/accept':>13}")
+        for name, accept in (("read-modify-write", read_modify_write), ("endpoint", endpoint)):
+            request_ids = file_requests(driver_id, vehicle_id, requests)
+            outcomes = Counter()
+            statements.clear()
+            for request_id in request_ids:
+                codes = await asyncio.gather(*(
+                    accept(client, request_id, provider_id, headers[provider_id])
+                    for provider_id in provider_ids
+                ), return_exceptions=True)
+                winners = sum(1 for code in codes if code == 200)
+                outcomes["errors"] += sum(1 for code in codes if code not in (200, 404))
+                outcomes["single" if winners == 1 else "double" if winners > 1 else "none"] += 1
+
+            with engine.connect() as conn:
+                rows = conn.execute(
+                    select(AssistanceRequest.assigned_provider_id, Breakdown.service_provider_id, Breakdown.status)
+                    .join(Breakdown, Breakdown.id == AssistanceRequest.breakdown_id)
+                    .where(AssistanceRequest.id.in_(request_ids))
+                ).all()
+            inconsistent = sum(
+                1 for assigned, breakdown_provider, breakdown_status in rows
+                if assigned != breakdown_provider or breakdown_status != BreakdownStatus.ASSIGNED
+            )
+            attempts = requests * contenders
+            print(f"{name:>17} {outcomes['single']:14} {outcomes['double']:14} {outcomes['none']:10} "
+                  f"{inconsistent:13} {outcomes['errors']:7} {statements['sql'] / attempts:13.2f}")
+    await database.dispose_async_engines()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--contenders", type=int, default=8)
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args.requests, args.contenders))
+    finally:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(DB_PATH + suffix):
+                os.remove(DB_PATH + suffix)
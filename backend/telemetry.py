@@ -0,0 +1,278 @@
+from collections import deque
+from itertools import chain
+from typing import Deque, Dict, List, Optional
+import asyncio
+import os
+import time
+
+from sqlalchemy import case, delete, func, insert, literal, select
+from sqlalchemy.exc import IntegrityError
+
+from cache import CacheInvalidationFeed, TTLCache
+from database import AsyncSessionLocal
+from metrics import Histogram
+from models import VehicleTelemetry, VehicleTelemetryRollup
+
+# Ingestion: accepted readings wait in memory (at most TELEMETRY_MAX_PENDING;
+# beyond that new readings are refused) and are inserted in executemany
+# batches of TELEMETRY_BATCH_SIZE, at least every TELEMETRY_FLUSH_INTERVAL
+# seconds or as soon as a full batch is waiting. The newest
+# TELEMETRY_RING_SIZE readings of every device are also kept in memory.
+# Readings the database rejects (e.g. of a vehicle deleted since they were
+# accepted) are dropped as dead letters; a batch that fails for any other
+# reason is retried at most TELEMETRY_MAX_RETRIES times before it is dropped.
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "1000"))
+TELEMETRY_FLUSH_INTERVAL = float(os.getenv("TELEMETRY_FLUSH_INTERVAL", "1"))
+TELEMETRY_MAX_PENDING = int(os.getenv("TELEMETRY_MAX_PENDING", "100000"))
+TELEMETRY_RING_SIZE = int(os.getenv("TELEMETRY_RING_SIZE", "120"))
+TELEMETRY_MAX_RETRIES = int(os.getenv("TELEMETRY_MAX_RETRIES", "5"))
+
+# Retention: raw readings older than TELEMETRY_RAW_RETENTION_HOURS are folded
+# into TELEMETRY_ROLLUP_SECONDS buckets and deleted; rollups are deleted after
+# TELEMETRY_ROLLUP_RETENTION_DAYS. Runs every TELEMETRY_RETENTION_INTERVAL
+# seconds (0 disables it).
+TELEMETRY_RAW_RETENTION_HOURS = float(os.getenv("TELEMETRY_RAW_RETENTION_HOURS", "72"))
+TELEMETRY_ROLLUP_SECONDS = int(os.getenv("TELEMETRY_ROLLUP_SECONDS", "300"))
+TELEMETRY_ROLLUP_RETENTION_DAYS = float(os.getenv("TELEMETRY_ROLLUP_RETENTION_DAYS", "90"))
+TELEMETRY_RETENTION_INTERVAL = float(os.getenv("TELEMETRY_RETENTION_INTERVAL", "3600"))
+
+# iot_device_id -> (vehicle id, owner id), so steady streams skip the lookup
+device_cache = TTLCache(
+    maxsize=int(os.getenv("TELEMETRY_DEVICE_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("TELEMETRY_DEVICE_CACHE_TTL", "300")),
+)
+# Drops a device from the cache of every worker when its vehicle changes
+device_cache_feed = CacheInvalidationFeed(device_cache)
+
+_telemetry = VehicleTelemetry.__table__
+_rollups = VehicleTelemetryRollup.__table__
+
+
+# Fields that make up a reading, apart from its row id
+READING_COLUMNS = ("vehicle_id", "ts", "latitude", "longitude", "speed", "battery_voltage", "engine_codes")
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+class TelemetryPipeline:
+    """Buffers IoT readings and appends them to vehicle_telemetry in batches.
+
+    A reading is a dict of vehicle_telemetry columns (vehicle_id, ts,
+    latitude, longitude, speed, battery_voltage, engine_codes). submit() only
+    touches memory; the flusher task does the inserts. Readings from a failed
+    flush are put back in front of the queue while there is room for them,
+    up to `max_retries` times; rows the database rejects are dropped.
+    """
+
+    def __init__(self, session_factory=AsyncSessionLocal, batch_size: int = TELEMETRY_BATCH_SIZE,
+                 flush_interval: float = TELEMETRY_FLUSH_INTERVAL, max_pending: int = TELEMETRY_MAX_PENDING,
+                 ring_size: int = TELEMETRY_RING_SIZE, retention_interval: float = TELEMETRY_RETENTION_INTERVAL,
+                 max_retries: int = TELEMETRY_MAX_RETRIES):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.ring_size = ring_size
+        self.retention_interval = retention_interval
+        self.max_retries = max_retries
+        self.accepted = 0
+        self.refused = 0
+        self.rows_written = 0
+        self.flushes = 0
+        self.errors = 0
+        self.dead_letters = 0
+        self.rollups_written = 0
+        self.raw_pruned = 0
+        self.rollups_pruned = 0
+        self.flush_latency = Histogram()
+        self._pending: Deque[dict] = deque()
+        self._recent: Dict[int, Deque[dict]] = {}
+        self._failures = 0  # consecutive failed flushes of the batch at the front
+        self._wake = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._retention: Optional[asyncio.Task] = None
+
+    def submit(self, reading: dict) -> bool:
+        """Queue a reading; False if the backlog is full and it was refused."""
+        if len(self._pending) >= self.max_pending:
+            self.refused += 1
+            return False
+        self.accepted += 1
+        self._pending.append(reading)
+        recent = self._recent.get(reading["vehicle_id"])
+        if recent is None:
+            recent = self._recent[reading["vehicle_id"]] = deque(maxlen=self.ring_size)
+        recent.append(reading)
+        if len(self._pending) >= self.batch_size:
+            self._wake.set()
+        self._start()
+        return True
+
+    def latest(self, vehicle_id: int, limit: Optional[int] = None) -> List[dict]:
+        """The newest readings of a vehicle buffered by this worker, newest first."""
+        recent = self._recent.get(vehicle_id)
+        if not recent:
+            return []
+        readings = list(reversed(recent))
+        return readings[:limit] if limit else readings
+
+    def merge_latest(self, vehicle_id: int, stored, limit: int) -> List[dict]:
+        """Stored readings of a vehicle topped up with the ones buffered here.
+
+        Other workers' readings only reach this one through the database, so
+        the buffer alone is not the latest state; it adds what this worker
+        has not flushed yet. Readings both stored and buffered count once.
+        """
+        readings = {}
+        for reading in chain(self.latest(vehicle_id, limit), stored):
+            readings.setdefault(tuple(reading[column] for column in READING_COLUMNS), reading)
+        return sorted(readings.values(), key=lambda reading: reading["ts"], reverse=True)[:limit]
+
+    def _start(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+        if self.retention_interval > 0 and (self._retention is None or self._retention.done()):
+            self._retention = asyncio.create_task(self._retention_loop())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Insert everything queued so far; returns the number of rows written.
+
+        A batch that breaks a constraint is split until the offending rows
+        are found, and only those are dropped.
+        """
+        written = 0
+        while self._pending:
+            count = min(len(self._pending), self.batch_size)
+            chunks = [[self._pending.popleft() for _ in range(count)]]
+            start = time.perf_counter()
+            while chunks:
+                rows = chunks.pop()
+                try:
+                    async with self.session_factory() as db:
+                        await db.execute(insert(_telemetry), rows)
+                        await db.commit()
+                except IntegrityError as e:
+                    if len(rows) > 1:
+                        middle = len(rows) // 2
+                        chunks += [rows[middle:], rows[:middle]]
+                    else:
+                        self.dead_letters += 1
+                        print(f"Telemetry reading of vehicle {rows[0]['vehicle_id']} dropped: {e.orig}")
+                    continue
+                except Exception as e:
+                    self._failed(list(chain(rows, *reversed(chunks))), e)
+                    return written
+                self.rows_written += len(rows)
+                written += len(rows)
+            self._failures = 0
+            self.flush_latency.observe(time.perf_counter() - start)
+            self.flushes += 1
+        return written
+
+    def _failed(self, rows: List[dict], error: Exception):
+        """Put the rows of a failed flush back, or drop them once out of retries."""
+        self.errors += 1
+        self._failures += 1
+        if self._failures > self.max_retries:
+            self._failures = 0
+            self.dead_letters += len(rows)
+            print(f"Telemetry flush failed, dropping {len(rows)} readings after {self.max_retries} retries: {error}")
+            return
+        print(f"Telemetry flush failed: {error}")
+        room = self.max_pending - len(self._pending)
+        self._pending.extendleft(reversed(rows[:max(room, 0)]))
+
+    async def _retention_loop(self):
+        while True:
+            await asyncio.sleep(self.retention_interval)
+            try:
+                await self.apply_retention()
+            except Exception as e:
+                self.errors += 1
+                print(f"Telemetry retention failed: {e}")
+
+    async def apply_retention(self, now: Optional[int] = None,
+                              raw_hours: float = TELEMETRY_RAW_RETENTION_HOURS,
+                              bucket_seconds: int = TELEMETRY_ROLLUP_SECONDS,
+                              rollup_days: float = TELEMETRY_ROLLUP_RETENTION_DAYS) -> dict:
+        """Downsample raw readings past the raw window, then prune both tables.
+
+        The raw cutoff is aligned to a bucket boundary, so a bucket is always
+        rolled up in one go and never split across runs.
+        """
+        now = now_ms() if now is None else now
+        bucket_ms = bucket_seconds * 1000
+        raw_cutoff = now - int(raw_hours * 3600 * 1000)
+        raw_cutoff -= raw_cutoff % bucket_ms
+        rollup_cutoff = now - int(rollup_days * 86400 * 1000)
+
+        bucket = _telemetry.c.ts - _telemetry.c.ts % bucket_ms
+        aggregate = (
+            select(
+                _telemetry.c.vehicle_id,
+                bucket,
+                literal(bucket_seconds),
+                func.count(),
+                func.avg(_telemetry.c.latitude),
+                func.avg(_telemetry.c.longitude),
+                func.avg(_telemetry.c.speed),
+                func.max(_telemetry.c.speed),
+                func.min(_telemetry.c.battery_voltage),
+                func.avg(_telemetry.c.battery_voltage),
+                func.sum(case((func.coalesce(_telemetry.c.engine_codes, "") != "", 1), else_=0)),
+            )
+            .where(_telemetry.c.ts < raw_cutoff)
+            .group_by(_telemetry.c.vehicle_id, bucket)
+        )
+        async with self.session_factory() as db:
+            rolled = await db.execute(insert(_rollups).from_select([
+                "vehicle_id", "bucket_ts", "bucket_seconds", "samples", "latitude", "longitude",
+                "avg_speed", "max_speed", "min_battery_voltage", "avg_battery_voltage", "fault_samples",
+            ], aggregate))
+            raw = await db.execute(delete(_telemetry).where(_telemetry.c.ts < raw_cutoff))
+            old = await db.execute(delete(_rollups).where(_rollups.c.bucket_ts < rollup_cutoff))
+            await db.commit()
+        result = {"rollups_written": rolled.rowcount, "raw_pruned": raw.rowcount, "rollups_pruned": old.rowcount}
+        self.rollups_written += max(rolled.rowcount, 0)
+        self.raw_pruned += max(raw.rowcount, 0)
+        self.rollups_pruned += max(old.rowcount, 0)
+        return result
+
+    async def close(self):
+        for task in (self._flusher, self._retention):
+            if task is not None:
+                task.cancel()
+        self._flusher = self._retention = None
+        await self.flush()
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._pending),
+            "devices_buffered": len(self._recent),
+            "accepted": self.accepted,
+            "refused": self.refused,
+            "rows_written": self.rows_written,
+            "flushes": self.flushes,
+            "errors": self.errors,
+            "dead_letters": self.dead_letters,
+            "flush_latency": self.flush_latency.snapshot(),
+            "rollups_written": self.rollups_written,
+            "raw_pruned": self.raw_pruned,
+            "rollups_pruned": self.rollups_pruned,
+            "device_cache": device_cache_feed.stats(),
+        }
+
+
+# Global pipeline used by the telemetry router
+telemetry_pipeline = TelemetryPipeline()
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The checked-in .env points at PostgreSQL; tests run on SQLite with a key of
+# their own. Set before the app modules are imported, as load_dotenv() does
+# not override variables that are already set.
+os.environ.setdefault("USE_SQLITE", "true")
+os.environ.setdefault("SECRET_KEY", "test-secret-key")
+
+# Backend modules are imported by their top-level names, as from the backend folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+pytest.importorskip("aiosqlite")
+
+import httpx
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from auth import Principal, get_current_active_user
+from database import get_async_db
+from models import Base, FuelType, User, UserRole, Vehicle, VehicleType
+from routers import auth
+
+
+def test_replayed_and_older_positions_are_reported_stale():
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        async with sessions() as db:
+            driver = User(first_name="D", last_name="R", email="driver@test.com", hashed_password="x",
+                          phone="1", role=UserRole.DRIVER)
+            db.add(driver)
+            await db.flush()
+            db.add_all([Vehicle(owner_id=driver.id, make="M", model="X", year=2020, license_plate=f"P{i}",
+                                vin=f"V{i}", color="red", vehicle_type=VehicleType.CAR, fuel_type=FuelType.GASOLINE,
+                                iot_device_id=f"dev-{i}") for i in range(3)])
+            await db.commit()
+
+        async def db_override():
+            async with sessions() as db:
+                yield db
+
+        app = FastAPI()
+        app.include_router(auth.router, prefix="/api/auth")
+        app.dependency_overrides[get_async_db] = db_override
+        app.dependency_overrides[get_current_active_user] = lambda: Principal(driver.id, "driver", True, True)
+
+        def item(device, recorded_at, latitude=14.6):
+            return {"device_id": device, "latitude": latitude, "longitude": 121.0, "recorded_at": recorded_at}
+
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            first = await client.post("/api/auth/update-locations", json=[
+                item("dev-0", "2026-01-01T10:00:00Z"),
+                item("dev-1", "2026-01-01T10:00:00Z"),
+            ])
+            replay = await client.post("/api/auth/update-locations", json=[
+                item("dev-0", "2026-01-01T10:00:00Z", latitude=15.0),  # same time again
+                item("dev-1", "2026-01-01T09:59:00Z", latitude=15.0),  # older
+                item("dev-2", "2026-01-01T09:00:00Z"),  # first position of this vehicle
+            ])
+        async with sessions() as db:
+            latitudes = [vehicle.latitude for vehicle in sorted(
+                (await db.execute(Vehicle.__table__.select())).all(), key=lambda row: row.id)]
+        await engine.dispose()
+        return first.json(), replay.json(), latitudes
+
+    first, replay, latitudes = asyncio.run(run())
+    assert first["updated"] == 2
+    assert [result["status"] for result in replay["results"]] == ["stale", "stale", "updated"]
+    assert replay["updated"] == 1
+    assert replay["rejected"] == 0
+    assert latitudes == [14.6, 14.6, 14.6]
@@ -0,0 +1,22 @@
+from cache import CacheInvalidationFeed, TTLCache
+
+
+def test_invalidation_reaches_the_cache_of_every_worker():
+    workers = [CacheInvalidationFeed(TTLCache(maxsize=10, ttl=60)) for _ in range(2)]
+    for feed in workers:
+        feed.cache.set(7, "principal")
+        feed.cache.set(8, "other")
+        # What the broker does: every worker applies what any worker publishes
+        feed.publish = lambda message: [worker.apply(message) for worker in workers]
+
+    workers[0].invalidate(7)
+
+    assert [(feed.cache.get(7), feed.cache.get(8)) for feed in workers] == [(None, "other")] * 2
+    assert [feed.stats()["invalidations_applied"] for feed in workers] == [1, 1]
+
+
+def test_invalidation_without_a_broker_is_local():
+    feed = CacheInvalidationFeed(TTLCache(maxsize=10, ttl=60))
+    feed.cache.set("device-1", (1, 2))
+    feed.invalidate("device-1")
+    assert feed.cache.get("device-1") is None
@@ -0,0 +1,111 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from cascade import delete_breakdown_rows, delete_user_rows
+from database import apply_sqlite_pragmas
+from models import (
+    AssistanceRequest,
+    AssistanceRequestStatus,
+    Base,
+    Breakdown,
+    BreakdownCategory,
+    FuelType,
+    ServiceProvider,
+    ServiceType,
+    User,
+    UserRole,
+    Vehicle,
+    VehicleType,
+)
+
+
+async def _database():
+    # Tables from create_all, with foreign keys enforced as SQLITE_FOREIGN_KEYS does
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    event.listen(engine.sync_engine, "connect", lambda connection, record: apply_sqlite_pragmas(connection))
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    sessions = async_sessionmaker(engine, expire_on_commit=False)
+
+    async with sessions() as db:
+        driver = User(first_name="D", last_name="R", email="driver@test.com", hashed_password="x",
+                      phone="1", role=UserRole.DRIVER)
+        provider = User(first_name="P", last_name="R", email="provider@test.com", hashed_password="x",
+                        phone="2", role=UserRole.SERVICE_PROVIDER)
+        db.add_all([driver, provider])
+        await db.flush()
+        db.add(ServiceProvider(user_id=provider.id, business_name="Tow", business_license="L1", base_rate=50.0,
+                               latitude=14.6, longitude=121.0))
+        vehicle = Vehicle(owner_id=driver.id, make="M", model="X", year=2020, license_plate="ABC",
+                          vin="V1", color="red", vehicle_type=VehicleType.CAR, fuel_type=FuelType.GASOLINE)
+        db.add(vehicle)
+        await db.flush()
+        breakdown = Breakdown(vehicle_id=vehicle.id, driver_id=driver.id, latitude=14.6, longitude=121.0,
+                              address="Road", description="Flat", category=BreakdownCategory.TIRE,
+                              service_provider_id=provider.id)
+        db.add(breakdown)
+        await db.flush()
+        db.add(AssistanceRequest(breakdown_id=breakdown.id, requester_id=driver.id,
+                                 service_type=ServiceType.TOWING, latitude=14.6, longitude=121.0,
+                                 assigned_provider_id=provider.id, status=AssistanceRequestStatus.PENDING))
+        await db.commit()
+    return engine, sessions, driver.id, provider.id, breakdown.id
+
+
+def test_deleting_a_provider_unassigns_its_requests():
+    async def run():
+        engine, sessions, driver_id, provider_id, breakdown_id = await _database()
+        async with sessions() as db:
+            deleted = await delete_user_rows(db, provider_id)
+            await db.commit()
+        async with sessions() as db:
+            request = await db.scalar(select(AssistanceRequest))
+            breakdown = await db.get(Breakdown, breakdown_id)
+            profiles = (await db.scalars(select(ServiceProvider))).all()
+        await engine.dispose()
+        return deleted, request, breakdown, profiles
+
+    deleted, request, breakdown, profiles = asyncio.run(run())
+    assert request.assigned_provider_id is None
+    assert breakdown.service_provider_id is None
+    assert profiles == []
+    assert [job["request_id"] for job in deleted.reopened_jobs] == [request.id]
+
+
+def test_deleting_a_driver_removes_what_they_own():
+    async def run():
+        engine, sessions, driver_id, provider_id, breakdown_id = await _database()
+        async with sessions() as db:
+            deleted = await delete_user_rows(db, driver_id)
+            await db.commit()
+        async with sessions() as db:
+            counts = [len((await db.scalars(select(model))).all())
+                      for model in (AssistanceRequest, Breakdown, Vehicle, User)]
+        await engine.dispose()
+        return deleted, counts
+
+    deleted, counts = asyncio.run(run())
+    assert counts == [0, 0, 0, 1]
+    assert len(deleted.removed_jobs) == 1
+
+
+def test_deleting_a_breakdown_removes_its_requests():
+    async def run():
+        engine, sessions, driver_id, provider_id, breakdown_id = await _database()
+        async with sessions() as db:
+            await delete_breakdown_rows(db, breakdown_id)
+            await db.commit()
+        async with sessions() as db:
+            counts = [len((await db.scalars(select(model))).all()) for model in (AssistanceRequest, Breakdown)]
+        await engine.dispose()
+        return counts
+
+    assert asyncio.run(run()) == [0, 0]
@@ -0,0 +1,26 @@
+import sqlite3
+import time
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from db_pool import TimedQueuePool
+
+
+def test_checkout_wait_excludes_connect_time():
+    def slow_connect():
+        time.sleep(0.05)
+        return sqlite3.connect(":memory:")
+
+    pool = TimedQueuePool(slow_connect, pool_size=1, max_overflow=0)
+    connection = pool.connect()  # opens a new connection
+    connection.close()
+    pool.connect().close()  # reuses it
+
+    wait = pool.wait_histogram.snapshot()
+    connect = pool.connect_histogram.snapshot()
+    assert wait["count"] == 2
+    assert wait["max_ms"] < 25
+    assert connect["count"] == 1
+    assert connect["max_ms"] >= 50
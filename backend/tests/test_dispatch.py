@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("aiosqlite")
+
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from dispatch import Dispatcher
+from models import AssistanceRequest, AssistanceRequestStatus, Base, ServiceType, services_to_mask
+
+
+def provider(user_id, longitude):
+    return SimpleNamespace(id=user_id, user_id=user_id, latitude=14.6, longitude=longitude, current_latitude=None,
+                           current_longitude=None, average_rating=5.0, rating_count=1, service_radius=50.0,
+                           services_mask=services_to_mask([ServiceType.TOWING]))
+
+
+def test_match_uses_the_declines_it_is_given():
+    request = SimpleNamespace(id=1, latitude=14.6, longitude=121.0, service_type=ServiceType.TOWING)
+    rows = [provider(10, 121.0), provider(11, 121.1)]
+    dispatcher = Dispatcher(enabled=False)
+    # The nearest provider declined after the snapshot was taken: the match
+    # follows the snapshot, not the live state
+    dispatcher._declined[1] = {10}
+    [(_, row, _)] = dispatcher.match([request], rows, {}, declined={1: frozenset()})
+    assert row.user_id == 10
+    [(_, row, _)] = dispatcher.match([request], rows, {}, declined={1: frozenset({10})})
+    assert row.user_id == 11
+
+
+def test_sweep_starts_the_batch_matcher_for_released_requests():
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        async with sessions() as db:
+            db.add(AssistanceRequest(breakdown_id=1, requester_id=1, service_type=ServiceType.TOWING,
+                                     latitude=14.6, longitude=121.0, status=AssistanceRequestStatus.PENDING,
+                                     assigned_provider_id=2,
+                                     offer_expires_at=datetime.utcnow() - timedelta(minutes=1)))
+            await db.commit()
+        dispatcher = Dispatcher(session_factory=sessions, enabled=True, batch_window=60)
+        released = await dispatcher.sweep()
+        running = dispatcher._batcher is not None and not dispatcher._batcher.done()
+        await dispatcher.close()
+        await engine.dispose()
+        return released, running
+
+    assert asyncio.run(run()) == (1, True)
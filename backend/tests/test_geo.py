@@ -0,0 +1,33 @@
+from geo import ProviderIndexFeed, SpatialGridIndex, bounding_box, longitude_ranges
+
+
+def test_bounding_box_wraps_across_the_antimeridian():
+    min_lat, max_lat, min_lon, max_lon = bounding_box(0.0, 179.9, 50)
+    assert min_lon > max_lon
+    assert longitude_ranges(min_lon, max_lon) == [(min_lon, 180.0), (-180.0, max_lon)]
+    assert -180.0 <= max_lon < -179.0
+
+
+def test_grid_query_finds_points_across_the_antimeridian():
+    index = SpatialGridIndex()
+    index.upsert(1, 0.0, -179.9)
+    index.upsert(2, 0.0, 179.95)
+    index.upsert(3, 0.0, 170.0)
+    points = index.query_points(0.0, 179.9, 50)
+    assert sorted(item_id for item_id, _ in points.within(0.0, 179.9, 50)) == [1, 2]
+
+
+def test_index_changes_go_through_publish():
+    sent = []
+    local, remote = SpatialGridIndex(), SpatialGridIndex()
+    feed = ProviderIndexFeed(local)
+    feed.publish = sent.append
+    feed.moved(7, 14.6, 121.0, 3)
+    assert len(local) == 0  # applied when the broker delivers it
+    other = ProviderIndexFeed(remote)
+    for message in sent:
+        other.apply(message)
+    assert remote.position(7) == (14.6, 121.0)
+    feed.removed(7)
+    other.apply(sent[-1])
+    assert len(remote) == 0
@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from telemetry import TelemetryPipeline
+
+
+def reading(ts, speed=10.0):
+    return {"vehicle_id": 1, "ts": ts, "latitude": 14.6, "longitude": 121.0, "speed": speed,
+            "battery_voltage": 12.6, "engine_codes": None}
+
+
+def test_latest_merges_stored_readings_of_other_workers():
+    async def run():
+        pipeline = TelemetryPipeline(retention_interval=0)
+        pipeline.submit(reading(1000))
+        pipeline.submit(reading(3000))
+        # 2000 came in through another worker; 1000 was flushed by this one
+        stored = [{"id": 7, **reading(2000)}, {"id": 5, **reading(1000)}]
+        merged = pipeline.merge_latest(1, stored, 10)
+        pipeline._flusher.cancel()
+        return merged
+
+    assert [row["ts"] for row in asyncio.run(run())] == [3000, 2000, 1000]
+
+
+def test_flush_drops_readings_of_a_deleted_vehicle():
+    pytest.importorskip("aiosqlite")
+    from sqlalchemy import delete, event, func, select
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import StaticPool
+
+    from database import apply_sqlite_pragmas
+    from models import Base, FuelType, User, UserRole, Vehicle, VehicleTelemetry, VehicleType
+
+    async def run():
+        engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+        event.listen(engine.sync_engine, "connect", lambda connection, record: apply_sqlite_pragmas(connection))
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        sessions = async_sessionmaker(engine, expire_on_commit=False)
+        async with sessions() as db:
+            driver = User(first_name="D", last_name="R", email="driver@test.com", hashed_password="x",
+                          phone="1", role=UserRole.DRIVER)
+            db.add(driver)
+            await db.flush()
+            vehicles = [Vehicle(owner_id=driver.id, make="M", model="X", year=2020, license_plate=f"P{i}",
+                                vin=f"V{i}", color="red", vehicle_type=VehicleType.CAR,
+                                fuel_type=FuelType.GASOLINE) for i in range(2)]
+            db.add_all(vehicles)
+            await db.commit()
+        kept, deleted = (vehicle.id for vehicle in vehicles)
+
+        pipeline = TelemetryPipeline(session_factory=sessions, retention_interval=0)
+        for ts in range(1000, 5000, 1000):
+            pipeline.submit({**reading(ts), "vehicle_id": kept})
+            pipeline.submit({**reading(ts), "vehicle_id": deleted})
+        pipeline._flusher.cancel()
+        # The vehicle goes after its readings were accepted, before they are written
+        async with sessions() as db:
+            await db.execute(delete(Vehicle).where(Vehicle.id == deleted))
+            await db.commit()
+
+        written = await pipeline.flush()
+        async with sessions() as db:
+            stored = await db.scalar(select(func.count()).select_from(VehicleTelemetry))
+        await engine.dispose()
+        return written, stored, pipeline.stats()
+
+    written, stored, stats = asyncio.run(run())
+    assert written == stored == 4
+    assert stats["dead_letters"] == 4
+    assert stats["pending"] == 0
+
+
+def test_flush_gives_up_on_a_batch_after_max_retries():
+    class Unavailable:
+        async def __aenter__(self):
+            raise ConnectionError("database is down")
+
+        async def __aexit__(self, *exc):
+            return False
+
+    async def run():
+        pipeline = TelemetryPipeline(session_factory=Unavailable, retention_interval=0, max_retries=2)
+        pipeline.submit(reading(1000))
+        pipeline._flusher.cancel()
+        pending = []
+        for _ in range(3):
+            await pipeline.flush()
+            pending.append(pipeline.stats()["pending"])
+        return pending, pipeline.stats()
+
+    pending, stats = asyncio.run(run())
+    assert pending == [1, 1, 0]
+    assert stats["dead_letters"] == 1
@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+import pytest
+
+from ws_binary import FrameError, decode_location, encode_location
+
+
+def test_millisecond_timestamp_is_sent_in_seconds():
+    now = int(time.time())
+    frame = encode_location(1, 2, 14.6, 121.0, now * 1000 + 250)
+    assert decode_location(frame).timestamp == now
+
+
+def test_seconds_timestamp_is_kept():
+    frame = encode_location(1, 2, 14.6, 121.0, 1_700_000_000)
+    assert decode_location(frame).timestamp == 1_700_000_000
+
+
+@pytest.mark.parametrize("timestamp", [-1, float("nan"), "soon", True, 2 ** 64])
+def test_unpackable_timestamp_raises_frame_error(timestamp):
+    with pytest.raises(FrameError):
+        encode_location(1, 2, 14.6, 121.0, timestamp)
+
+
+def test_coalescer_relays_ms_timestamps_and_survives_a_failing_fix():
+    pytest.importorskip("fastapi")
+    from websocket_manager import ConnectionManager, LocationCoalescer
+    from ws_binary import IdRegistry
+
+    class Manager:
+        binary_connections = 1
+        encode_location = ConnectionManager.encode_location
+
+        def __init__(self):
+            self.client_ids = IdRegistry()
+            self.room_ids = IdRegistry()
+            self.sent = []
+
+        def broadcast(self, message, room, key=None, binary=None):
+            if key[2] == "broken":
+                raise RuntimeError("broker down")
+            self.sent.append((key[2], binary is not None))
+
+    async def run(manager):
+        coalescer = LocationCoalescer(manager, tick_hz=100, precision=None, skip_unchanged=False)
+        fix = {"type": "location_update", "latitude": 14.6, "longitude": 121.0}
+        coalescer.submit("ms", "room", {**fix, "timestamp": int(time.time() * 1000)})
+        coalescer.submit("broken", "room", {**fix, "timestamp": int(time.time())})
+        coalescer.submit("negative", "room", {**fix, "timestamp": -5})
+        await asyncio.sleep(0.05)
+        coalescer.submit("later", "room", {**fix, "timestamp": int(time.time())})
+        await asyncio.sleep(0.05)
+        coalescer._task.cancel()
+        return coalescer
+
+    manager = Manager()
+    coalescer = asyncio.run(run(manager))
+    # Negative timestamps fall back to JSON only; the failing fix does not
+    # stop the rest of its tick or the ticks after it
+    assert manager.sent == [("ms", True), ("negative", False), ("later", True)]
+    assert coalescer.failed == 1
+
+
+def test_unchanged_position_is_resent_to_a_new_member_and_on_keyframes():
+    pytest.importorskip("fastapi")
+    from websocket_manager import LocationCoalescer
+
+    class Manager:
+        def __init__(self):
+            self.sent = []
+
+        def broadcast(self, message, room, key=None, binary=None):
+            self.sent.append(key[2])
+
+        def encode_location(self, room, client_id, data):
+            return None
+
+    manager = Manager()
+    coalescer = LocationCoalescer(manager, tick_hz=0, precision=None, skip_unchanged=True, keyframe_interval=60)
+    fix = {"type": "location_update", "latitude": 14.6, "longitude": 121.0}
+    coalescer.submit("tow", "room", dict(fix))
+    coalescer.submit("tow", "room", dict(fix))
+    coalescer.room_joined("room")
+    coalescer.submit("tow", "room", dict(fix))
+    coalescer.keyframe_interval = 0
+    coalescer.submit("tow", "room", dict(fix))
+    assert manager.sent == ["tow", "tow", "tow"]
+    assert coalescer.suppressed == 1
@@ -0,0 +1,21 @@
+import pytest
+
+from ws_broker import Broker, InMemoryBroker
+
+
+def test_backend_missing_a_method_fails_when_created():
+    class PublishOnly(Broker):
+        def publish(self, room, message, key=None, binary=None):
+            pass
+
+    with pytest.raises(TypeError):
+        PublishOnly()
+
+
+def test_in_memory_broker_delivers_locally():
+    broker = InMemoryBroker()
+    delivered = []
+    broker.bind(lambda *args: delivered.append(args))
+    broker.room_added("room")
+    broker.publish("room", "hello", key="k")
+    assert delivered == [("room", "hello", "k", None)]
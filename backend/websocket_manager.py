@@ -1,97 +1,685 @@
 from fastapi import WebSocket, WebSocketDisconnect
-from typing import Dict, List
-import json
+from collections import deque
+from typing import Callable, Deque, Dict, Hashable, Optional, Set, Union
 import asyncio
+import os
+import time
+
+from ws_broker import Broker, create_broker
+from ws_binary import BINARY_SUBPROTOCOL, FrameError, IdRegistry, decode_location, encode_location
+from ws_protocol import Envelope, EnvelopeError, decode_envelope, dumps, error_message, loads
+
+# Outbound frames: JSON text, or bytes for binary-format clients
+Frame = Union[str, bytes]
+
+_EMPTY: frozenset = frozenset()
+
+
+class RoomRegistry:
+    """Bidirectional room membership index.
+    
+    Keeps room -> clients and client -> rooms as sets, so joining, leaving and
+    checking membership are O(1) and dropping a client only touches the rooms
+    it is in. Rooms are deleted as soon as their last member leaves.
+    """
 
-class ConnectionManager:
     def __init__(self):
-        self.active_connections: Dict[str, WebSocket] = {}
-        self.user_rooms: Dict[str, List[str]] = {}
+        self._members: Dict[str, Set[str]] = {}
+        self._rooms: Dict[str, Set[str]] = {}
+
+    def __contains__(self, room: str) -> bool:
+        return room in self._members
+
+    def join(self, client_id: str, room: str) -> bool:
+        """Add a client to a room; returns False if it was already a member."""
+        members = self._members.setdefault(room, set())
+        if client_id in members:
+            return False
+        members.add(client_id)
+        self._rooms.setdefault(client_id, set()).add(room)
+        return True
+
+    def leave(self, client_id: str, room: str) -> bool:
+        """Remove a client from a room; returns False if it was not a member."""
+        members = self._members.get(room)
+        if members is None or client_id not in members:
+            return False
+        members.discard(client_id)
+        if not members:
+            del self._members[room]
+        rooms = self._rooms[client_id]
+        rooms.discard(room)
+        if not rooms:
+            del self._rooms[client_id]
+        return True
+
+    def remove_client(self, client_id: str) -> Set[str]:
+        """Drop a client from every room it joined and return those rooms."""
+        rooms = self._rooms.pop(client_id, set())
+        for room in rooms:
+            members = self._members[room]
+            members.discard(client_id)
+            if not members:
+                del self._members[room]
+        return rooms
+
+    def members(self, room: str) -> frozenset:
+        return frozenset(self._members.get(room, _EMPTY))
+
+    def rooms_of(self, client_id: str) -> frozenset:
+        return frozenset(self._rooms.get(client_id, _EMPTY))
+
+    def stats(self) -> dict:
+        return {
+            "rooms": len(self._members),
+            "clients_in_rooms": len(self._rooms),
+            "memberships": sum(len(members) for members in self._members.values()),
+        }
+
+
+# Outbound queueing: each socket gets a bounded queue drained by its own
+# writer task, so a slow receiver only ever delays itself
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+WS_QUEUE_POLICY = os.getenv("WS_QUEUE_POLICY", "coalesce")
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+WS_EVICT_AFTER_DROPS = int(os.getenv("WS_EVICT_AFTER_DROPS", "256"))
+
+# location_update relaying: fixes are flushed per (room, sender) at this
+# rate (0 relays every fix immediately), rounded to this many decimal places
+# (unset keeps full precision; 5 is about 1 m). With
+# WS_LOCATION_SKIP_UNCHANGED, a position equal to the last one relayed is
+# only re-sent after WS_LOCATION_KEYFRAME_INTERVAL seconds or when the room
+# gains a member, so late joiners still learn where stationary senders are.
+WS_LOCATION_TICK_HZ = float(os.getenv("WS_LOCATION_TICK_HZ", "2"))
+WS_LOCATION_PRECISION = int(os.getenv("WS_LOCATION_PRECISION")) if os.getenv("WS_LOCATION_PRECISION") else None
+WS_LOCATION_SKIP_UNCHANGED = os.getenv("WS_LOCATION_SKIP_UNCHANGED", "false").lower() == "true"
+WS_LOCATION_KEYFRAME_INTERVAL = float(os.getenv("WS_LOCATION_KEYFRAME_INTERVAL", "10"))
+
+# Heartbeats: a client silent for WS_PING_INTERVAL seconds is sent a ping,
+# and one silent for WS_IDLE_TIMEOUT seconds is taken as half-open and
+# closed. Any inbound frame counts as a sign of life. The reaper checks
+# every WS_REAP_INTERVAL seconds; WS_PING_INTERVAL=0 disables it.
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+WS_IDLE_TIMEOUT = float(os.getenv("WS_IDLE_TIMEOUT", "60"))
+WS_REAP_INTERVAL = float(os.getenv("WS_REAP_INTERVAL", "5"))
+
+# Sockets of authenticated service providers are joined to a private room
+# per provider, used to push job offers to them on whichever worker they are
+# connected. Clients cannot join or send to these rooms themselves.
+PROVIDER_ROOM_PREFIX = "provider:"
+
+
+def provider_room(user_id: int) -> str:
+    return f"{PROVIDER_ROOM_PREFIX}{user_id}"
+
+
+# Available-jobs feed events; consumed by the job feed of every worker rather
+# than fanned out to members
+JOBS_ROOM = f"{PROVIDER_ROOM_PREFIX}jobs"
+# Provider index changes, applied to the proximity index of every worker
+PROVIDER_INDEX_ROOM = f"{PROVIDER_ROOM_PREFIX}index"
+# Telemetry device cache invalidations, applied to the cache of every worker
+DEVICE_CACHE_ROOM = f"{PROVIDER_ROOM_PREFIX}devices"
+# Principal cache invalidations, applied to the auth cache of every worker
+PRINCIPAL_CACHE_ROOM = f"{PROVIDER_ROOM_PREFIX}principals"
+
 
-    async def connect(self, websocket: WebSocket, client_id: str):
-        await websocket.accept()
-        self.active_connections[client_id] = websocket
+QUEUE_POLICIES = ("coalesce", "drop_oldest", "drop_newest")
+if WS_QUEUE_POLICY not in QUEUE_POLICIES:
+    raise ValueError(f"WS_QUEUE_POLICY must be one of {', '.join(QUEUE_POLICIES)}")
+
+
+class OutboundQueue:
+    """Bounded per-connection message queue.
+    
+    Policies when a message arrives:
+    - coalesce: a message with the same key as one still queued replaces it
+      in place (e.g. an older location from the same sender); otherwise,
+      when full, the oldest message is dropped
+    - drop_oldest: when full, the oldest message is dropped
+    - drop_newest: when full, the new message is dropped
+    """
+
+    QUEUED = "queued"
+    COALESCED = "coalesced"
+    DROPPED = "dropped"
+
+    def __init__(self, maxsize: int = WS_SEND_QUEUE_SIZE, policy: str = WS_QUEUE_POLICY):
+        self.maxsize = maxsize
+        self.policy = policy
+        self._entries: Deque[list] = deque()  # [key, message]
+        self._keyed: Dict[Hashable, list] = {}
+        self._ready = asyncio.Event()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def put(self, message: Frame, key: Optional[Hashable] = None) -> str:
+        if key is not None and self.policy == "coalesce":
+            entry = self._keyed.get(key)
+            if entry is not None:
+                entry[1] = message
+                return self.COALESCED
+
+        result = self.QUEUED
+        if len(self._entries) >= self.maxsize:
+            if self.policy == "drop_newest":
+                return self.DROPPED
+            oldest_key, _ = self._entries.popleft()
+            if oldest_key is not None:
+                self._keyed.pop(oldest_key, None)
+            result = self.DROPPED
+
+        entry = [key, message]
+        self._entries.append(entry)
+        if key is not None and self.policy == "coalesce":
+            self._keyed[key] = entry
+        self._ready.set()
+        return result
+
+    async def get(self) -> Frame:
+        while not self._entries:
+            self._ready.clear()
+            await self._ready.wait()
+        key, message = self._entries.popleft()
+        if key is not None:
+            self._keyed.pop(key, None)
+        return message
+
+
+class ClientConnection:
+    """A connected socket with its outbound queue and writer task."""
+
+    def __init__(self, websocket: WebSocket, binary: bool = False, provider_user_id: Optional[int] = None):
+        self.websocket = websocket
+        # Negotiated BINARY_SUBPROTOCOL: location updates arrive as struct frames
+        self.binary = binary
+        # Set when the socket authenticated as a service provider
+        self.provider_user_id = provider_user_id
+        self.queue = OutboundQueue()
+        self.writer: Optional[asyncio.Task] = None
+        self.consecutive_drops = 0
+        self.last_seen = time.monotonic()
+        self.last_ping = 0.0
+
+    @property
+    def awaiting_pong(self) -> bool:
+        """Pinged and silent since: possibly half-open."""
+        return self.last_ping > self.last_seen
+
+
+class LocationCoalescer:
+    """Relays location_update messages at a fixed tick rate.
+    
+    Only the newest fix per (room, sender) survives until the next tick, so
+    outbound traffic scales with the tick rate and not with how often
+    devices report. Coordinates can be quantized, and a fix that matches the
+    last one relayed for that sender and room can be suppressed until the
+    next keyframe is due or the room gains a member.
+    """
+
+    COORDINATE_FIELDS = ("latitude", "longitude")
+
+    def __init__(self, manager: "ConnectionManager", tick_hz: float = WS_LOCATION_TICK_HZ,
+                 precision: Optional[int] = WS_LOCATION_PRECISION,
+                 skip_unchanged: bool = WS_LOCATION_SKIP_UNCHANGED,
+                 keyframe_interval: float = WS_LOCATION_KEYFRAME_INTERVAL):
+        self.manager = manager
+        self.tick_hz = tick_hz
+        self.precision = precision
+        self.skip_unchanged = skip_unchanged
+        self.keyframe_interval = keyframe_interval
+        self.received = 0
+        self.relayed = 0
+        self.suppressed = 0
+        self.failed = 0
+        self._pending: Dict[tuple, dict] = {}
+        self._last_sent: Dict[str, Dict[str, tuple]] = {}  # sender -> room -> (coordinates, sent at)
+        self._task: Optional[asyncio.Task] = None
+
+    def submit(self, client_id: str, room: str, data: dict):
+        self.received += 1
+        if self.tick_hz <= 0:
+            self._relay(room, client_id, data)
+            return
+        self._pending[(room, client_id)] = data
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def forget(self, client_id: str):
+        """Drop state for a disconnected sender."""
+        self._last_sent.pop(client_id, None)
+
+    def room_joined(self, room: str):
+        """Relay the next fix of every sender in a room, so a new member gets it."""
+        for last_sent in self._last_sent.values():
+            last_sent.pop(room, None)
+
+    def flush(self):
+        pending, self._pending = self._pending, {}
+        for (room, client_id), data in pending.items():
+            # One bad fix must not cost the others, or stop the tick loop
+            try:
+                self._relay(room, client_id, data)
+            except Exception as e:
+                self.failed += 1
+                print(f"Error relaying location of {client_id} to {room}: {e}")
+
+    async def _run(self):
+        interval = 1.0 / self.tick_hz
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
+
+    def _quantize(self, data: dict) -> tuple:
+        coordinates = []
+        for field in self.COORDINATE_FIELDS:
+            value = data.get(field)
+            if self.precision is not None and isinstance(value, (int, float)):
+                value = round(value, self.precision)
+                data[field] = value
+            coordinates.append(value)
+        return tuple(coordinates)
+
+    def _relay(self, room: str, client_id: str, data: dict):
+        coordinates = self._quantize(data)
+        if self.skip_unchanged and None not in coordinates:
+            last_sent = self._last_sent.setdefault(client_id, {})
+            now = time.monotonic()
+            previous = last_sent.get(room)
+            if previous is not None and previous[0] == coordinates and now - previous[1] < self.keyframe_interval:
+                self.suppressed += 1
+                return
+            last_sent[room] = (coordinates, now)
+        self.relayed += 1
+        self.manager.broadcast(
+            dumps(data), room,
+            key=("location_update", room, client_id),
+            binary=self.manager.encode_location(room, client_id, data)
+        )
+
+    def stats(self) -> dict:
+        return {
+            "tick_hz": self.tick_hz,
+            "pending": len(self._pending),
+            "received": self.received,
+            "relayed": self.relayed,
+            "suppressed": self.suppressed,
+            "failed": self.failed,
+        }
+
+
+class ConnectionManager:
+    def __init__(self, broker: Optional[Broker] = None, ping_interval: float = WS_PING_INTERVAL,
+                 idle_timeout: float = WS_IDLE_TIMEOUT, reap_interval: float = WS_REAP_INTERVAL):
+        self.active_connections: Dict[str, ClientConnection] = {}
+        self.rooms = RoomRegistry()
+        # Room messages go through the broker so members on other workers get them
+        self.broker = broker or create_broker()
+        self.broker.bind(self.deliver)
+        self.messages_dropped = 0
+        self.messages_coalesced = 0
+        self.clients_evicted = 0
+        self._closing: Set[asyncio.Task] = set()
+        self.locations = LocationCoalescer(self)
+        # Numeric aliases used by binary frames
+        self.room_ids = IdRegistry()
+        self.client_ids = IdRegistry()
+        self.binary_connections = 0
+        self.binary_frames_received = 0
+        self.ping_interval = ping_interval
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self.pings_sent = 0
+        self.clients_reaped = 0
+        self._reaper: Optional[asyncio.Task] = None
+        # Called with (user_id, latitude, longitude) for every fix sent by an
+        # authenticated service provider, to persist its live location
+        self.location_sink: Optional[Callable[[int, float, float], None]] = None
+        # Rooms whose messages are handed to a callback instead of members
+        self.room_handlers: Dict[str, Callable[[str], None]] = {}
+        # Available-jobs subscriptions of service providers (a job_feed.JobFeed)
+        self.job_feed = None
+
+    async def connect(self, websocket: WebSocket, client_id: str, provider_user_id: Optional[int] = None):
+        binary = BINARY_SUBPROTOCOL in websocket.scope.get("subprotocols", ())
+        await websocket.accept(subprotocol=BINARY_SUBPROTOCOL if binary else None)
+        previous = self.active_connections.get(client_id)
+        if previous is not None:
+            # Same client id reconnected; retire the old socket's writer
+            self.disconnect(client_id, previous.websocket)
+        conn = ClientConnection(websocket, binary, provider_user_id)
+        conn.writer = asyncio.create_task(self._write_loop(client_id, conn))
+        self.active_connections[client_id] = conn
+        if self.ping_interval > 0 and (self._reaper is None or self._reaper.done()):
+            self._reaper = asyncio.create_task(self._reap_loop())
+        if binary:
+            self.binary_connections += 1
+            self.enqueue(client_id, dumps({
+                "type": "session",
+                "client_id": client_id,
+                "sender_id": self.client_ids.id_for(client_id),
+            }))
+        if provider_user_id is not None:
+            # Joined without a room_joined ack; the room is not addressable by clients
+            room = provider_room(provider_user_id)
+            if room not in self.rooms:
+                self.broker.room_added(room)
+            self.rooms.join(client_id, room)
         print(f"Client {client_id} connected")
 
-    def disconnect(self, client_id: str):
-        if client_id in self.active_connections:
-            del self.active_connections[client_id]
+    def disconnect(self, client_id: str, websocket: Optional[WebSocket] = None):
+        """Forget a client. With `websocket`, only if that socket is still the current one."""
+        conn = self.active_connections.get(client_id)
+        if conn is None or (websocket is not None and conn.websocket is not websocket):
+            return
+        del self.active_connections[client_id]
+        if conn.writer is not None and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
+        if conn.binary:
+            self.binary_connections -= 1
         
-        # Remove from all rooms
-        for room, clients in self.user_rooms.items():
-            if client_id in clients:
-                clients.remove(client_id)
+        # Remove from the rooms this client joined
+        for room in self.rooms.remove_client(client_id):
+            if room not in self.rooms:
+                self._room_emptied(room)
+        self.locations.forget(client_id)
+        self.client_ids.release(client_id)
+        if self.job_feed is not None:
+            self.job_feed.unsubscribe(client_id)
         
         print(f"Client {client_id} disconnected")
 
-    async def send_personal_message(self, message: str, client_id: str):
-        if client_id in self.active_connections:
-            websocket = self.active_connections[client_id]
+    def _evict(self, client_id: str, conn: ClientConnection, reason: str, code: int = 1013):
+        """Drop a client and close its socket in the background.
+        
+        1013 (try again later) is used for slow consumers, 1001 (going away)
+        for connections reaped as idle.
+        """
+        print(f"Evicting client {client_id}: {reason}")
+        self.clients_evicted += 1
+        self.disconnect(client_id, conn.websocket)
+        task = asyncio.create_task(self._close(conn.websocket, code))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def _close(self, websocket: WebSocket, code: int):
+        try:
+            await asyncio.wait_for(websocket.close(code=code), WS_SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    def touch(self, client_id: str):
+        """Record that a frame arrived from a client."""
+        conn = self.active_connections.get(client_id)
+        if conn is not None:
+            conn.last_seen = time.monotonic()
+
+    def reap(self, now: Optional[float] = None):
+        """Ping quiet clients and evict the ones past the idle timeout."""
+        now = time.monotonic() if now is None else now
+        for client_id, conn in list(self.active_connections.items()):
+            idle = now - conn.last_seen
+            if idle >= self.idle_timeout:
+                self.clients_reaped += 1
+                self._evict(client_id, conn, f"no frames for {idle:.0f}s", code=1001)
+            elif idle >= self.ping_interval and now - conn.last_ping >= self.ping_interval:
+                conn.last_ping = now
+                self.pings_sent += 1
+                # Keyed so unsent pings to a stalled client don't pile up
+                self._enqueue(client_id, conn, dumps({"type": "ping", "ts": int(time.time())}), ("ping",))
+
+    async def _reap_loop(self):
+        while self.active_connections:
+            await asyncio.sleep(self.reap_interval)
+            self.reap()
+
+    async def _write_loop(self, client_id: str, conn: ClientConnection):
+        while True:
+            message = await conn.queue.get()
+            send = conn.websocket.send_bytes if isinstance(message, bytes) else conn.websocket.send_text
             try:
-                await websocket.send_text(message)
+                await asyncio.wait_for(send(message), WS_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                self._evict(client_id, conn, f"send blocked for more than {WS_SEND_TIMEOUT:g}s")
+                return
             except Exception as e:
                 print(f"Error sending message to {client_id}: {e}")
-                self.disconnect(client_id)
+                self.disconnect(client_id, conn.websocket)
+                return
+            conn.consecutive_drops = 0
 
-    async def send_to_room(self, message: str, room: str):
-        if room in self.user_rooms:
-            for client_id in self.user_rooms[room]:
-                await self.send_personal_message(message, client_id)
+    def enqueue(self, client_id: str, message: Frame, key: Optional[Hashable] = None):
+        """Queue a message for one client without waiting for it to be sent."""
+        conn = self.active_connections.get(client_id)
+        if conn is not None:
+            self._enqueue(client_id, conn, message, key)
 
-    async def join_room(self, client_id: str, room: str):
-        if room not in self.user_rooms:
-            self.user_rooms[room] = []
-        
-        if client_id not in self.user_rooms[room]:
-            self.user_rooms[room].append(client_id)
+    def _enqueue(self, client_id: str, conn: ClientConnection, message: Frame, key: Optional[Hashable]):
+        result = conn.queue.put(message, key)
+        if result == OutboundQueue.COALESCED:
+            self.messages_coalesced += 1
+        elif result == OutboundQueue.DROPPED:
+            self.messages_dropped += 1
+            conn.consecutive_drops += 1
+            if conn.consecutive_drops >= WS_EVICT_AFTER_DROPS:
+                self._evict(client_id, conn, f"{conn.consecutive_drops} messages dropped without a successful send")
+
+    async def send_personal_message(self, message: str, client_id: str, key: Optional[Hashable] = None):
+        self.enqueue(client_id, message, key)
+
+    def broadcast(self, message: str, room: str, key: Optional[Hashable] = None, binary: Optional[bytes] = None):
+        """Send a message to every member of a room, on any worker.
         
+        `key` identifies messages that supersede each other, so under the
+        coalesce policy a newer one replaces an older one still queued.
+        `binary` is the same message as a frame for binary-format clients.
+        """
+        self.broker.publish(room, message, key, binary)
+
+    def deliver(self, room: str, message: str, key: Optional[Hashable] = None, binary: Optional[bytes] = None):
+        """Fan a room message out to the queues of members connected here."""
+        handler = self.room_handlers.get(room)
+        if handler is not None:
+            handler(message)
+            return
+        for client_id in self.rooms.members(room):
+            conn = self.active_connections.get(client_id)
+            if conn is None:
+                continue
+            if conn.binary and isinstance(key, tuple) and key[0] == "location_update":
+                if binary is None:
+                    # Relayed from another worker; aliases are per process
+                    binary = self.encode_location(room, key[2], loads(message))
+                if binary is not None:
+                    self._enqueue(client_id, conn, binary, key)
+                    continue
+            self._enqueue(client_id, conn, message, key)
+
+    def encode_location(self, room: str, client_id: str, data: dict) -> Optional[bytes]:
+        """Binary frame for a location_update, or None if nobody needs one or it doesn't fit.
+
+        Timestamps in milliseconds are sent in seconds; anything else that
+        can't be packed leaves binary clients on the JSON message.
+        """
+        if not self.binary_connections:
+            return None
+        try:
+            return encode_location(
+                self.client_ids.id_for(client_id),
+                self.room_ids.id_for(room),
+                float(data["latitude"]),
+                float(data["longitude"]),
+                data.get("timestamp"),
+                data.get("heading"),
+                data.get("speed"),
+            )
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    async def handle_binary(self, client_id: str, frame: bytes):
+        """Handle a binary location frame from a client."""
+        self.binary_frames_received += 1
+        try:
+            location = decode_location(frame)
+            room = self.room_ids.name_for(location.room_id)
+            if room is None or room.startswith(PROVIDER_ROOM_PREFIX):
+                raise FrameError(f"Unknown room id {location.room_id}")
+        except FrameError as e:
+            self.enqueue(client_id, error_message(str(e)))
+            return
+        # The sender is always the connection itself, whatever the frame claims
+        data = {
+            "type": "location_update",
+            "room": room,
+            "sender": client_id,
+            "latitude": location.latitude,
+            "longitude": location.longitude,
+            "timestamp": location.timestamp,
+        }
+        if location.heading is not None:
+            data["heading"] = location.heading
+        if location.speed is not None:
+            data["speed"] = location.speed
+        self.locations.submit(client_id, room, data)
+        self._record_location(client_id, location.latitude, location.longitude)
+
+    def _record_location(self, client_id: str, latitude, longitude):
+        conn = self.active_connections.get(client_id)
+        if conn is None or conn.provider_user_id is None or self.location_sink is None:
+            return
+        try:
+            latitude, longitude = float(latitude), float(longitude)
+        except (TypeError, ValueError):
+            return
+        if -90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0:
+            self.location_sink(conn.provider_user_id, latitude, longitude)
+
+    def notify_provider(self, user_id: int, message: str):
+        """Send a message to every socket of a service provider, on any worker."""
+        self.broadcast(message, provider_room(user_id))
+
+    async def send_to_room(self, message: str, room: str, key: Optional[Hashable] = None):
+        self.broadcast(message, room, key)
+
+    async def join_room(self, client_id: str, room: str):
+        new_room = room not in self.rooms
+        self.rooms.join(client_id, room)
+        if new_room:
+            self.broker.room_added(room)
+        self.locations.room_joined(room)
+        conn = self.active_connections.get(client_id)
+        if conn is not None and conn.binary:
+            self._enqueue(client_id, conn, dumps({
+                "type": "room_joined",
+                "room": room,
+                "room_id": self.room_ids.id_for(room),
+            }), None)
         print(f"Client {client_id} joined room {room}")
 
     async def leave_room(self, client_id: str, room: str):
-        if room in self.user_rooms and client_id in self.user_rooms[room]:
-            self.user_rooms[room].remove(client_id)
+        if self.rooms.leave(client_id, room) and room not in self.rooms:
+            self._room_emptied(room)
         
         print(f"Client {client_id} left room {room}")
 
+    def _room_emptied(self, room: str):
+        self.broker.room_removed(room)
+        self.room_ids.release(room)
+
+    def stats(self) -> dict:
+        half_open = sum(1 for conn in self.active_connections.values() if conn.awaiting_pong)
+        return {
+            "connections": len(self.active_connections),
+            "connections_live": len(self.active_connections) - half_open,
+            "connections_half_open": half_open,
+            "pings_sent": self.pings_sent,
+            "clients_reaped": self.clients_reaped,
+            "binary_connections": self.binary_connections,
+            "binary_frames_received": self.binary_frames_received,
+            **self.rooms.stats(),
+            "queued_messages": sum(len(conn.queue) for conn in self.active_connections.values()),
+            "messages_dropped": self.messages_dropped,
+            "messages_coalesced": self.messages_coalesced,
+            "clients_evicted": self.clients_evicted,
+            "locations": self.locations.stats(),
+            "broker": self.broker.stats(),
+        }
+
+    async def close(self):
+        if self._reaper is not None:
+            self._reaper.cancel()
+        await self.broker.close()
+
+    async def _on_join_room(self, client_id: str, envelope: Envelope):
+        await self.join_room(client_id, envelope.room)
+
+    async def _on_leave_room(self, client_id: str, envelope: Envelope):
+        await self.leave_room(client_id, envelope.room)
+
+    async def _on_location_update(self, client_id: str, envelope: Envelope):
+        self.locations.submit(client_id, envelope.room, envelope.data)
+        self._record_location(client_id, envelope.data.get("latitude"), envelope.data.get("longitude"))
+
+    async def _on_resolve(self, client_id: str, envelope: Envelope):
+        # Binary clients look up the client id behind a sender_id they don't know
+        sender_id = envelope.data.get("sender_id")
+        name = self.client_ids.name_for(sender_id) if isinstance(sender_id, int) else None
+        self.enqueue(client_id, dumps({"type": "alias", "sender_id": sender_id, "client_id": name}))
+
+    async def _on_pong(self, client_id: str, envelope: Envelope):
+        # Heartbeat reply; touch() has already recorded it
+        pass
+
+    async def _on_subscribe_jobs(self, client_id: str, envelope: Envelope):
+        conn = self.active_connections.get(client_id)
+        if conn is None or conn.provider_user_id is None or self.job_feed is None:
+            raise EnvelopeError("Only service providers connected with a token can subscribe to jobs")
+        await self.job_feed.subscribe(client_id, conn.provider_user_id)
+        if self.active_connections.get(client_id) is not conn:
+            # Disconnected while the profile was loading
+            self.job_feed.unsubscribe(client_id)
+
+    async def _on_unsubscribe_jobs(self, client_id: str, envelope: Envelope):
+        if self.job_feed is not None and self.job_feed.unsubscribe(client_id):
+            self.enqueue(client_id, dumps({"type": "jobs_unsubscribed"}))
+
+    async def _on_room_relay(self, client_id: str, envelope: Envelope):
+        # Forward the frame as received; it is encoded once for all members
+        self.broadcast(envelope.raw, envelope.room)
+
+    # message type -> (handler, whether the message must name a room)
+    HANDLERS = {
+        "join_room": (_on_join_room, True),
+        "leave_room": (_on_leave_room, True),
+        "location_update": (_on_location_update, True),
+        "assistance_status": (_on_room_relay, True),
+        "chat_message": (_on_room_relay, True),
+        "resolve": (_on_resolve, False),
+        "pong": (_on_pong, False),
+        "subscribe_jobs": (_on_subscribe_jobs, False),
+        "unsubscribe_jobs": (_on_unsubscribe_jobs, False),
+    }
+
     async def handle_message(self, client_id: str, message: str):
         try:
-            data = json.loads(message)
-            message_type = data.get("type")
-            
-            if message_type == "join_room":
-                room = data.get("room")
-                if room:
-                    await self.join_room(client_id, room)
-            
-            elif message_type == "leave_room":
-                room = data.get("room")
-                if room:
-                    await self.leave_room(client_id, room)
-            
-            elif message_type == "location_update":
-                room = data.get("room")
-                if room:
-                    await self.send_to_room(message, room)
-            
-            elif message_type == "assistance_status":
-                room = data.get("room")
-                if room:
-                    await self.send_to_room(message, room)
-            
-            elif message_type == "chat_message":
-                room = data.get("room")
-                if room:
-                    await self.send_to_room(message, room)
-            
-            else:
+            envelope = decode_envelope(message)
+            entry = self.HANDLERS.get(envelope.type)
+            if entry is None:
                 # Echo back unknown message types
-                await self.send_personal_message(message, client_id)
-                
-        except json.JSONDecodeError:
-            await self.send_personal_message("Invalid JSON format", client_id)
+                self.enqueue(client_id, message)
+                return
+            handler, needs_room = entry
+            if needs_room and not envelope.room:
+                raise EnvelopeError(f"'{envelope.type}' requires a room")
+            if envelope.room and envelope.room.startswith(PROVIDER_ROOM_PREFIX):
+                raise EnvelopeError(f"Room '{envelope.room}' is reserved")
+            await handler(self, client_id, envelope)
+        except EnvelopeError as e:
+            self.enqueue(client_id, error_message(str(e)))
         except Exception as e:
             print(f"Error handling message from {client_id}: {e}")
-            await self.send_personal_message("Error processing message", client_id)
+            self.enqueue(client_id, error_message("Error processing message"))
 
 # Global WebSocket manager instance
 websocket_manager = ConnectionManager()
@@ -0,0 +1,142 @@
+from typing import Dict, NamedTuple, Optional
+import struct
+import time
+
+# Clients opt into binary location frames by requesting this WebSocket
+# subprotocol; everything else stays JSON text
+BINARY_SUBPROTOCOL = "vbams.location.v1"
+
+# Little-endian, 26 bytes:
+#   kind u8, flags u8, sender_id u32, room_id u32,
+#   latitude i32 (1e-7 deg), longitude i32 (1e-7 deg), timestamp u32 (unix s),
+#   heading u16 (0.01 deg), speed u16 (0.01 m/s)
+LOCATION_FRAME = struct.Struct("<BBIIiiIHH")
+FRAME_LOCATION = 1
+FLAG_HEADING = 0x01
+FLAG_SPEED = 0x02
+
+COORDINATE_SCALE = 10_000_000
+HEADING_SCALE = 100
+SPEED_SCALE = 100
+MAX_SPEED = 0xFFFF / SPEED_SCALE
+MAX_TIMESTAMP = 0xFFFFFFFF
+# Larger timestamps are taken to be in milliseconds (a JS Date.now());
+# in seconds this is the year 5138
+MS_TIMESTAMP_THRESHOLD = 100_000_000_000
+
+
+class FrameError(ValueError):
+    """Raised for binary frames that cannot be decoded."""
+
+
+def normalize_timestamp(timestamp) -> int:
+    """Unix seconds for a frame, from seconds or milliseconds."""
+    if timestamp is None:
+        return int(time.time())
+    if isinstance(timestamp, bool):
+        raise FrameError("Timestamp out of range")
+    try:
+        value = float(timestamp)
+    except (TypeError, ValueError):
+        raise FrameError("Timestamp is not a number")
+    if value >= MS_TIMESTAMP_THRESHOLD:
+        value /= 1000.0
+    if not 0 <= value <= MAX_TIMESTAMP:
+        # Also rejects NaN
+        raise FrameError("Timestamp out of range")
+    return int(value)
+
+
+class LocationFrame(NamedTuple):
+    sender_id: int
+    room_id: int
+    latitude: float
+    longitude: float
+    timestamp: int
+    heading: Optional[float]
+    speed: Optional[float]
+
+
+def encode_location(sender_id: int, room_id: int, latitude: float, longitude: float,
+                    timestamp: Optional[int] = None, heading: Optional[float] = None,
+                    speed: Optional[float] = None) -> bytes:
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        raise FrameError("Coordinates out of range")
+    flags = 0
+    heading_value = speed_value = 0
+    if heading is not None:
+        flags |= FLAG_HEADING
+        heading_value = round((heading % 360.0) * HEADING_SCALE) % (360 * HEADING_SCALE)
+    if speed is not None:
+        if not 0.0 <= speed <= MAX_SPEED:
+            raise FrameError("Speed out of range")
+        flags |= FLAG_SPEED
+        speed_value = round(speed * SPEED_SCALE)
+    try:
+        return LOCATION_FRAME.pack(
+            FRAME_LOCATION,
+            flags,
+            sender_id,
+            room_id,
+            round(latitude * COORDINATE_SCALE),
+            round(longitude * COORDINATE_SCALE),
+            normalize_timestamp(timestamp),
+            heading_value,
+            speed_value,
+        )
+    except struct.error as e:
+        raise FrameError(str(e))
+
+
+def decode_location(frame: bytes) -> LocationFrame:
+    if len(frame) != LOCATION_FRAME.size:
+        raise FrameError(f"Location frames are {LOCATION_FRAME.size} bytes")
+    kind, flags, sender_id, room_id, lat, lon, timestamp, heading, speed = LOCATION_FRAME.unpack(frame)
+    if kind != FRAME_LOCATION:
+        raise FrameError(f"Unknown frame kind {kind}")
+    latitude = lat / COORDINATE_SCALE
+    longitude = lon / COORDINATE_SCALE
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        raise FrameError("Coordinates out of range")
+    return LocationFrame(
+        sender_id,
+        room_id,
+        latitude,
+        longitude,
+        timestamp,
+        heading / HEADING_SCALE if flags & FLAG_HEADING else None,
+        speed / SPEED_SCALE if flags & FLAG_SPEED else None,
+    )
+
+
+class IdRegistry:
+    """Assigns compact numeric ids to room names and client ids.
+
+    Ids are local to the process and never reused, so a released name that
+    comes back gets a new id.
+    """
+
+    def __init__(self):
+        self._ids: Dict[str, int] = {}
+        self._names: Dict[int, str] = {}
+        self._next = 1
+
+    def __len__(self):
+        return len(self._ids)
+
+    def id_for(self, name: str) -> int:
+        value = self._ids.get(name)
+        if value is None:
+            value = self._next
+            self._next += 1
+            self._ids[name] = value
+            self._names[value] = name
+        return value
+
+    def name_for(self, value: int) -> Optional[str]:
+        return self._names.get(value)
+
+    def release(self, name: str):
+        value = self._ids.pop(name, None)
+        if value is not None:
+            del self._names[value]
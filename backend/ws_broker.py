@@ -0,0 +1,227 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Hashable, Optional
+import asyncio
+import os
+import uuid
+
+from ws_protocol import dumps, loads
+
+# Room messages published by one worker are delivered to the members
+# connected to every worker through the configured broker
+WS_BROKER = os.getenv("WS_BROKER", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+WS_REDIS_CHANNEL_PREFIX = os.getenv("WS_REDIS_CHANNEL_PREFIX", "vbams:ws:room:")
+# Messages waiting to be published to Redis; more are dropped (and counted)
+# while Redis is slow or down rather than held in memory without bound
+WS_REDIS_QUEUE_SIZE = int(os.getenv("WS_REDIS_QUEUE_SIZE", "10000"))
+
+# deliver(room, message, key, binary) fans a message out to local room members
+Deliver = Callable[[str, str, Optional[Hashable], Optional[bytes]], None]
+
+
+class Broker(ABC):
+    """Carries room messages between the processes serving WebSockets.
+
+    The ConnectionManager binds a local delivery callback, publishes every room
+    message through the broker and reports when a room gains its first or
+    loses its last local member, so brokers can limit what they subscribe to.
+    Backends must implement publishing and (un)subscribing.
+    """
+
+    name = "base"
+
+    def __init__(self):
+        self._deliver: Optional[Deliver] = None
+
+    def bind(self, deliver: Deliver):
+        self._deliver = deliver
+
+    @abstractmethod
+    def publish(self, room: str, message: str, key: Optional[Hashable] = None, binary: Optional[bytes] = None):
+        """Deliver a room message to its members on every worker."""
+
+    @abstractmethod
+    def room_added(self, room: str):
+        """Start receiving a room's messages from other workers."""
+
+    @abstractmethod
+    def room_removed(self, room: str):
+        """Stop receiving a room's messages from other workers."""
+
+    async def close(self):
+        pass
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+
+class InMemoryBroker(Broker):
+    """Single-process broker: publishing is local delivery."""
+
+    name = "memory"
+
+    def publish(self, room: str, message: str, key: Optional[Hashable] = None, binary: Optional[bytes] = None):
+        self._deliver(room, message, key, binary)
+
+    def room_added(self, room: str):
+        pass  # Every message is already local
+
+    def room_removed(self, room: str):
+        pass
+
+
+class RedisBroker(Broker):
+    """Redis pub/sub broker with one channel per room.
+
+    Messages are delivered to local members immediately and published for the
+    other workers, which ignore their own messages when they come back. A
+    worker only subscribes to rooms it has local members in. Publishing and
+    (un)subscribing are queued and applied in order by background tasks, so
+    callers never wait on Redis. At most `queue_size` messages wait to be
+    published. The background tasks are restarted if they fail.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = REDIS_URL, client=None, channel_prefix: str = WS_REDIS_CHANNEL_PREFIX,
+                 queue_size: int = WS_REDIS_QUEUE_SIZE):
+        super().__init__()
+        if client is None:
+            import redis.asyncio as redis  # Only needed when this broker is selected
+            client = redis.from_url(url)
+        self.client = client
+        self.channel_prefix = channel_prefix
+        self.queue_size = queue_size
+        self.origin = uuid.uuid4().hex
+        self.published = 0
+        self.received = 0
+        self.errors = 0
+        self.dropped = 0
+        self.restarts = 0
+        self._pubsub = client.pubsub()
+        self._commands: Optional[asyncio.Queue] = None
+        # (Un)subscribing is kept apart so it is never dropped with publishes
+        self._subscriptions: Optional[asyncio.Queue] = None
+        self._tasks = []
+
+    def _channel(self, room: str) -> str:
+        return self.channel_prefix + room
+
+    def _ensure_started(self):
+        if self._commands is None:
+            self._commands = asyncio.Queue(maxsize=self.queue_size)
+            self._subscriptions = asyncio.Queue()
+            self._tasks = [
+                asyncio.create_task(self._supervise("publish", self._run_commands, self._commands)),
+                asyncio.create_task(self._supervise("subscribe", self._run_commands, self._subscriptions)),
+                asyncio.create_task(self._supervise("listen", self._listen)),
+            ]
+
+    def publish(self, room: str, message: str, key: Optional[Hashable] = None, binary: Optional[bytes] = None):
+        # Binary frames use process-local ids, so only the text is published
+        # and other workers encode their own frames from it
+        self._deliver(room, message, key, binary)
+        payload = dumps({
+            "origin": self.origin,
+            "room": room,
+            "message": message,
+            "key": list(key) if isinstance(key, tuple) else key,
+        })
+        self._ensure_started()
+        try:
+            self._commands.put_nowait(("publish", self._channel(room), payload))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                print(f"Redis broker queue full, {self.dropped} message(s) dropped")
+
+    def room_added(self, room: str):
+        self._ensure_started()
+        self._subscriptions.put_nowait(("subscribe", self._channel(room), None))
+
+    def room_removed(self, room: str):
+        self._ensure_started()
+        self._subscriptions.put_nowait(("unsubscribe", self._channel(room), None))
+
+    async def _supervise(self, name: str, run, *args):
+        """Run a background loop, restarting it if it fails."""
+        while True:
+            try:
+                await run(*args)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                self.restarts += 1
+                print(f"Redis broker {name} task failed, restarting: {e}")
+                await asyncio.sleep(1.0)
+
+    async def _run_commands(self, queue: asyncio.Queue):
+        while True:
+            command, channel, payload = await queue.get()
+            try:
+                if command == "publish":
+                    await self.client.publish(channel, payload)
+                    self.published += 1
+                elif command == "subscribe":
+                    await self._pubsub.subscribe(channel)
+                else:
+                    await self._pubsub.unsubscribe(channel)
+            except Exception as e:
+                self.errors += 1
+                print(f"Redis broker {command} on {channel} failed: {e}")
+
+    async def _listen(self):
+        while True:
+            if not self._pubsub.subscribed:
+                await asyncio.sleep(0.05)
+                continue
+            try:
+                item = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except Exception as e:
+                self.errors += 1
+                print(f"Redis broker listen failed: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if item is None:
+                continue
+            try:
+                payload = loads(item["data"])
+                if payload["origin"] == self.origin:
+                    continue
+                key = payload["key"]
+                self._deliver(payload["room"], payload["message"], tuple(key) if isinstance(key, list) else key, None)
+                self.received += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Redis broker dropped a message from {item.get('channel')}: {e}")
+                continue
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._commands = None
+        self._subscriptions = None
+        await self._pubsub.aclose()
+        await self.client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "published": self.published,
+            "received": self.received,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "restarts": self.restarts,
+            "pending_commands": self._commands.qsize() if self._commands else 0,
+        }
+
+
+def create_broker(name: str = WS_BROKER) -> Broker:
+    if name == "memory":
+        return InMemoryBroker()
+    if name == "redis":
+        return RedisBroker()
+    raise ValueError(f"Unknown WS_BROKER '{name}' (expected 'memory' or 'redis')")
@@ -0,0 +1,63 @@
+from typing import Any, Callable, NamedTuple, Optional
+import json
+import os
+
+# JSON codec for WebSocket frames. orjson is used when it is installed (it is
+# an optional accelerator, not a requirement); WS_JSON=stdlib forces the
+# standard library.
+WS_JSON = os.getenv("WS_JSON", "auto")
+
+
+def _stdlib_dumps(obj: Any) -> str:
+    return json.dumps(obj, separators=(",", ":"))
+
+
+CODECS = {"stdlib": (json.loads, _stdlib_dumps)}
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+else:
+    CODECS["orjson"] = (orjson.loads, lambda obj: orjson.dumps(obj).decode())
+
+CODEC = "orjson" if WS_JSON == "auto" and "orjson" in CODECS else "stdlib"
+loads: Callable[[str], Any]
+dumps: Callable[[Any], str]
+loads, dumps = CODECS[CODEC]
+
+
+class EnvelopeError(ValueError):
+    """Raised for frames that are not a valid message envelope."""
+
+
+class Envelope(NamedTuple):
+    """A decoded inbound frame.
+
+    `raw` is the frame exactly as received, so relayed messages are forwarded
+    without being encoded again.
+    """
+    type: str
+    room: Optional[str]
+    data: dict
+    raw: str
+
+
+def decode_envelope(raw: str, loads: Callable[[str], Any] = loads) -> Envelope:
+    try:
+        data = loads(raw)
+    except ValueError:
+        raise EnvelopeError("Invalid JSON format")
+    if not isinstance(data, dict):
+        raise EnvelopeError("Message must be a JSON object")
+    message_type = data.get("type")
+    if not isinstance(message_type, str) or not message_type:
+        raise EnvelopeError("Message type is required")
+    room = data.get("room")
+    if room is not None and not isinstance(room, str):
+        raise EnvelopeError("Room must be a string")
+    return Envelope(message_type, room or None, data, raw)
+
+
+def error_message(detail: str) -> str:
+    return dumps({"type": "error", "detail": detail})
@@ -4,6 +4,8 @@
 -- ================================================================
 
 -- Drop existing tables (in reverse order of dependencies)
+DROP TABLE IF EXISTS vehicle_telemetry_rollups CASCADE;
+DROP TABLE IF EXISTS vehicle_telemetry CASCADE;
 DROP TABLE IF EXISTS assistance_requests CASCADE;
 DROP TABLE IF EXISTS breakdowns CASCADE;
 DROP TABLE IF EXISTS service_providers CASCADE;
@@ -32,7 +34,8 @@ CREATE TABLE users (
     -- Indexes
     INDEX idx_users_email (email),
     INDEX idx_users_role (role),
-    INDEX idx_users_created_at (created_at)
+    INDEX idx_users_created_at (created_at),
+    INDEX ix_users_created_id (created_at, id)
 );
 
 -- ================================================================
@@ -56,6 +59,9 @@ CREATE TABLE vehicles (
     insurance_policy_number VARCHAR(50),
     insurance_expiry_date TIMESTAMP WITH TIME ZONE,
     iot_device_id VARCHAR(50) UNIQUE,
+    latitude DECIMAL(10, 8),
+    longitude DECIMAL(11, 8),
+    last_location_update TIMESTAMP WITH TIME ZONE,
     is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
@@ -67,7 +73,8 @@ CREATE TABLE vehicles (
     INDEX idx_vehicles_owner_id (owner_id),
     INDEX idx_vehicles_license_plate (license_plate),
     INDEX idx_vehicles_vin (vin),
-    INDEX idx_vehicles_created_at (created_at)
+    INDEX idx_vehicles_created_at (created_at),
+    INDEX ix_vehicles_owner_created_id (owner_id, created_at, id)
 );
 
 -- ================================================================
@@ -79,6 +86,7 @@ CREATE TABLE service_providers (
     business_name VARCHAR(100) NOT NULL,
     business_license VARCHAR(50) NOT NULL UNIQUE,
     services TEXT,  -- JSON string of service types
+    services_mask INTEGER NOT NULL DEFAULT 0,  -- bitmask of service types (see models.SERVICE_TYPE_BITS)
     service_radius INTEGER DEFAULT 50,  -- kilometers
     latitude DECIMAL(10, 8) NOT NULL,
     longitude DECIMAL(11, 8) NOT NULL,
@@ -103,7 +111,8 @@ CREATE TABLE service_providers (
     INDEX idx_service_providers_user_id (user_id),
     INDEX idx_service_providers_location (latitude, longitude),
     INDEX idx_service_providers_is_online (is_online),
-    INDEX idx_service_providers_created_at (created_at)
+    INDEX idx_service_providers_created_at (created_at),
+    INDEX ix_service_providers_created_id (created_at, id)
 );
 
 -- ================================================================
@@ -147,7 +156,8 @@ CREATE TABLE breakdowns (
     INDEX idx_breakdowns_driver_id (driver_id),
     INDEX idx_breakdowns_status (status),
     INDEX idx_breakdowns_location (latitude, longitude),
-    INDEX idx_breakdowns_created_at (created_at)
+    INDEX idx_breakdowns_created_at (created_at),
+    INDEX ix_breakdowns_driver_created_id (driver_id, created_at, id)
 );
 
 -- ================================================================
@@ -179,6 +189,7 @@ CREATE TABLE assistance_requests (
     payment_method VARCHAR(20) CHECK (payment_method IN ('cash', 'credit_card', 'debit_card', 'mobile_payment')),
     rating INTEGER CHECK (rating >= 1 AND rating <= 5),
     feedback TEXT,
+    offer_expires_at TIMESTAMP WITH TIME ZONE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
     
@@ -192,7 +203,56 @@ CREATE TABLE assistance_requests (
     INDEX idx_assistance_requests_requester_id (requester_id),
     INDEX idx_assistance_requests_status (status),
     INDEX idx_assistance_requests_location (latitude, longitude),
-    INDEX idx_assistance_requests_created_at (created_at)
+    INDEX idx_assistance_requests_created_at (created_at),
+    INDEX ix_assistance_requests_created_id (created_at, id),
+    INDEX ix_assistance_requests_requester_created_id (requester_id, created_at, id),
+    INDEX ix_assistance_requests_provider_created_id (assigned_provider_id, created_at, id),
+    INDEX ix_assistance_requests_updated_at (updated_at),
+    INDEX ix_assistance_requests_offer_expires_at (offer_expires_at)
+);
+
+-- ================================================================
+-- VEHICLE TELEMETRY TABLES
+-- ================================================================
+-- Raw IoT readings, append-only; ts is epoch milliseconds
+CREATE TABLE vehicle_telemetry (
+    id BIGSERIAL PRIMARY KEY,
+    vehicle_id INTEGER NOT NULL,
+    ts BIGINT NOT NULL,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    speed DOUBLE PRECISION,
+    battery_voltage DOUBLE PRECISION,
+    engine_codes VARCHAR(255),
+    
+    -- Foreign Keys
+    FOREIGN KEY (vehicle_id) REFERENCES vehicles(id) ON DELETE CASCADE,
+    
+    -- Indexes
+    INDEX ix_vehicle_telemetry_vehicle_ts (vehicle_id, ts),
+    INDEX ix_vehicle_telemetry_ts (ts)
+);
+
+-- Readings past the raw retention window, downsampled per time bucket
+CREATE TABLE vehicle_telemetry_rollups (
+    id BIGSERIAL PRIMARY KEY,
+    vehicle_id INTEGER NOT NULL,
+    bucket_ts BIGINT NOT NULL,
+    bucket_seconds INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    avg_speed DOUBLE PRECISION,
+    max_speed DOUBLE PRECISION,
+    min_battery_voltage DOUBLE PRECISION,
+    avg_battery_voltage DOUBLE PRECISION,
+    fault_samples INTEGER DEFAULT 0,
+    
+    -- Foreign Keys
+    FOREIGN KEY (vehicle_id) REFERENCES vehicles(id) ON DELETE CASCADE,
+    
+    -- Indexes
+    INDEX ix_vehicle_telemetry_rollups_vehicle_bucket (vehicle_id, bucket_ts)
 );
 
 -- ================================================================
@@ -215,9 +275,9 @@ INSERT INTO vehicles (owner_id, make, model, year, license_plate, vin, color, ve
 (4, 'Tesla', 'Model 3', 2022, 'EV2022', '4HGBH41JXMN109189', 'White', 'car', 'electric', 15000);
 
 -- Insert sample service providers
-INSERT INTO service_providers (user_id, business_name, business_license, services, service_radius, latitude, longitude, base_rate, per_km_rate, hourly_rate, is_verified, is_online) VALUES
-(2, 'Quick Fix Auto Services', 'BL-2024-001', '["towing", "repair", "jump_start", "tire_change"]', 50, 14.5995, 120.9842, 50.00, 2.50, 75.00, TRUE, TRUE),
-(5, 'Road Rescue Inc.', 'BL-2024-002', '["towing", "fuel_delivery", "lockout", "diagnostic"]', 75, 14.6091, 121.0223, 75.00, 3.00, 100.00, TRUE, FALSE);
+INSERT INTO service_providers (user_id, business_name, business_license, services, services_mask, service_radius, latitude, longitude, base_rate, per_km_rate, hourly_rate, is_verified, is_online) VALUES
+(2, 'Quick Fix Auto Services', 'BL-2024-001', '["towing", "repair", "jump_start", "tire_change"]', 27, 50, 14.5995, 120.9842, 50.00, 2.50, 75.00, TRUE, TRUE),
+(5, 'Road Rescue Inc.', 'BL-2024-002', '["towing", "fuel_delivery", "lockout", "diagnostic"]', 101, 75, 14.6091, 121.0223, 75.00, 3.00, 100.00, TRUE, FALSE);
 
 -- Insert sample breakdowns
 INSERT INTO breakdowns (vehicle_id, driver_id, latitude, longitude, address, city, state, country, description, category, severity, status) VALUES
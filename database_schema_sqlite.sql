@@ -4,6 +4,8 @@
 -- ================================================================
 
 -- Drop existing tables (in reverse order of dependencies)
+DROP TABLE IF EXISTS vehicle_telemetry_rollups;
+DROP TABLE IF EXISTS vehicle_telemetry;
 DROP TABLE IF EXISTS assistance_requests;
 DROP TABLE IF EXISTS breakdowns;
 DROP TABLE IF EXISTS service_providers;
@@ -33,6 +35,7 @@ CREATE TABLE users (
 CREATE INDEX idx_users_email ON users(email);
 CREATE INDEX idx_users_role ON users(role);
 CREATE INDEX idx_users_created_at ON users(created_at);
+CREATE INDEX ix_users_created_id ON users(created_at, id);
 
 -- ================================================================
 -- VEHICLES TABLE
@@ -55,6 +58,9 @@ CREATE TABLE vehicles (
     insurance_policy_number VARCHAR(50),
     insurance_expiry_date DATETIME,
     iot_device_id VARCHAR(50) UNIQUE,
+    latitude REAL,
+    longitude REAL,
+    last_location_update DATETIME,
     is_active BOOLEAN DEFAULT 1,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
@@ -66,6 +72,7 @@ CREATE INDEX idx_vehicles_owner_id ON vehicles(owner_id);
 CREATE INDEX idx_vehicles_license_plate ON vehicles(license_plate);
 CREATE INDEX idx_vehicles_vin ON vehicles(vin);
 CREATE INDEX idx_vehicles_created_at ON vehicles(created_at);
+CREATE INDEX ix_vehicles_owner_created_id ON vehicles(owner_id, created_at, id);
 
 -- ================================================================
 -- SERVICE PROVIDERS TABLE
@@ -76,6 +83,7 @@ CREATE TABLE service_providers (
     business_name VARCHAR(100) NOT NULL,
     business_license VARCHAR(50) NOT NULL UNIQUE,
     services TEXT,
+    services_mask INTEGER NOT NULL DEFAULT 0,
     service_radius INTEGER DEFAULT 50,
     latitude REAL NOT NULL,
     longitude REAL NOT NULL,
@@ -101,6 +109,7 @@ CREATE INDEX idx_service_providers_latitude ON service_providers(latitude);
 CREATE INDEX idx_service_providers_longitude ON service_providers(longitude);
 CREATE INDEX idx_service_providers_is_online ON service_providers(is_online);
 CREATE INDEX idx_service_providers_created_at ON service_providers(created_at);
+CREATE INDEX ix_service_providers_created_id ON service_providers(created_at, id);
 
 -- ================================================================
 -- BREAKDOWNS TABLE
@@ -144,6 +153,7 @@ CREATE INDEX idx_breakdowns_status ON breakdowns(status);
 CREATE INDEX idx_breakdowns_latitude ON breakdowns(latitude);
 CREATE INDEX idx_breakdowns_longitude ON breakdowns(longitude);
 CREATE INDEX idx_breakdowns_created_at ON breakdowns(created_at);
+CREATE INDEX ix_breakdowns_driver_created_id ON breakdowns(driver_id, created_at, id);
 
 -- ================================================================
 -- ASSISTANCE REQUESTS TABLE
@@ -174,6 +184,7 @@ CREATE TABLE assistance_requests (
     payment_method VARCHAR(20) CHECK (payment_method IN ('cash', 'credit_card', 'debit_card', 'mobile_payment')),
     rating INTEGER CHECK (rating >= 1 AND rating <= 5),
     feedback TEXT,
+    offer_expires_at DATETIME,
     created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     updated_at DATETIME DEFAULT CURRENT_TIMESTAMP,
     
@@ -188,6 +199,49 @@ CREATE INDEX idx_assistance_requests_status ON assistance_requests(status);
 CREATE INDEX idx_assistance_requests_latitude ON assistance_requests(latitude);
 CREATE INDEX idx_assistance_requests_longitude ON assistance_requests(longitude);
 CREATE INDEX idx_assistance_requests_created_at ON assistance_requests(created_at);
+CREATE INDEX ix_assistance_requests_created_id ON assistance_requests(created_at, id);
+CREATE INDEX ix_assistance_requests_requester_created_id ON assistance_requests(requester_id, created_at, id);
+CREATE INDEX ix_assistance_requests_provider_created_id ON assistance_requests(assigned_provider_id, created_at, id);
+CREATE INDEX ix_assistance_requests_updated_at ON assistance_requests(updated_at);
+CREATE INDEX ix_assistance_requests_offer_expires_at ON assistance_requests(offer_expires_at);
+
+-- ================================================================
+-- VEHICLE TELEMETRY TABLES
+-- ================================================================
+-- Raw IoT readings, append-only; ts is epoch milliseconds
+CREATE TABLE vehicle_telemetry (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vehicle_id INTEGER NOT NULL,
+    ts INTEGER NOT NULL,
+    latitude REAL,
+    longitude REAL,
+    speed REAL,
+    battery_voltage REAL,
+    engine_codes VARCHAR(255),
+    FOREIGN KEY (vehicle_id) REFERENCES vehicles(id) ON DELETE CASCADE
+);
+
+CREATE INDEX ix_vehicle_telemetry_vehicle_ts ON vehicle_telemetry(vehicle_id, ts);
+CREATE INDEX ix_vehicle_telemetry_ts ON vehicle_telemetry(ts);
+
+-- Readings past the raw retention window, downsampled per time bucket
+CREATE TABLE vehicle_telemetry_rollups (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    vehicle_id INTEGER NOT NULL,
+    bucket_ts INTEGER NOT NULL,
+    bucket_seconds INTEGER NOT NULL,
+    samples INTEGER NOT NULL,
+    latitude REAL,
+    longitude REAL,
+    avg_speed REAL,
+    max_speed REAL,
+    min_battery_voltage REAL,
+    avg_battery_voltage REAL,
+    fault_samples INTEGER DEFAULT 0,
+    FOREIGN KEY (vehicle_id) REFERENCES vehicles(id) ON DELETE CASCADE
+);
+
+CREATE INDEX ix_vehicle_telemetry_rollups_vehicle_bucket ON vehicle_telemetry_rollups(vehicle_id, bucket_ts);
 
 -- ================================================================
 -- SAMPLE DATA INSERT
@@ -209,9 +263,9 @@ INSERT INTO vehicles (owner_id, make, model, year, license_plate, vin, color, ve
 (4, 'Tesla', 'Model 3', 2022, 'EV2022', '4HGBH41JXMN109189', 'White', 'car', 'electric', 15000);
 
 -- Insert sample service providers
-INSERT INTO service_providers (user_id, business_name, business_license, services, service_radius, latitude, longitude, base_rate, per_km_rate, hourly_rate, is_verified, is_online) VALUES
-(2, 'Quick Fix Auto Services', 'BL-2024-001', '["towing", "repair", "jump_start", "tire_change"]', 50, 14.5995, 120.9842, 50.00, 2.50, 75.00, 1, 1),
-(5, 'Road Rescue Inc.', 'BL-2024-002', '["towing", "fuel_delivery", "lockout", "diagnostic"]', 75, 14.6091, 121.0223, 75.00, 3.00, 100.00, 1, 0);
+INSERT INTO service_providers (user_id, business_name, business_license, services, services_mask, service_radius, latitude, longitude, base_rate, per_km_rate, hourly_rate, is_verified, is_online) VALUES
+(2, 'Quick Fix Auto Services', 'BL-2024-001', '["towing", "repair", "jump_start", "tire_change"]', 27, 50, 14.5995, 120.9842, 50.00, 2.50, 75.00, 1, 1),
+(5, 'Road Rescue Inc.', 'BL-2024-002', '["towing", "fuel_delivery", "lockout", "diagnostic"]', 101, 75, 14.6091, 121.0223, 75.00, 3.00, 100.00, 1, 0);
 
 -- Insert sample breakdowns
 INSERT INTO breakdowns (vehicle_id, driver_id, latitude, longitude, address, city, state, country, description, category, severity, status) VALUES